@@ -1,45 +1,141 @@
 import streamlit as st
+import asyncio
+import atexit
+import concurrent.futures
+import queue
+import threading
 import os
-from openai import OpenAI
+import re
+from openai import OpenAI, AsyncOpenAI
 from pymongo import MongoClient
 import json
 from bson import ObjectId
-import requests
 import time
 import pandas as pd
+import openpyxl
 import validators
+from normalizers import normalize_date, normalize_quantity, record_fast_path, fast_path_stats
+from reference_cache import reference_cache, MISS
+from submission import submit_in_batches
+import graphql_client
+import llm_cache
+import intent_router
+import jobs
+from metrics import metrics, mongo_listener, current_tenant
+
+# Function to add a completion's prompt and completion tokens to the metrics
+def record_token_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        metrics.add_tokens("openai.chat", usage.prompt_tokens, usage.completion_tokens)
+
+# Function to send a single-message chat completion, answering from the
+# persistent LLM cache when the same request was made before
+def create_completion(prompt, client_instance, model, **params):
+    def call():
+        messages = [{"role": "user", "content": prompt}]
+        with metrics.timed("openai.chat"):
+            response = client_instance.chat.completions.create(
+            model=model,
+            messages=messages,
+            **params
+            )
+        record_token_usage(response)
+        return response.choices[0].message.content
+
+    return llm_cache.get_cache().cached(model, params, prompt, call)
+
+# Same as create_completion for an AsyncOpenAI client
+async def create_completion_async(prompt, async_client, model, **params):
+    async def call():
+        messages = [{"role": "user", "content": prompt}]
+        with metrics.timed("openai.chat"):
+            response = await async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            **params
+            )
+        record_token_usage(response)
+        return response.choices[0].message.content
+
+    return await llm_cache.get_cache().cached_async(model, params, prompt, call)
 
 def get_completion(prompt, client_instance, model="gpt-4o"):
-    messages = [{"role": "user", "content": prompt}]
-    response = client_instance.chat.completions.create(
-    model=model,
-    messages=messages,
-    max_tokens=500,
-    temperature=0,
-    )
-    return response.choices[0].message.content
+    return create_completion(prompt, client_instance, model, max_tokens=500, temperature=0)
 
 def get_completion_json(prompt, client_instance, model="gpt-4o"):
-    messages = [{"role": "user", "content": prompt}]
-    response = client_instance.chat.completions.create(
-    model=model,
-    messages=messages,
-    max_tokens=300,
-    response_format={ "type": "json_object" },
-    temperature=1,
+    return create_completion(
+        prompt, client_instance, model,
+        max_tokens=300,
+        response_format={ "type": "json_object" },
+        temperature=1,
+    )
+
+def structured_params(schema_name, schema, max_tokens=800):
+    return {
+        "max_tokens": max_tokens,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": schema_name, "strict": True, "schema": schema}
+        },
+        "temperature": 0,
+    }
+
+def get_completion_structured(prompt, client_instance, schema_name, schema, model="gpt-4o"):
+    return create_completion(prompt, client_instance, model, **structured_params(schema_name, schema))
+
+async def get_completion_structured_async(prompt, async_client, schema_name, schema, model="gpt-4o", max_tokens=800):
+    return await create_completion_async(prompt, async_client, model, **structured_params(schema_name, schema, max_tokens))
+
+# Clients are process-wide resources shared by every session and rerun, so the
+# connection pools are created once and closed when the server exits
+@st.cache_resource
+def get_openai_client(api_key, timeout=60, max_retries=2):
+    client = OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+    atexit.register(client.close)
+    return client
+
+# The async client's pooled connections belong to the event loop that opened
+# them, so it is shared together with one long-lived loop on a background thread
+# that runs every async LLM batch, instead of a fresh asyncio.run loop per batch
+@st.cache_resource
+def get_async_openai_client(api_key, base_url, _client):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+    async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=_client.timeout, max_retries=_client.max_retries)
+    return loop, async_client
+
+@st.cache_resource
+def get_mongo_client(mongo_url, max_pool_size=50, min_pool_size=0, connect_timeout_ms=5000,
+                     server_selection_timeout_ms=10000, socket_timeout_ms=30000, max_idle_time_ms=300000):
+    client = MongoClient(
+        mongo_url,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min_pool_size,
+        connectTimeoutMS=connect_timeout_ms,
+        serverSelectionTimeoutMS=server_selection_timeout_ms,
+        socketTimeoutMS=socket_timeout_ms,
+        maxIdleTimeMS=max_idle_time_ms,
+        event_listeners=[mongo_listener],
     )
-    return response.choices[0].message.content
+    atexit.register(client.close)
+    return client
 
 # Function to connect to database
-def database_connection(mongo_url):
-    uat = MongoClient(mongo_url)
+def database_connection(mongo_url, **pool_options):
+    uat = get_mongo_client(mongo_url, **pool_options)
     database = uat["platform-uat"]
     return database
 
 def check_tenant_name(tenant_name, database):
-    result = database.tenants.find_one({"name": tenant_name, "subdomain": "uat"}, {"_id": 1})
-    if result:
-        return str(result['_id'])
+    # Tenant lookups aren't tenant-scoped, so they are cached under tenant None
+    def load_tenant():
+        result = database.tenants.find_one({"name": tenant_name, "subdomain": "uat"}, {"_id": 1})
+        return str(result['_id']) if result else None
+
+    tenant_id = reference_cache.get_or_load(None, "tenant", tenant_name, load_tenant)
+    if tenant_id:
+        return tenant_id
     return "Tenant name not valid"
 
 def display_greeting(database):
@@ -77,137 +173,707 @@ def display_greeting(database):
     return st.session_state.get('tenant_id'), st.session_state.get('tenant_name')
 
 
-# Function to check for missing mandatory fields using OpenAI
-def check_mandatory_fields(user_input, client):
-    mandatory_fields = [
-        "Warehouse Name/Code",
-        "Customer Name/Code",
-        "Product SKU",
-        "Quantity"
-    ]
-    mandatory_fields_str = ", ".join([f"'{field}'" for field in mandatory_fields])
+ORDER_MANDATORY_FIELDS = [
+    "Warehouse Name/Code",
+    "Customer Name/Code",
+    "Product SKU",
+    "Quantity"
+]
+ORDER_OPTIONAL_FIELDS = [
+    "Order Date",
+    "Order ID",
+    "Carrier",
+    "Form Factor",
+    "Insurance Required",
+    "Product Lot/Batch ID",
+    "Shipping Address (name)",
+    "Shipping Address (email)",
+    "Shipping Address (phone)",
+    "Shipping Address (line1)",
+    "Shipping Address (line2)",
+    "Shipping Address (city)",
+    "Shipping Address (state)",
+    "Shipping Address (country)",
+    "Shipping Address (zip)",
+    "Validate Address"
+]
+
+CONSIGNMENT_MANDATORY_FIELDS = [
+    "Warehouse Name/Code",
+    "Customer Name/Code",
+    "Product SKU",
+    "Quantity",
+    "Standard/Dropship"
+]
+CONSIGNMENT_OPTIONAL_FIELDS = [
+    "Consignment Date",
+    "Order ID",
+    "Consignment Number",
+    "Supplier/Vendor",
+    "Form Factor",
+    "Carrier",
+    "Tracking Number",
+    "Dropship Type",
+    "Dropship Data",
+]
+
+def strict_object_schema(properties):
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+DROPSHIP_ADDRESS_FIELDS = ["name", "email", "phone", "line1", "line2", "city", "state", "country", "zip"]
+DROPSHIP_DATA_FIELDS = ["Is Case", "Per Case Quantity", "Number of Cases", "Label Source", "Label URL", "Shipping Address"]
+
+# Fields extracted as structured values rather than a single string: the
+# consignment mutation takes a list of tracking numbers and a dropship data object
+STRUCTURED_FIELD_SCHEMAS = {
+    "Tracking Number": {"type": "array", "items": {"type": "string"}},
+    "Dropship Data": strict_object_schema({
+        field: strict_object_schema({name: {"type": "string"} for name in DROPSHIP_ADDRESS_FIELDS})
+        if field == "Shipping Address" else {"type": "string"}
+        for field in DROPSHIP_DATA_FIELDS
+    }),
+}
+
+# Function to build the JSON schema for a single-call field extraction
+def extraction_schema(mandatory_fields, optional_fields):
+    all_fields = mandatory_fields + optional_fields
+    return {
+        "type": "object",
+        "properties": {
+            "fields": {
+                "type": "object",
+                "properties": {field: STRUCTURED_FIELD_SCHEMAS.get(field, {"type": "string"}) for field in all_fields},
+                "required": all_fields,
+                "additionalProperties": False
+            },
+            "missing_mandatory_fields": {
+                "type": "array",
+                "items": {"type": "string", "enum": mandatory_fields}
+            }
+        },
+        "required": ["fields", "missing_mandatory_fields"],
+        "additionalProperties": False
+    }
 
+# Function to build the JSON schema for extracting several rows in one call.
+# Each extracted object carries the index of the row it came from.
+def packed_extraction_schema(mandatory_fields, optional_fields):
+    row_schema = extraction_schema(mandatory_fields, optional_fields)
+    row_schema["properties"] = dict(row_schema["properties"], row={"type": "integer"})
+    row_schema["required"] = ["row"] + row_schema["required"]
+    return {
+        "type": "object",
+        "properties": {"rows": {"type": "array", "items": row_schema}},
+        "required": ["rows"],
+        "additionalProperties": False
+    }
 
-    prompt = f"""
+# Function to check the model output against the schema and work out the missing fields
+def parse_extraction(response, mandatory_fields, optional_fields):
+    try:
+        response_dict = json.loads(response) if response else {}
+    except json.JSONDecodeError:
+        response_dict = {}
+    return parse_extracted_object(response_dict, mandatory_fields, optional_fields)
+
+# Strips strings and drops blank list items, keeping the shape of structured values
+def clean_extracted_value(value):
+    if isinstance(value, dict):
+        return {key: clean_extracted_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [item for item in (clean_extracted_value(item) for item in value) if item not in ("", [], {})]
+    return "" if value is None else str(value).strip()
+
+def parse_extracted_object(response_dict, mandatory_fields, optional_fields):
+    extracted = response_dict.get("fields") if isinstance(response_dict.get("fields"), dict) else {}
+    fields = {}
+    for field in mandatory_fields + optional_fields:
+        fields[field] = clean_extracted_value(extracted.get(field, ""))
+
+    flagged = response_dict.get("missing_mandatory_fields") or []
+    missing_fields = [field for field in mandatory_fields if not fields[field] or field in flagged]
+    return fields, missing_fields
+
+# Function to pick out the rows of a packed response, keyed by row index. Rows that
+# are missing, duplicated or malformed are left out so the caller can re-run them.
+def parse_packed_extraction(response, row_count, mandatory_fields, optional_fields):
+    try:
+        response_dict = json.loads(response) if response else {}
+    except json.JSONDecodeError:
+        return {}
+
+    items = response_dict.get("rows") if isinstance(response_dict, dict) else None
+    parsed = {}
+    duplicates = set()
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not isinstance(item.get("fields"), dict):
+            continue
+        row = item.get("row")
+        if not isinstance(row, int) or not 0 <= row < row_count:
+            continue
+        if row in parsed:
+            duplicates.add(row)
+        parsed[row] = parse_extracted_object(item, mandatory_fields, optional_fields)
+    for row in duplicates:
+        del parsed[row]
+    return parsed
+
+def extraction_prompt(user_input, mandatory_fields, optional_fields, extra_instructions=""):
+    return f"""
     The user's input is: "{user_input}"
-    The mandatory fields are: {mandatory_fields_str}.
+    The mandatory fields are: {mandatory_fields}.
+    The optional fields are: {optional_fields}.
 
-    Check if all the specified mandatory fields are present in the user's input. \
-    The name of the fields need not exactly match the user's input. Use your discretion to understand if the given fields and user's inputs match.\
-    If any of the specified mandatory fields are missing, return "Mandatory fields missing: " followed by the list of missing fields. \
-    If all specified mandatory fields are present, respond with "All mandatory fields are present".
-    Do not respond with anything other than either the missing fields list or "All mandatory fields are present".
+    Extract the value of every field from the user input into "fields", using the field names above as keys.
+    For example: if user writes warehouse 554, then "fields" should contain key as "Warehouse Name/Code" and value as "554".
+    The name of the fields need not exactly match the user's input. Use your discretion to understand which part of the user's input refers to which key.
+    {extra_instructions}
+    Leave the value blank for any field that is not input by the user.
+    List every mandatory field that is not present in the user's input in "missing_mandatory_fields".
     """
 
-    response = get_completion(prompt, client)
-    return response
-
-#Function to return json from user input
-def json_from_user_input_order(user_input, client):
-    mandatory_fields = [
-        "Warehouse Name/Code",
-        "Customer Name/Code",
-        "Product SKU",
-        "Quantity"
-    ]
-    optional_fields = [
-        "Order Date",
-        "Order ID",
-        "Carrier",
-        "Form Factor",
-        "Insurance Required",
-        "Product Lot/Batch ID",
-        "Shipping Address (name)",
-        "Shipping Address (email)",
-        "Shipping Address (phone)",
-        "Shipping Address (line1)",
-        "Shipping Address (line2)",
-        "Shipping Address (city)",
-        "Shipping Address (state)",
-        "Shipping Address (country)",
-        "Shipping Address (zip)",
-        "Validate Address"
-    ]
-
-    prompt = f"""
-    The user's input is: "{user_input}"
+def packed_extraction_prompt(user_inputs, mandatory_fields, optional_fields, extra_instructions=""):
+    rows = "\n".join(f"Row {row}: {json.dumps(user_input)}" for row, user_input in enumerate(user_inputs))
+    return f"""
+    The user's input is a list of {len(user_inputs)} rows, each one a separate record:
+    {rows}
     The mandatory fields are: {mandatory_fields}.
     The optional fields are: {optional_fields}.
 
-    Return a JSON object where keys are all the fields in {mandatory_fields} and {optional_fields}. Extract the respective values from the user input.
-    For example: if user writes warehouse 554, then the dictionary should contain key as "Warehouse Name/Code" and value as "554".
-    The name of the fields need not exactly match the user's input. Use your discretion to understand which part of the user's input refers to which key.
-    For insurance required or validate address the key should be 'yes', 'no' or left blank if not input by user.
-    For any optional field leave the value blank if it is not input by the user, but do not leave the keys blank.
+    Return one object in "rows" for every input row, with "row" set to the row number.
+    Extract the value of every field of that row only into its "fields", using the field names above as keys.
+    For example: if a row says warehouse 554, then its "fields" should contain key as "Warehouse Name/Code" and value as "554".
+    The name of the fields need not exactly match the user's input. Use your discretion to understand which part of the row refers to which key.
+    {extra_instructions}
+    Leave the value blank for any field that is not in the row.
+    List every mandatory field that is not present in the row in its "missing_mandatory_fields".
     """
 
-    response = get_completion_json(prompt, client)
-    response_dict = json.loads(response)  # Convert the JSON string to a Python dictionary
-    return response_dict
-
-#Function to return json from user input
-def json_from_user_input_consignment(user_input, client):
-    mandatory_fields = [
-        "Warehouse Name/Code",
-        "Customer Name/Code",
-        "Product SKU",
-        "Quantity",
-        "Standard/Dropship"
-    ]
-    optional_fields = [
-        "Consignment Date",
-        "Order ID",
-        "Consignment Number",
-        "Supplier/Vendor",
-        "Form Factor",
-        "Carrier",
-        "Tracking Number",
-        "Dropship Type",
-        "Dropship Data",
-    ]
-
+# Rough token count (about 4 characters per token) used to size packed requests
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+# Function to split texts into packs of at most max_rows that fit in token_budget
+# (prompt plus expected output). Returns lists of positions into texts.
+def pack_texts(texts, mandatory_fields, optional_fields, token_budget=6000, max_rows=10):
+    overhead = estimate_tokens(packed_extraction_prompt([], mandatory_fields, optional_fields))
+    empty_row = json.dumps({"row": 0, "fields": {field: "" for field in mandatory_fields + optional_fields}, "missing_mandatory_fields": []})
+
+    packs = []
+    current, used = [], overhead
+    for position, text in enumerate(texts):
+        # The row appears once in the prompt and roughly once more in the output
+        cost = 2 * estimate_tokens(text) + estimate_tokens(empty_row)
+        if current and (len(current) >= max_rows or used + cost > token_budget):
+            packs.append(current)
+            current, used = [], overhead
+        current.append(position)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+def packed_max_tokens(texts, mandatory_fields, optional_fields):
+    empty_row = json.dumps({"row": 0, "fields": {field: "" for field in mandatory_fields + optional_fields}, "missing_mandatory_fields": []})
+    return 200 + sum(estimate_tokens(text) + estimate_tokens(empty_row) for text in texts)
+
+# Function to extract field values and missing mandatory fields in one LLM call
+def extract_fields(user_input, client, mandatory_fields, optional_fields, extra_instructions=""):
+    prompt = extraction_prompt(user_input, mandatory_fields, optional_fields, extra_instructions)
+    response = get_completion_structured(prompt, client, "field_extraction", extraction_schema(mandatory_fields, optional_fields))
+    return parse_extraction(response, mandatory_fields, optional_fields)
+
+async def extract_fields_async(user_input, async_client, mandatory_fields, optional_fields, extra_instructions=""):
+    prompt = extraction_prompt(user_input, mandatory_fields, optional_fields, extra_instructions)
+    response = await get_completion_structured_async(prompt, async_client, "field_extraction", extraction_schema(mandatory_fields, optional_fields))
+    return parse_extraction(response, mandatory_fields, optional_fields)
+
+# Extracts several texts with one request; returns {index in texts: (fields, missing)}
+async def extract_packed_async(texts, async_client, mandatory_fields, optional_fields, extra_instructions=""):
+    prompt = packed_extraction_prompt(texts, mandatory_fields, optional_fields, extra_instructions)
+    response = await get_completion_structured_async(
+        prompt, async_client, "packed_field_extraction", packed_extraction_schema(mandatory_fields, optional_fields),
+        max_tokens=packed_max_tokens(texts, mandatory_fields, optional_fields)
+    )
+    return parse_packed_extraction(response, len(texts), mandatory_fields, optional_fields)
+
+ORDER_EXTRACTION_INSTRUCTIONS = "For insurance required or validate address the value should be 'yes', 'no' or left blank if not input by user."
+
+def extract_order_fields(user_input, client):
+    return extract_fields(user_input, client, ORDER_MANDATORY_FIELDS, ORDER_OPTIONAL_FIELDS, ORDER_EXTRACTION_INSTRUCTIONS)
+
+CONSIGNMENT_EXTRACTION_INSTRUCTIONS = (
+    "Put each tracking number in \"Tracking Number\" as a separate item. "
+    "Fill \"Dropship Data\" with the dropship details: \"Is Case\" should be 'yes' or 'no', "
+    "\"Label Source\" should be 'Public URL' or 'System Generated', and \"Shipping Address\" is the address the label is for."
+)
+
+def extract_consignment_fields(user_input, client):
+    return extract_fields(user_input, client, CONSIGNMENT_MANDATORY_FIELDS, CONSIGNMENT_OPTIONAL_FIELDS, CONSIGNMENT_EXTRACTION_INSTRUCTIONS)
+
+
+# Common CSV header spellings for each field, compared after normalize_header
+FIELD_ALIASES = {
+    "Warehouse Name/Code": ["warehouse", "warehouse name", "warehouse code", "warehouse id", "wh", "wh code", "facility"],
+    "Customer Name/Code": ["customer", "customer name", "customer code", "customer id", "client", "client code", "account"],
+    "Product SKU": ["sku", "product", "product code", "item", "item sku", "item code", "sku code"],
+    "Quantity": ["qty", "quantity", "units", "qty ordered", "order qty", "quantity ordered"],
+    "Order Date": ["date", "order date", "ordered on", "created at"],
+    "Order ID": ["order", "order id", "order number", "order no", "order num", "order ref", "reference", "po number"],
+    "Carrier": ["carrier", "shipping carrier", "carrier name"],
+    "Form Factor": ["form factor", "uom", "unit of measure", "pack type"],
+    "Insurance Required": ["insurance", "insured", "insurance required"],
+    "Product Lot/Batch ID": ["lot", "batch", "lot id", "batch id", "lot number", "batch number", "lot batch id"],
+    "Shipping Address (name)": ["name", "ship to name", "recipient", "recipient name", "shipping name", "contact name"],
+    "Shipping Address (email)": ["email", "ship to email", "recipient email", "shipping email"],
+    "Shipping Address (phone)": ["phone", "ship to phone", "recipient phone", "shipping phone", "phone number"],
+    "Shipping Address (line1)": ["address", "address1", "address 1", "address line 1", "line1", "street", "ship to address"],
+    "Shipping Address (line2)": ["address2", "address 2", "address line 2", "line2"],
+    "Shipping Address (city)": ["city", "ship to city", "shipping city", "town"],
+    "Shipping Address (state)": ["state", "ship to state", "shipping state", "province", "region"],
+    "Shipping Address (country)": ["country", "ship to country", "shipping country"],
+    "Shipping Address (zip)": ["zip", "zip code", "zipcode", "postal code", "postcode", "ship to zip"],
+    "Validate Address": ["validate address", "address validation"],
+    "Standard/Dropship": ["standard dropship", "standard or dropship", "shipment type", "consignment type", "type"],
+    "Consignment Date": ["date", "consignment date", "expected date", "arrival date"],
+    "Consignment Number": ["consignment", "consignment number", "consignment no", "asn", "asn number"],
+    "Supplier/Vendor": ["supplier", "vendor", "supplier vendor", "supplier name", "vendor name"],
+    "Tracking Number": ["tracking", "tracking number", "tracking no", "tracking id"],
+    "Dropship Type": ["dropship type"],
+    "Dropship Data": ["dropship data"],
+}
+
+def normalize_header(header):
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(header).lower()).split())
+
+# Function to ask the LLM once per distinct set of unknown headers which fields they hold
+@st.cache_data(show_spinner=False)
+def infer_unknown_headers(unknown_headers, sample_values, target_fields, _client):
+    schema = {
+        "type": "object",
+        "properties": {
+            "mapping": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "header": {"type": "string", "enum": list(unknown_headers)},
+                        "field": {"type": "string", "enum": list(target_fields) + [""]}
+                    },
+                    "required": ["header", "field"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["mapping"],
+        "additionalProperties": False
+    }
+    headers_str = "\n".join(f"- {header} (e.g. {sample})" for header, sample in zip(unknown_headers, sample_values))
     prompt = f"""
-    The user's input is: "{user_input}"
-    The mandatory fields are: {mandatory_fields}.
-    The optional fields are: {optional_fields}.
+    These are column headers from an uploaded file, each with an example value:
+    {headers_str}
 
-    Return a JSON object where keys are all the fields in {mandatory_fields} and {optional_fields}. Extract the respective values from the user input.
-    For example: if user writes warehouse 554, then the dictionary should contain key as "Warehouse Name/Code" and value as "554".
-    The name of the fields need not exactly match the user's input. Use your discretion to understand which part of the user's input refers to which key.
-    For any optional field leave the value blank if it is not input by the user, but do not leave the keys blank.
+    The fields we can fill are: {list(target_fields)}.
+    For each header, return the field it holds, or an empty string if it doesn't match any field.
+    Do not map two headers to the same field.
     """
+    response = get_completion_structured(prompt, _client, "header_mapping", schema)
+    try:
+        pairs = json.loads(response).get("mapping", [])
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    return {pair["header"]: pair["field"] for pair in pairs if pair.get("field")}
+
+# Function to map a file's column headers to the canonical fields.
+# Exact/alias matches are resolved locally; the LLM is asked only about the rest.
+def map_csv_headers(df, mandatory_fields, optional_fields, client):
+    target_fields = mandatory_fields + optional_fields
+    alias_index = {}
+    for field in target_fields:
+        for alias in [field] + FIELD_ALIASES.get(field, []):
+            alias_index.setdefault(normalize_header(alias), field)
+
+    mapping = {}
+    unknown_headers = []
+    for column in df.columns:
+        field = alias_index.get(normalize_header(column))
+        if field and field not in mapping.values():
+            mapping[column] = field
+        else:
+            unknown_headers.append(column)
+
+    unmapped_fields = [field for field in target_fields if field not in mapping.values()]
+    if unknown_headers and unmapped_fields and client is not None:
+        sample_values = []
+        for column in unknown_headers:
+            values = df[column][df[column].astype(str).str.strip() != ""]
+            sample_values.append(str(values.iloc[0])[:50] if len(values) else "")
+        inferred = infer_unknown_headers(tuple(unknown_headers), tuple(sample_values), tuple(unmapped_fields), client)
+        for column, field in inferred.items():
+            if column in unknown_headers and field in unmapped_fields and field not in mapping.values():
+                mapping[column] = field
+
+    return mapping
+
+# Function to turn every row of a file into field dictionaries using the header mapping.
+# Returns (row index, fields, missing mandatory fields) per row without any LLM calls.
+def extract_rows(df, mapping, mandatory_fields, optional_fields):
+    target_fields = mandatory_fields + optional_fields
+    rows = df[list(mapping)].rename(columns=mapping)
+    for field in target_fields:
+        if field not in rows.columns:
+            rows[field] = ""
+    rows = rows[target_fields].fillna("").astype(str).apply(lambda column: column.str.strip())
+
+    missing = rows[mandatory_fields].eq("")
+    missing_lists = [
+        [field for field, is_missing in zip(mandatory_fields, flags) if is_missing]
+        for flags in missing.itertuples(index=False)
+    ]
+    return list(zip(df.index, rows.to_dict("records"), missing_lists))
+
+
+# Function to build the free text of the columns the header mapping didn't use
+def unmapped_text(df, mapping, indexes):
+    columns = [column for column in df.columns if column not in mapping]
+    texts = {}
+    for index in indexes:
+        row = df.loc[index, columns] if columns else {}
+        texts[index] = ", ".join(
+            f"{column}: {str(value).strip()}" for column, value in dict(row).items() if str(value).strip()
+        )
+    return texts
+
+# Function to run LLM extraction for many texts concurrently on the async client.
+# With max_pack_rows > 1 several texts share one request, sized to token_budget;
+# texts the packed answer leaves out or garbles are re-run one per request.
+# Results keep the order of texts; a failed text gets None and its error is
+# returned in the error list instead of stopping the batch.
+async def extract_many_async(texts, async_client, mandatory_fields, optional_fields, extra_instructions="",
+                             concurrency=8, max_pack_rows=1, token_budget=6000, on_progress=None):
+    results = [None] * len(texts)
+    errors = []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    packs = pack_texts(texts, mandatory_fields, optional_fields, token_budget, max(1, max_pack_rows))
+
+    async def extract_one(position):
+        async with semaphore:
+            try:
+                results[position] = await extract_fields_async(texts[position], async_client, mandatory_fields, optional_fields, extra_instructions)
+            except Exception as e:
+                errors.append((position, f"{type(e).__name__}: {e}"))
+
+    async def extract_pack(pack):
+        retry = pack
+        if len(pack) > 1:
+            async with semaphore:
+                try:
+                    parsed = await extract_packed_async([texts[position] for position in pack], async_client, mandatory_fields, optional_fields, extra_instructions)
+                except Exception:
+                    parsed = {}
+            for row, result in parsed.items():
+                results[pack[row]] = result
+            retry = [position for row, position in enumerate(pack) if row not in parsed]
+        await asyncio.gather(*(extract_one(position) for position in retry))
+        return len(pack)
+
+    tasks = [asyncio.ensure_future(extract_pack(pack)) for pack in packs]
+    done = 0
+    for task in asyncio.as_completed(tasks):
+        done += await task
+        if on_progress:
+            on_progress(done, len(texts))
+
+    return results, sorted(errors)
+
+# Function to run extract_many_async on the shared event loop for the OpenAI
+# client's settings and wait for it. Progress is reported back on the calling
+# thread, since Streamlit elements can only be updated from the script thread.
+def run_extraction(texts, client, mandatory_fields, optional_fields, extra_instructions="", on_progress=None, **options):
+    loop, async_client = get_async_openai_client(client.api_key, str(client.base_url), client)
+    updates = queue.SimpleQueue()
+
+    async def extract(tenant):
+        current_tenant.set(tenant)
+        return await extract_many_async(
+            texts, async_client, mandatory_fields, optional_fields, extra_instructions,
+            on_progress=lambda done, total: updates.put((done, total)), **options
+        )
+
+    future = asyncio.run_coroutine_threadsafe(extract(current_tenant.get()), loop)
+    while True:
+        concurrent.futures.wait([future], timeout=0.1)
+        while not updates.empty():
+            done, total = updates.get()
+            if on_progress:
+                on_progress(done, total)
+        if future.done():
+            return future.result()
+
+# Extraction settings from secrets, passed to extract_many_async
+def llm_extraction_settings():
+    return {
+        "concurrency": int(st.secrets.get("LLM_CONCURRENCY", 8)),
+        "max_pack_rows": int(st.secrets.get("LLM_PACK_ROWS", 10)),
+        "token_budget": int(st.secrets.get("LLM_PACK_TOKEN_BUDGET", 6000)),
+    }
 
-    response = get_completion_json(prompt, client)
-    response_dict = json.loads(response)  # Convert the JSON string to a Python dictionary
-    return response_dict
+# Function to fill in rows whose mandatory fields weren't in any mapped column but
+# may be in free-text columns (notes, descriptions). Only those rows go to the LLM,
+# concurrently; values from mapped columns always win over extracted ones.
+def complete_rows_with_llm(rows, df, mapping, mandatory_fields, optional_fields, client,
+                           extra_instructions="", on_progress=None, **options):
+    pending = [position for position, (_, _, missing) in enumerate(rows) if missing]
+    free_text = unmapped_text(df, mapping, [rows[position][0] for position in pending])
+    pending = [position for position in pending if free_text[rows[position][0]]]
+    if not pending or client is None:
+        return rows, []
+
+    texts = []
+    for position in pending:
+        index, fields, _ = rows[position]
+        known = ", ".join(f"{field}: {value}" for field, value in fields.items() if value)
+        texts.append(", ".join(part for part in (known, free_text[index]) if part))
+
+    results, failures = run_extraction(
+        texts, client, mandatory_fields, optional_fields, extra_instructions, on_progress=on_progress, **options
+    )
 
+    rows = list(rows)
+    for position, result in zip(pending, results):
+        if result is None:
+            continue
+        index, fields, _ = rows[position]
+        extracted, _ = result
+        merged = {field: fields.get(field) or extracted.get(field, "") for field in mandatory_fields + optional_fields}
+        rows[position] = (index, merged, [field for field in mandatory_fields if not merged[field]])
+
+    errors = [(rows[pending[position]][0], error) for position, error in failures]
+    return rows, errors
+
+
+# Function to extract one record per non-blank line of pasted text, packing
+# several lines into each LLM request. Returns (line index, fields, missing) rows.
+def extract_lines(text, client, mandatory_fields, optional_fields, extra_instructions=""):
+    lines = [(index, line.strip()) for index, line in enumerate(text.splitlines()) if line.strip()]
+    progress = st.progress(0.0, text=f"Extracting {len(lines)} lines...")
+    results, errors = run_extraction(
+        [line for _, line in lines], client, mandatory_fields, optional_fields, extra_instructions,
+        on_progress=lambda done, total: progress.progress(done / total, text=f"Extracted {done}/{total} lines"),
+        **llm_extraction_settings()
+    )
+    progress.empty()
+    for position, error in errors:
+        st.error(f"Could not extract fields for line {lines[position][0]+1}: {error}")
+    return [(index, *result) for (index, _), result in zip(lines, results) if result is not None]
+
+# Functions to load a single reference document. Results are cached per tenant
+# in reference_cache, including lookups that found nothing.
+def load_customer(customer_code, database, tenant_id):
+    return database.customers.find_one(
+        {"tenant": tenant_id, "$or": [{"name": customer_code}, {"code": customer_code}]},
+        {"_id": 1, "warehouses": 1}
+    )
 
-def validate_warehouse(warehouse_code, database, tenant_id):
-    result = database.warehouses.find_one(
+def load_warehouse(warehouse_code, database, tenant_id):
+    return database.warehouses.find_one(
         {"tenant": tenant_id, "$or": [{"name": warehouse_code}, {"code": warehouse_code}]},
         {"_id": 1}
     )
+
+def cache_customer(tenant_id, customer_code, customer):
+    if customer:
+        customer = {"_id": customer["_id"], "warehouses": customer.get("warehouses")}
+        reference_cache.set(tenant_id, "customer_warehouses", str(customer["_id"]), {"warehouses": customer["warehouses"]})
+    reference_cache.set(tenant_id, "customer", customer_code, customer)
+    return customer
+
+# Function to resolve the customers, warehouses and SKUs of a batch of rows
+# with one $in query per collection. The result can be passed to the validate_*
+# functions as `references` so they don't query the database per row.
+def resolve_references(records, database, tenant_id):
+    customer_codes = sorted({str(record.get("Customer Name/Code", "")) for record in records} - {""})
+    warehouse_codes = sorted({str(record.get("Warehouse Name/Code", "")) for record in records} - {""})
+
+    references = {
+        "customers": {},
+        "warehouses": {},
+        "customer_warehouses": {},
+        "skus": {}
+    }
+
+    def from_cache(kind, keys, target):
+        # Fills target with cached entries and returns the keys still to be queried
+        uncached = []
+        for key in keys:
+            value = reference_cache.get(tenant_id, kind, key)
+            if value is MISS:
+                uncached.append(key)
+            else:
+                target[key] = value
+        return uncached
+
+    def match_codes(documents, codes):
+        # A code matches the first document whose name or code equals it, like find_one
+        matched = {code: None for code in codes}
+        for document in documents:
+            for key in ("name", "code"):
+                value = document.get(key)
+                if value in matched and matched[value] is None:
+                    matched[value] = document
+        return matched
+
+    uncached_customers = from_cache("customer", customer_codes, references["customers"])
+    if uncached_customers:
+        customers = database.customers.find(
+            {"tenant": tenant_id, "$or": [{"name": {"$in": uncached_customers}}, {"code": {"$in": uncached_customers}}]},
+            {"_id": 1, "name": 1, "code": 1, "warehouses": 1}
+        )
+        for code, customer in match_codes(customers, uncached_customers).items():
+            references["customers"][code] = cache_customer(tenant_id, code, customer)
+
+    uncached_warehouses = from_cache("warehouse", warehouse_codes, references["warehouses"])
+    if uncached_warehouses:
+        warehouses = database.warehouses.find(
+            {"tenant": tenant_id, "$or": [{"name": {"$in": uncached_warehouses}}, {"code": {"$in": uncached_warehouses}}]},
+            {"_id": 1, "name": 1, "code": 1}
+        )
+        for code, warehouse in match_codes(warehouses, uncached_warehouses).items():
+            warehouse = {"_id": warehouse["_id"]} if warehouse else None
+            reference_cache.set(tenant_id, "warehouse", code, warehouse)
+            references["warehouses"][code] = warehouse
+
+    for customer in references["customers"].values():
+        if customer:
+            references["customer_warehouses"][str(customer["_id"])] = customer.get("warehouses")
+
+    # SKUs are scoped to the customer resolved for each row
+    sku_keys = set()
+    for record in records:
+        customer = references["customers"].get(str(record.get("Customer Name/Code", "")))
+        if customer and record.get("Product SKU"):
+            sku_keys.add((str(customer["_id"]), record["Product SKU"]))
+
+    uncached_skus = from_cache("sku", sorted(sku_keys), references["skus"])
+    if uncached_skus:
+        matched = {key: None for key in uncached_skus}
+        variants = database.productvariants.find(
+            {
+                "tenant": tenant_id,
+                "customer": {"$in": sorted({customer_id for customer_id, _ in uncached_skus})},
+                "sku": {"$in": sorted({sku for _, sku in uncached_skus})}
+            },
+            {"_id": 1, "customer": 1, "sku": 1}
+        )
+        for variant in variants:
+            key = (str(variant.get("customer")), variant.get("sku"))
+            if key in matched and matched[key] is None:
+                matched[key] = str(variant["_id"])
+        for key, sku_id in matched.items():
+            reference_cache.set(tenant_id, "sku", key, sku_id)
+            references["skus"][key] = sku_id
+
+    return references
+
+# Function to resolve the customer, warehouse, customer's warehouse access and SKU
+# of a single row in one round trip, using a customers aggregation with $lookup
+# stages for the warehouse and the product variant. Cached entries are used when
+# all of them are available. Returns the same structure as resolve_references.
+def resolve_order_references(record, database, tenant_id):
+    customer_code = str(record.get("Customer Name/Code", ""))
+    warehouse_code = str(record.get("Warehouse Name/Code", ""))
+    sku = record.get("Product SKU")
+
+    references = {"customers": {}, "warehouses": {}, "customer_warehouses": {}, "skus": {}}
+
+    customer = reference_cache.get(tenant_id, "customer", customer_code)
+    warehouse = reference_cache.get(tenant_id, "warehouse", warehouse_code)
+    sku_id = MISS
+    if customer is not MISS and customer:
+        sku_id = reference_cache.get(tenant_id, "sku", (str(customer["_id"]), sku))
+
+    if customer is MISS or (customer and (warehouse is MISS or sku_id is MISS)):
+        pipeline = [
+            {"$match": {"tenant": tenant_id, "$or": [{"name": customer_code}, {"code": customer_code}]}},
+            {"$limit": 1},
+            {"$project": {"_id": 1, "warehouses": 1}},
+            {"$lookup": {
+                "from": "warehouses",
+                "pipeline": [
+                    {"$match": {"tenant": tenant_id, "$or": [{"name": warehouse_code}, {"code": warehouse_code}]}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "warehouse"
+            }},
+            {"$lookup": {
+                "from": "productvariants",
+                "let": {"customerId": {"$toString": "$_id"}},
+                "pipeline": [
+                    {"$match": {"tenant": tenant_id, "sku": sku, "$expr": {"$eq": ["$customer", "$$customerId"]}}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "sku"
+            }}
+        ]
+        result = next(iter(database.customers.aggregate(pipeline)), None)
+
+        # Without a customer the warehouse and SKU are never checked, so only the
+        # customer is recorded
+        customer = cache_customer(tenant_id, customer_code, result)
+        if result:
+            warehouse = result["warehouse"][0] if result["warehouse"] else None
+            reference_cache.set(tenant_id, "warehouse", warehouse_code, warehouse)
+            sku_id = str(result["sku"][0]["_id"]) if result["sku"] else None
+            reference_cache.set(tenant_id, "sku", (str(result["_id"]), sku), sku_id)
+
+    references["customers"][customer_code] = customer
+    if customer:
+        references["customer_warehouses"][str(customer["_id"])] = customer.get("warehouses")
+        references["warehouses"][warehouse_code] = warehouse
+        references["skus"][(str(customer["_id"]), sku)] = sku_id
+    return references
+
+def validate_warehouse(warehouse_code, database, tenant_id, references=None):
+    if references is not None and warehouse_code in references["warehouses"]:
+        result = references["warehouses"][warehouse_code]
+    else:
+        result = reference_cache.get_or_load(
+            tenant_id, "warehouse", warehouse_code,
+            lambda: load_warehouse(warehouse_code, database, tenant_id)
+        )
     if result:
         return str(result['_id'])
     else:
         return "Warehouse name/code not valid"
 
-def validate_customer(customer_code, database, tenant_id):
-    result = database.customers.find_one(
-        {"tenant": tenant_id, "$or": [{"name": customer_code}, {"code": customer_code}]},
-        {"_id": 1}
-    )
+def validate_customer(customer_code, database, tenant_id, references=None):
+    if references is not None and customer_code in references["customers"]:
+        result = references["customers"][customer_code]
+    else:
+        result = reference_cache.get(tenant_id, "customer", customer_code)
+        if result is MISS:
+            result = cache_customer(tenant_id, customer_code, load_customer(customer_code, database, tenant_id))
     if result:
         return str(result['_id'])
     else:
         return "Customer name/code not valid"
 
-def validate_customer_warehouse_access(customer_id, warehouse_id, database):
+def validate_customer_warehouse_access(customer_id, warehouse_id, database, tenant_id, references=None):
     # Convert warehouse_id to ObjectId
     warehouse_id = ObjectId(warehouse_id)
 
     # Retrieve the customer document
-    customer = database.customers.find_one({"_id": ObjectId(customer_id)}, {"warehouses": 1})
+    if references is not None and customer_id in references["customer_warehouses"]:
+        customer = {"warehouses": references["customer_warehouses"][customer_id]}
+    else:
+        customer = reference_cache.get_or_load(
+            tenant_id, "customer_warehouses", customer_id,
+            lambda: database.customers.find_one({"_id": ObjectId(customer_id)}, {"warehouses": 1})
+        )
+        if customer is None:
+            return "Customer not valid"
 
     # Check if the customer has access to all warehouses or the specific warehouse
     if customer.get("warehouses") is None or str(warehouse_id) in customer.get("warehouses", []):
@@ -216,6 +882,16 @@ def validate_customer_warehouse_access(customer_id, warehouse_id, database):
         return "Warehouse not valid for this customer"
 
 def validate_order_date(order_date, client):
+    current_time = int(time.time() * 1000)
+
+    # Try the local parser first and only ask the LLM for formats it doesn't know
+    epoch_time = normalize_date(order_date)
+    record_fast_path("date", epoch_time is not None)
+    if epoch_time is not None:
+        if epoch_time > current_time:
+            return "Date not valid"
+        return epoch_time
+
     prompt = f"""Is '{order_date}' a valid date? If not, respond with "Date not valid".
     If yes, convert it to epoch time in milliseconds and return that. Assume the timezone is UTC.
     Do not respond with anything other than either the epoch time or "Date not valid".
@@ -224,29 +900,46 @@ def validate_order_date(order_date, client):
 
     try:
         epoch_time = int(response)
-        current_time = int(time.time() * 1000)
 
         if epoch_time > current_time:
             return "Date not valid"
 
-        return response
+        return epoch_time
     except ValueError:
         return "Date not valid"
 
 def validate_quantity(quantity, client):
+    # Plain integers and number words are handled locally
+    local_quantity = normalize_quantity(quantity)
+    record_fast_path("quantity", local_quantity is not None)
+    if local_quantity is not None:
+        return local_quantity
+
     prompt = f"""Is '{quantity}' a valid positive number or a word representing a positive number? If not, respond with "Quantity not valid".
             If it is an integer, simply return that. If it is a word representing a positive number, return the integer it respresents. Don't respond with anything else."""
     response = get_completion(prompt, client)
-    return response
 
-def validate_product_sku(customer, sku, database, tenant_id):
+    try:
+        return int(response)
+    except ValueError:
+        return "Quantity not valid"
+
+def validate_product_sku(customer, sku, database, tenant_id, references=None):
     # Find the product variant that matches the SKU, customer, and tenant
-    result = database.productvariants.find_one(
-        {"tenant": tenant_id, "customer": customer, "sku": sku},
-        {"_id": 1}
-    )
-    if result:
-        return str(result['_id'])
+    if references is not None and (customer, sku) in references["skus"]:
+        sku_id = references["skus"][(customer, sku)]
+    else:
+        def load_sku():
+            result = database.productvariants.find_one(
+                {"tenant": tenant_id, "customer": customer, "sku": sku},
+                {"_id": 1}
+            )
+            return str(result['_id']) if result else None
+
+        sku_id = reference_cache.get_or_load(tenant_id, "sku", (customer, sku), load_sku)
+
+    if sku_id:
+        return sku_id
     else:
         return "SKU not valid"
 
@@ -376,21 +1069,24 @@ def validate_and_format_dropship_data(dropship_type, dropship_data):
     # Return the formatted data for creating the final JSON
     return formatted_data
 
-def validate_order_fields(order, client, database, tenant_id):
-    print(order)
+def validate_order_fields(order, client, database, tenant_id, references=None):
     validated_order = order.copy()
 
+    # Single rows are resolved with one aggregation; batches pass pre-resolved references
+    if references is None:
+        references = resolve_order_references(order, database, tenant_id)
+
     # Validate customer
-    customer_id = validate_customer(order["Customer Name/Code"], database, tenant_id)
+    customer_id = validate_customer(order["Customer Name/Code"], database, tenant_id, references)
     if customer_id == "Customer name/code not valid":
         return customer_id, None
 
     # Validate warehouse
-    warehouse_id = validate_warehouse(order["Warehouse Name/Code"], database, tenant_id)
+    warehouse_id = validate_warehouse(order["Warehouse Name/Code"], database, tenant_id, references)
     if warehouse_id == "Warehouse name/code not valid":
         return warehouse_id, None
 
-    access_check = validate_customer_warehouse_access(customer_id, warehouse_id, database)
+    access_check = validate_customer_warehouse_access(customer_id, warehouse_id, database, tenant_id, references)
     if access_check != True:
         return access_check, None
 
@@ -411,7 +1107,7 @@ def validate_order_fields(order, client, database, tenant_id):
     validated_order["Quantity"] = int(quantity)
 
     # Validate product SKU
-    sku_id = validate_product_sku(customer_id, order["Product SKU"], database, tenant_id)
+    sku_id = validate_product_sku(customer_id, order["Product SKU"], database, tenant_id, references)
     if sku_id == "SKU not valid":
         return sku_id, None
 
@@ -447,24 +1143,86 @@ def validate_order_fields(order, client, database, tenant_id):
     return "Yes", validated_order
 
 
-def create_order_data(validated_order, client, database):
-
-    sku_id = validated_order["Product SKU ID"]
+# Fields of productvariants used by create_order_data and create_consignment_data
+PRODUCT_VARIANT_PROJECTION = {
+    "_id": 1, "productId": 1, "sku": 1, "attributes": 1, "marketplaceAttributes": 1,
+    "fnSku": 1, "name": 1, "asin": 1, "sellerSku": 1, "baseUom": 1
+}
+
+# Function to fetch the product data of every queued row before submission, with one
+# $in query per collection for whatever isn't cached already. Pass the result to
+# the create_*_data functions as `prefetched` so they don't query per order.
+# Only the collections the kind's payload uses are fetched (SUBMIT_KINDS "prefetch").
+def prefetch_product_data(rows, database, tenant_id, kind):
+    sku_ids = sorted({row["Product SKU ID"] for row in rows if row.get("Product SKU ID")})
+    prefetched = {collection: {} for collection in SUBMIT_KINDS[kind]["prefetch"]}
+
+    uncached = {}
+    for collection in prefetched:
+        uncached[collection] = []
+        for sku_id in sku_ids:
+            value = reference_cache.get(tenant_id, collection, sku_id)
+            if value is MISS:
+                uncached[collection].append(sku_id)
+            else:
+                prefetched[collection][sku_id] = value
+
+    if uncached["productvariant"]:
+        found = {
+            str(variant["_id"]): variant
+            for variant in database.productvariants.find(
+                {"_id": {"$in": [ObjectId(sku_id) for sku_id in uncached["productvariant"]]}},
+                PRODUCT_VARIANT_PROJECTION
+            )
+        }
+        for sku_id in uncached["productvariant"]:
+            prefetched["productvariant"][sku_id] = found.get(sku_id)
+            reference_cache.set(tenant_id, "productvariant", sku_id, found.get(sku_id))
+
+    if uncached.get("skubinmapping"):
+        found = {}
+        for mapping in database.skubinmappings.find(
+            {"product": {"$in": [ObjectId(sku_id) for sku_id in uncached["skubinmapping"]]}},
+            {"product": 1, "formFactor": 1, "nestedFormFactor": 1, "lotId": 1}
+        ):
+            # Keep the first mapping per product, like find_one
+            found.setdefault(str(mapping["product"]), mapping)
+        for sku_id in uncached["skubinmapping"]:
+            prefetched["skubinmapping"][sku_id] = found.get(sku_id)
+            reference_cache.set(tenant_id, "skubinmapping", sku_id, found.get(sku_id))
+
+    return prefetched
+
+def load_product_variant(sku_id, database, tenant_id, prefetched=None):
+    if prefetched is not None and sku_id in prefetched["productvariant"]:
+        return prefetched["productvariant"][sku_id] or {}
 
     # Query the productvariants collection
-    product_variant = database.productvariants.find_one(
-        {"_id": ObjectId(sku_id)},
-        {"productId": 1, "sku": 1, "attributes": 1, "marketplaceAttributes": 1, "fnSku": 1, "name": 1}
+    return reference_cache.get_or_load(
+        tenant_id, "productvariant", sku_id,
+        lambda: database.productvariants.find_one({"_id": ObjectId(sku_id)}, PRODUCT_VARIANT_PROJECTION)
     ) or {}
 
-
+def load_sku_bin_mapping(sku_id, database, tenant_id, prefetched=None):
+    if prefetched is not None and sku_id in prefetched.get("skubinmapping", {}):
+        return prefetched["skubinmapping"][sku_id] or {}
 
     # Query the skubinmappings collection
-    sku_bin_mapping = database.skubinmappings.find_one(
-        {"product": ObjectId(sku_id)},
-        {"formFactor": 1, "nestedFormFactor": 1, "lotId": 1}
+    return reference_cache.get_or_load(
+        tenant_id, "skubinmapping", sku_id,
+        lambda: database.skubinmappings.find_one(
+            {"product": ObjectId(sku_id)},
+            {"formFactor": 1, "nestedFormFactor": 1, "lotId": 1}
+        )
     ) or {}
 
+def create_order_data(validated_order, client, database, tenant_id, prefetched=None):
+
+    sku_id = validated_order["Product SKU ID"]
+
+    product_variant = load_product_variant(sku_id, database, tenant_id, prefetched)
+    sku_bin_mapping = load_sku_bin_mapping(sku_id, database, tenant_id, prefetched)
+
     try:
         form_factor = validated_order.get("formFactor")
     except:
@@ -510,21 +1268,62 @@ def create_order_data(validated_order, client, database):
 
     return order_data
 
-def validate_consignment_fields(consignment, client, database, tenant_id):
-    print(consignment)
+# Function to bring the structured consignment fields into the shape the payload
+# needs, whichever way they arrived: Tracking Number as a list, and Dropship Data
+# as a dict whose details (Is Case, Label Source, ...) are also copied to the
+# top-level keys the dropship validation reads. CSV cells and free text hold them
+# as strings ("1Z1, 1Z2", "Is Case: yes, Per Case Quantity: 12" or JSON).
+def normalize_consignment_structure(consignment):
+    consignment = consignment.copy()
+
+    tracking = consignment.get("Tracking Number")
+    if isinstance(tracking, str):
+        # Only commas, semicolons and line breaks separate numbers: some carriers
+        # print theirs in space-separated blocks ("9400 1000 0000 0000 0000 00")
+        tracking = re.split(r"[,;\r\n]+", tracking)
+    consignment["Tracking Number"] = [str(number).strip() for number in tracking or [] if str(number).strip()]
+
+    dropship_data = consignment.get("Dropship Data")
+    if isinstance(dropship_data, str) and dropship_data.strip():
+        try:
+            dropship_data = json.loads(dropship_data)
+        except json.JSONDecodeError:
+            # A value runs up to the separator before the next field name, so commas
+            # inside it (addresses, URLs) are kept
+            fields = "|".join(re.escape(field) for field in DROPSHIP_DATA_FIELDS)
+            pairs = re.findall(
+                rf"({fields})\s*[:=]\s*(.*?)(?=\s*[,;\r\n]\s*(?:{fields})\s*[:=]|$)",
+                dropship_data, re.IGNORECASE | re.DOTALL
+            )
+            names = {field.lower(): field for field in DROPSHIP_DATA_FIELDS}
+            dropship_data = {names[name.lower()]: value.strip().rstrip(",;").strip() for name, value in pairs}
+    dropship_data = dropship_data if isinstance(dropship_data, dict) else {}
+    consignment["Dropship Data"] = dropship_data
+    for field in DROPSHIP_DATA_FIELDS:
+        value = dropship_data.get(field)
+        if not consignment.get(field) and value and (not isinstance(value, dict) or any(value.values())):
+            consignment[field] = value
+    return consignment
+
+def validate_consignment_fields(consignment, client, database, tenant_id, references=None):
+    consignment = normalize_consignment_structure(consignment)
     validated_consignment = consignment.copy()
+
+    # Single rows are resolved with one aggregation; batches pass pre-resolved references
+    if references is None:
+        references = resolve_order_references(consignment, database, tenant_id)
     
     # Validate customer
-    customer_id = validate_customer(consignment["Customer Name/Code"], database, tenant_id)
+    customer_id = validate_customer(consignment["Customer Name/Code"], database, tenant_id, references)
     if customer_id == "Customer name/code not valid":
         return customer_id, None
     
     # Validate warehouse
-    warehouse_id = validate_warehouse(consignment["Warehouse Name/Code"], database, tenant_id)
+    warehouse_id = validate_warehouse(consignment["Warehouse Name/Code"], database, tenant_id, references)
     if warehouse_id == "Warehouse name/code not valid":
         return warehouse_id, None
     
-    access_check = validate_customer_warehouse_access(customer_id, warehouse_id, database)
+    access_check = validate_customer_warehouse_access(customer_id, warehouse_id, database, tenant_id, references)
     if access_check != True:
         return access_check, None
     
@@ -545,7 +1344,7 @@ def validate_consignment_fields(consignment, client, database, tenant_id):
     validated_consignment["Quantity"] = quantity
     
     # Validate product SKU
-    sku_id = validate_product_sku(customer_id, consignment["Product SKU"], database, tenant_id)
+    sku_id = validate_product_sku(customer_id, consignment["Product SKU"], database, tenant_id, references)
     if sku_id == "SKU not valid":
         return sku_id, None
     
@@ -586,7 +1385,7 @@ def validate_consignment_fields(consignment, client, database, tenant_id):
     
     return "Yes", validated_consignment
 
-def create_consignment_data(validated_consignment, client, database):
+def create_consignment_data(validated_consignment, client, database, tenant_id, prefetched=None):
     # Initialize the common consignment data
     consignment_data = {
         "warehouse": validated_consignment["Warehouse ID"],
@@ -599,10 +1398,7 @@ def create_consignment_data(validated_consignment, client, database):
     # Query the productvariants collection
     sku_id = validated_consignment["Product SKU ID"]
 
-    product_variant = database.productvariants.find_one(
-        {"_id": ObjectId(sku_id)},
-        {"_id": 1, "sku": 1, "asin": 1, "sellerSku": 1, "name": 1, "baseUom": 1}
-    ) or {}
+    product_variant = load_product_variant(sku_id, database, tenant_id, prefetched)
 
     form_factor = validated_consignment.get("Form Factor")
     if not form_factor:
@@ -673,10 +1469,153 @@ def create_consignment_data(validated_consignment, client, database):
 
     return consignment_data
 
+# Ingestion settings for each record kind
+INGEST_KINDS = {
+    "order": {
+        "mandatory_fields": ORDER_MANDATORY_FIELDS,
+        "optional_fields": ORDER_OPTIONAL_FIELDS,
+        "extra_instructions": ORDER_EXTRACTION_INSTRUCTIONS,
+        "validate": validate_order_fields,
+    },
+    "consignment": {
+        "mandatory_fields": CONSIGNMENT_MANDATORY_FIELDS,
+        "optional_fields": CONSIGNMENT_OPTIONAL_FIELDS,
+        "extra_instructions": CONSIGNMENT_EXTRACTION_INSTRUCTIONS,
+        "validate": validate_consignment_fields,
+    },
+}
+
+# Yields DataFrames of chunk_size rows with string cells. Blank rows are dropped
+# and the row index counts the remaining rows across chunks; df.attrs["file_rows"]
+# holds each row's number as a spreadsheet shows the file (the header is row 1).
+def read_csv_chunks(file, chunk_size=5000):
+    start = 0
+    for df in pd.read_csv(file, dtype=str, keep_default_na=False, skip_blank_lines=False, chunksize=max(1, chunk_size)):
+        df = df[(df != "").any(axis=1)]
+        file_rows = [index + 2 for index in df.index]
+        df.index = range(start, start + len(df))
+        df.attrs["file_rows"] = file_rows
+        start += len(df)
+        yield df
+
+# Opens an .xlsx path or file object for streaming; the caller closes it
+def open_xlsx(file):
+    return openpyxl.load_workbook(file, read_only=True, data_only=True)
+
+# Returns {sheet name: row count from the sheet's stored dimensions, or None}
+def xlsx_sheet_sizes(workbook):
+    return {sheet.title: sheet.max_row for sheet in workbook.worksheets}
+
+def xlsx_cell_text(value):
+    if value is None:
+        return ""
+    # Whole numbers come back as floats (5.0) when the column holds any decimals
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+# Renames repeated headers the way pd.read_csv does ("SKU", "SKU.1", "SKU.2"), so
+# every column can be selected on its own
+def dedupe_headers(headers):
+    counts = {}
+    result = []
+    for header in headers:
+        name = header
+        count = counts.get(header, 0)
+        while count > 0:
+            counts[header] = count + 1
+            name = f"{header}.{count}"
+            # Skip suffixed names that are already real headers
+            count = count + 1 if name in headers else counts.get(name, 0)
+        counts[name] = count + 1
+        result.append(name)
+    return result
+
+def xlsx_chunk(rows, headers, start, file_rows):
+    df = pd.DataFrame(rows, columns=headers, index=range(start, start + len(rows)))
+    df.attrs["file_rows"] = file_rows
+    return df
+
+# Streams a worksheet in read-only mode and yields DataFrames of chunk_size rows
+# with the same shape read_csv_chunks gives: string cells, first non-empty row as
+# headers, a row index that keeps counting across chunks, and the sheet row number
+# of every row in df.attrs["file_rows"]. file is a path, a file object or a
+# workbook from open_xlsx, which is left open for the caller.
+def read_xlsx_chunks(file, sheet_name=None, chunk_size=5000):
+    workbook = file if isinstance(file, openpyxl.Workbook) else open_xlsx(file)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        headers = None
+        rows, file_rows, start = [], [], 0
+        for file_row, values in enumerate(sheet.iter_rows(values_only=True), 1):
+            cells = [xlsx_cell_text(value) for value in values]
+            if headers is None:
+                if any(cells):
+                    headers = dedupe_headers([cell or f"Column {position + 1}" for position, cell in enumerate(cells)])
+                continue
+            if not any(cells):
+                continue
+            rows.append((cells + [""] * len(headers))[:len(headers)])
+            file_rows.append(file_row)
+            if len(rows) >= max(1, chunk_size):
+                yield xlsx_chunk(rows, headers, start, file_rows)
+                start += len(rows)
+                rows, file_rows = [], []
+        if rows:
+            yield xlsx_chunk(rows, headers, start, file_rows)
+    finally:
+        if workbook is not file:
+            workbook.close()
+
+# Pipeline that maps, extracts and validates an uploaded file one chunk (DataFrame)
+# at a time, so memory stays bounded by the chunk size rather than the file size.
+# Headers are resolved once from the first chunk unless a mapping from an earlier
+# run is passed. Yields one result per chunk: {"rows": row count, "validated":
+# [validated records], "indexes": [row index of each validated record],
+# "errors": [(row index, message)], "mapping": {column: field}, "file_rows":
+# {row index: row number in the file}}. on_progress(chunk rows, done, total) is
+# called as the LLM fills in the rows of a chunk that need free-text extraction.
+# Has no UI code so the app and command line tools can both drive it.
+def ingest_chunks(chunks, kind, client, database, tenant_id, mapping=None, on_progress=None, **extraction_options):
+    settings = INGEST_KINDS[kind]
+    mandatory_fields = settings["mandatory_fields"]
+    optional_fields = settings["optional_fields"]
+
+    for df in chunks:
+        if mapping is None:
+            mapping = map_csv_headers(df, mandatory_fields, optional_fields, client)
+        rows = extract_rows(df, mapping, mandatory_fields, optional_fields)
+        rows, extraction_errors = complete_rows_with_llm(
+            rows, df, mapping, mandatory_fields, optional_fields, client, settings["extra_instructions"],
+            on_progress=(lambda done, total, chunk_rows=len(df): on_progress(chunk_rows, done, total)) if on_progress else None,
+            **extraction_options
+        )
+        errors = [(index, f"Could not extract fields: {error}") for index, error in extraction_errors]
+        failed_extraction = {index for index, _ in extraction_errors}
+
+        # Look up every customer, warehouse and SKU in the chunk up front
+        references = resolve_references([row for _, row, missing in rows if not missing], database, tenant_id)
+        validated, indexes = [], []
+        for index, record, missing_fields in rows:
+            if index in failed_extraction:
+                continue
+            if missing_fields:
+                errors.append((index, f"Missing mandatory fields: {', '.join(missing_fields)}"))
+                continue
+            validate, validated_record = settings["validate"](record, client, database, tenant_id, references)
+            if validate == "Yes":
+                validated.append(validated_record)
+                indexes.append(index)
+            else:
+                errors.append((index, f"Validation failed: {validate}"))
+
+        yield {
+            "rows": len(df), "validated": validated, "indexes": indexes,
+            "errors": sorted(errors, key=lambda error: error[0]), "mapping": mapping,
+            "file_rows": dict(zip(df.index, df.attrs.get("file_rows") or [index + 1 for index in df.index])),
+        }
+
 def login(url, username, password, tenant_id, tenant_name, logout_all=True):
-    headers = {'Content-Type': 'application/json',
-              'tenant': f'{{"id":"{tenant_id}","name":"{tenant_name}","subdomain":"uat","code":"uat", "active": true}}'
-    }
     query = """
     mutation login($username: String!, $password: String!, $logoutAll: Boolean) {
         login(username: $username, password: $password, logoutAll: $logoutAll) {
@@ -689,143 +1628,592 @@ def login(url, username, password, tenant_id, tenant_name, logout_all=True):
         "password": password,
         "logoutAll": logout_all,
     }
-    response = requests.post(url, json={'query': query, 'variables': variables}, headers=headers)
-    data = response.json()
-    print(data)
+    with metrics.timed("graphql.login") as span:
+        data = graphql_client.execute(url, query, variables, tenant_id, tenant_name)
+        span["error"] = bool(data.get("errors"))
     return data.get('data', {}).get('login', {}).get('token')
 
-def save_order(url, token, order_data, tenant_id, tenant_name):
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}',
-        'tenant': f'{{"id":"{tenant_id}","name":"{tenant_name}","subdomain":"uat","code":"uat", "active": true}}'
-    }
-    query = """
-     mutation saveOrder(
-    $trackingNumber: String
-    $orderLineItems: [OrderLineItemInput]
-    $customer: ID
-    $warehouse: ID
-    $orderId: String
-    $id: ID
-    $carrier: String
-    $orderDate: Date
-    $workflowType: String
-    $shippingAddress: ShippingAddressInput
-    $source: String
-    $carrierService: String
-    $insuranceRequired: Boolean
-    $insuranceProvider: String
-    $insuredValue: Float
-    $toValidAddress: Boolean
-    $preSelectedCarrierRate: SelectedCarrierRateInput
-    $typeOfShipment: String
-    $estimatedBoxes: [OrderEstimatedBoxInput]
-  ) {
-    saveOrder(
-      orderInput: {
-        trackingNumber: $trackingNumber
-        orderLineItems: $orderLineItems
-        customer: $customer
-        warehouse: $warehouse
-        orderId: $orderId
-        id: $id
-        carrier: $carrier
-        orderDate: $orderDate
-        workflowType: $workflowType
-        shippingAddress: $shippingAddress
-        source: $source
-        carrierService: $carrierService
-        insuranceRequired: $insuranceRequired
-        insuranceProvider: $insuranceProvider
-        insuredValue: $insuredValue
-        toValidAddress: $toValidAddress
-        preSelectedCarrierRate: $preSelectedCarrierRate
-        typeOfShipment: $typeOfShipment
-        estimatedBoxes: $estimatedBoxes
-      }
-    ) {
+# Function to get a cached auth token for the service account, logging in only
+# when needed. logoutAll stays off so other sessions' tokens remain valid.
+def get_auth_token(url, username, password, tenant_id, tenant_name, stale_token=None):
+    return graphql_client.get_token(
+        (url, username, tenant_id),
+        lambda: login(url, username, password, tenant_id, tenant_name, logout_all=False),
+        stale_token=stale_token
+    )
+
+# Variables of the saveOrder/saveConsignment mutations and their GraphQL types
+SAVE_ORDER_VARIABLES = [
+    ("trackingNumber", "String"),
+    ("orderLineItems", "[OrderLineItemInput]"),
+    ("customer", "ID"),
+    ("warehouse", "ID"),
+    ("orderId", "String"),
+    ("id", "ID"),
+    ("carrier", "String"),
+    ("orderDate", "Date"),
+    ("workflowType", "String"),
+    ("shippingAddress", "ShippingAddressInput"),
+    ("source", "String"),
+    ("carrierService", "String"),
+    ("insuranceRequired", "Boolean"),
+    ("insuranceProvider", "String"),
+    ("insuredValue", "Float"),
+    ("toValidAddress", "Boolean"),
+    ("preSelectedCarrierRate", "SelectedCarrierRateInput"),
+    ("typeOfShipment", "String"),
+    ("estimatedBoxes", "[OrderEstimatedBoxInput]"),
+]
+
+SAVE_CONSIGNMENT_VARIABLES = [
+    ("trackingNumber", "[String]"),
+    ("items", "[ConsignmentInputItem!]"),
+    ("customer", "ID"),
+    ("warehouse", "ID"),
+    ("consignmentNumber", "String"),
+    ("orderId", "String"),
+    ("id", "ID"),
+    ("supplier", "String"),
+    ("carrier", "String"),
+    ("consignmentDate", "Date"),
+    ("notes", "String"),
+    ("isReturnOrder", "Boolean"),
+    ("linkedOrders", "[Random]"),
+    ("status", "String"),
+    ("dropship", "Boolean"),
+    ("dropshipType", "String"),
+    ("typeOfShipment", "String"),
+    ("shippingAddress", "ShippingAddressInput"),
+    ("dropshipData", "Random"),
+    ("workingList", "[Random]"),
+    ("isCasePack", "Boolean"),
+    ("sellerId", "String"),
+]
+
+# Function to build a mutation document. With aliases, the mutation is repeated
+# once per alias ("o0: saveOrder(...)") and each copy reads its own prefixed variables.
+def build_mutation(mutation, input_name, variable_types, aliases=None):
+    prefixes = [f"{alias}_" for alias in aliases] if aliases else [""]
+    declarations = "\n".join(
+        f"    ${prefix}{name}: {graphql_type}" for prefix in prefixes for name, graphql_type in variable_types
+    )
+    fields = []
+    for prefix, alias in zip(prefixes, aliases or [None]):
+        inputs = "\n".join(f"        {name}: ${prefix}{name}" for name, _ in variable_types)
+        fields.append(f"""  {f"{alias}: " if alias else ""}{mutation}(
+      {input_name}: {{
+{inputs}
+      }}
+    ) {{
       message
-    }
-  }
+    }}""")
+    fields_str = "\n".join(fields)
+    return f"""
+    mutation {mutation}(
+{declarations}
+  ) {{
+{fields_str}
+  }}
     """
+
+SAVE_ORDER_MUTATION = build_mutation("saveOrder", "orderInput", SAVE_ORDER_VARIABLES)
+SAVE_CONSIGNMENT_MUTATION = build_mutation("saveConsignment", "consignmentInput", SAVE_CONSIGNMENT_VARIABLES)
+
+def save_order(url, token, order_data, tenant_id, tenant_name):
     variables = order_data  # The order_data should be a dictionary formatted as the GraphQL variables section
-    response = requests.post(url, json={'query': query, 'variables': variables}, headers=headers)
-    data = response.json()
+    with metrics.timed("graphql.saveOrder") as span:
+        data = graphql_client.execute(url, SAVE_ORDER_MUTATION, variables, tenant_id, tenant_name, token)
+        span["error"] = bool(data.get("errors"))
     return data
 
 def save_consignment(url, token, consignment_data, tenant_id, tenant_name):
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}',
-        'tenant': f'{{"id":"{tenant_id}","name":"{tenant_name}","subdomain":"uat","code":"uat", "active": true}}'
-    }
-
-    # GraphQL mutation for saving a consignment
-    query = """
-    mutation saveConsignment(
-      $trackingNumber: [String]
-      $items: [ConsignmentInputItem!]
-      $customer: ID
-      $warehouse: ID
-      $consignmentNumber: String
-      $orderId: String
-      $id: ID
-      $supplier: String
-      $carrier: String
-      $consignmentDate: Date
-      $notes: String
-      $isReturnOrder: Boolean
-      $linkedOrders: [Random]
-      $status: String
-      $dropship: Boolean
-      $dropshipType: String
-      $typeOfShipment: String
-      $shippingAddress: ShippingAddressInput
-      $dropshipData: Random
-      $workingList: [Random]
-      $isCasePack: Boolean
-      $sellerId: String
-    ) {
-      saveConsignment(
-        consignmentInput: {
-          trackingNumber: $trackingNumber
-          items: $items
-          customer: $customer
-          warehouse: $warehouse
-          consignmentNumber: $consignmentNumber
-          orderId: $orderId
-          id: $id
-          supplier: $supplier
-          carrier: $carrier
-          consignmentDate: $consignmentDate
-          notes: $notes
-          isReturnOrder: $isReturnOrder
-          linkedOrders: $linkedOrders
-          status: $status
-          dropship: $dropship
-          dropshipType: $dropshipType
-          shippingAddress: $shippingAddress
-          typeOfShipment: $typeOfShipment
-          dropshipData: $dropshipData
-          workingList: $workingList
-          isCasePack: $isCasePack
-          sellerId: $sellerId
-        }
-      ) {
-        message
-      }
-    }
-    """
-
     # Sending the consignment data as variables for the mutation
     variables = consignment_data  # Consignment data should be a properly structured dictionary
-    response = requests.post(url, json={'query': query, 'variables': variables}, headers=headers)
-    data = response.json()
+    with metrics.timed("graphql.saveConsignment") as span:
+        data = graphql_client.execute(url, SAVE_CONSIGNMENT_MUTATION, variables, tenant_id, tenant_name, token)
+        span["error"] = bool(data.get("errors"))
 
     # Return the message or any error
     return data
 
+# Function to split the response of an aliased batch into one response per item,
+# shaped like the response of the single mutation. Errors without a path apply
+# to the whole document and are returned for every item.
+def split_batch_response(data, aliases, mutation):
+    results = {alias: {} for alias in aliases}
+    document_errors = []
+    for error in data.get("errors") or []:
+        path = error.get("path") if isinstance(error, dict) else None
+        if path and path[0] in results:
+            results[path[0]].setdefault("errors", []).append(error)
+        else:
+            document_errors.append(error)
+
+    for alias in aliases:
+        value = (data.get("data") or {}).get(alias)
+        if value is not None:
+            results[alias]["data"] = {mutation: value}
+        if document_errors:
+            results[alias].setdefault("errors", []).extend(document_errors)
+    return [results[alias] for alias in aliases], bool(document_errors) and not data.get("data")
+
+def save_batch(url, token, payloads, tenant_id, tenant_name, mutation, input_name, variable_types, save_single):
+    if len(payloads) == 1:
+        return [save_single(url, token, payloads[0], tenant_id, tenant_name)]
+
+    aliases = [f"m{i}" for i in range(len(payloads))]
+    query = build_mutation(mutation, input_name, variable_types, aliases)
+    variables = {
+        f"{alias}_{name}": payload[name]
+        for alias, payload in zip(aliases, payloads)
+        for name, _ in variable_types
+        if name in payload
+    }
+    with metrics.timed(f"graphql.{mutation}.batch") as span:
+        data = graphql_client.execute(url, query, variables, tenant_id, tenant_name, token)
+        span["error"] = bool(data.get("errors"))
+    responses, failed_document = split_batch_response(data, aliases, mutation)
+
+    # A single invalid payload fails validation of the whole document, so fall back
+    # to one request per payload rather than failing the other payloads too
+    if failed_document and not graphql_client.is_unauthorized(data):
+        return [save_single(url, token, payload, tenant_id, tenant_name) for payload in payloads]
+    return responses
+
+def save_orders_batch(url, token, orders_data, tenant_id, tenant_name):
+    return save_batch(url, token, orders_data, tenant_id, tenant_name, "saveOrder", "orderInput", SAVE_ORDER_VARIABLES, save_order)
+
+def save_consignments_batch(url, token, consignments_data, tenant_id, tenant_name):
+    return save_batch(url, token, consignments_data, tenant_id, tenant_name, "saveConsignment", "consignmentInput", SAVE_CONSIGNMENT_VARIABLES, save_consignment)
+
+ORDER_SUCCESS_MESSAGES = ("Order saved successfully", "Order successfully saved")
+CONSIGNMENT_SUCCESS_MESSAGES = ("Consignment added successfully", "Consignment successfully added")
+
+# Function to turn a saveOrder/saveConsignment response into (success, message)
+def check_save_response(response, mutation, success_messages):
+    if 'data' in response and response['data']:
+        message = (response['data'].get(mutation) or {}).get('message') or ''
+        if any(success_message in message for success_message in success_messages):
+            return True, message
+        return False, message or 'Unknown error'
+    elif 'errors' in response:
+        return False, str(response['errors'])
+    else:
+        return False, "An unknown error occurred"
+
+def submission_settings():
+    return {
+        "batch_size": int(st.secrets.get("SUBMIT_BATCH_SIZE", 10)),
+        "max_workers": int(st.secrets.get("SUBMIT_WORKERS", 8)),
+        "max_retries": int(st.secrets.get("SUBMIT_MAX_RETRIES", 3)),
+        "backoff": float(st.secrets.get("SUBMIT_RETRY_BACKOFF", 0.5)),
+    }
+
+# Queued rows that share every field of the grouping key are submitted as one
+# order/consignment with several line items. Rows without the identity field
+# (Order ID / Consignment Number) are never grouped.
+ORDER_GROUP_KEY = [
+    "Customer ID",
+    "Warehouse ID",
+    "Order ID",
+    "Shipping Address (name)",
+    "Shipping Address (email)",
+    "Shipping Address (phone)",
+    "Shipping Address (line1)",
+    "Shipping Address (line2)",
+    "Shipping Address (city)",
+    "Shipping Address (state)",
+    "Shipping Address (country)",
+    "Shipping Address (zip)",
+]
+CONSIGNMENT_GROUP_KEY = [
+    "Customer ID",
+    "Warehouse ID",
+    "Consignment Number",
+    "Shipping Address",
+]
+
+# Function to group queued rows by key_fields, keeping the order rows were added in
+def group_rows(rows, key_fields, identity_field):
+    groups = {}
+    for index, row in enumerate(rows):
+        if not row.get(identity_field) or not key_fields:
+            groups[("row", index)] = [row]
+            continue
+        key = tuple(json.dumps(row.get(field), sort_keys=True, default=str) for field in key_fields)
+        groups.setdefault(key, []).append(row)
+    return list(groups.values())
+
+# Order-level fields, outside the grouping key, that every row of one order or
+# consignment must agree on. Blank values don't count as a disagreement, and dates
+# are compared by day because a blank date is filled in with the validation time.
+ORDER_LEVEL_FIELDS = ["Order Date", "Carrier", "Insurance Required", "Validate Address"]
+CONSIGNMENT_LEVEL_FIELDS = [
+    "Consignment Date", "Order ID", "Supplier/Vendor", "Carrier", "Tracking Number",
+    "Standard/Dropship", "Dropship Type", "Dropship Data",
+]
+DATE_FIELDS = ["Order Date", "Consignment Date"]
+
+# Function to describe the order-level fields the rows of a group disagree on, or None
+def group_conflict(group, fields, identity_field):
+    conflicts = []
+    for field in fields:
+        values = set()
+        for row in group:
+            value = row.get(field)
+            if value in (None, "", [], {}):
+                continue
+            if field in DATE_FIELDS and isinstance(value, (int, float)):
+                value = time.strftime("%Y-%m-%d", time.gmtime(value / 1000))
+            values.add(json.dumps(value, sort_keys=True, default=str))
+        if len(values) > 1:
+            conflicts.append(field)
+    if conflicts:
+        return f"Rows with {identity_field} {group[0].get(identity_field)} disagree on {', '.join(conflicts)}"
+    return None
+
+# Functions to build one payload for a group of rows. Order-level fields come
+# from the first row, after checking the other rows agree; every row contributes
+# its line items.
+def create_grouped_order_data(group, client, database, tenant_id, prefetched=None):
+    conflict = group_conflict(group, ORDER_LEVEL_FIELDS, "Order ID")
+    if conflict:
+        raise ValueError(conflict)
+    order_data = create_order_data(group[0], client, database, tenant_id, prefetched)
+    for order in group[1:]:
+        order_data["orderLineItems"].extend(create_order_data(order, client, database, tenant_id, prefetched)["orderLineItems"])
+    return order_data
+
+def create_grouped_consignment_data(group, client, database, tenant_id, prefetched=None):
+    conflict = group_conflict(group, CONSIGNMENT_LEVEL_FIELDS, "Consignment Number")
+    if conflict:
+        raise ValueError(conflict)
+    consignment_data = create_consignment_data(group[0], client, database, tenant_id, prefetched)
+    for consignment in group[1:]:
+        consignment_data["items"].extend(create_consignment_data(consignment, client, database, tenant_id, prefetched)["items"])
+    return consignment_data
+
+# How each kind of queued row is grouped, built and saved. Shared by the submit
+# buttons, the background job worker and ingest.py.
+SUBMIT_KINDS = {
+    "order": {
+        "group_key": ORDER_GROUP_KEY,
+        "identity_field": "Order ID",
+        "order_level_fields": ORDER_LEVEL_FIELDS,
+        "build": create_grouped_order_data,
+        "save_batch": save_orders_batch,
+        "mutation": "saveOrder",
+        "success_messages": ORDER_SUCCESS_MESSAGES,
+        "prefetch": ["productvariant", "skubinmapping"],
+    },
+    "consignment": {
+        "group_key": CONSIGNMENT_GROUP_KEY,
+        "identity_field": "Consignment Number",
+        "order_level_fields": CONSIGNMENT_LEVEL_FIELDS,
+        "build": create_grouped_consignment_data,
+        "save_batch": save_consignments_batch,
+        "mutation": "saveConsignment",
+        "success_messages": CONSIGNMENT_SUCCESS_MESSAGES,
+        "prefetch": ["productvariant"],
+    },
+}
+
+# Function to build and save groups of rows in batches of aliased mutations.
+# Returns one result dict per group like submit_in_batches; on_batch(batch, results)
+# is called with each batch's (success, message) pairs as soon as the API answers.
+# Groups whose rows disagree on order-level fields are failed without being sent,
+# so they don't fail the rest of their batch.
+def submit_groups(groups, kind, client, database, url, email, password, tenant_id, tenant_name, prefetched,
+                  on_batch=None, **options):
+    settings = SUBMIT_KINDS[kind]
+
+    def submit_batch(batch):
+        payloads = [settings["build"](group, client, database, tenant_id, prefetched) for group in batch]
+        responses = graphql_client.with_batch_token_refresh(
+            lambda token, items: settings["save_batch"](url, token, items, tenant_id, tenant_name),
+            payloads,
+            lambda stale_token=None: get_auth_token(url, email, password, tenant_id, tenant_name, stale_token)
+        )
+        results = [check_save_response(response, settings["mutation"], settings["success_messages"]) for response in responses]
+        if on_batch:
+            on_batch(batch, results)
+        return results
+
+    results = [None] * len(groups)
+    sendable = []
+    for position, group in enumerate(groups):
+        conflict = group_conflict(group, settings["order_level_fields"], settings["identity_field"])
+        if conflict:
+            results[position] = {"success": False, "message": conflict, "attempts": 0}
+        else:
+            sendable.append(position)
+    for position, result in zip(sendable, submit_in_batches([groups[position] for position in sendable], submit_batch, **options)):
+        results[position] = result
+    return results
+
+# Function to show the per-item results of a submission and return the rows that failed
+def display_submission_results(groups, results, label):
+    succeeded = sum(1 for result in results if result["success"])
+    failed = len(results) - succeeded
+    if failed:
+        st.toast(f"{succeeded} {label.lower()}s created, {failed} failed", icon="❌")
+    else:
+        st.toast(f"All {succeeded} {label.lower()}s created successfully", icon="✅")
+
+    st.dataframe(pd.DataFrame([
+        {
+            label: i,
+            "Rows": len(group),
+            "Status": "Created" if result["success"] else "Failed",
+            "Attempts": result["attempts"],
+            "Message": result["message"],
+        }
+        for i, (group, result) in enumerate(zip(groups, results), 1)
+    ]), hide_index=True)
+
+    return [row for group, result in zip(groups, results) if not result["success"] for row in group]
+
+# Function to pick the worksheet of an .xlsx upload, given its open workbook (None
+# for a CSV). Returns (chosen, sheet name, {sheet: row count}); chosen is False
+# until the user picks one of several sheets.
+def choose_sheet(upload, key, workbook):
+    if workbook is None:
+        return True, None, {}
+    sheet_sizes = xlsx_sheet_sizes(workbook)
+    sheet_name = next(iter(sheet_sizes), None)
+    if len(sheet_sizes) > 1:
+        sheet_name = st.selectbox("Sheet", list(sheet_sizes), index=None, placeholder="Choose a sheet", key=f"{key}_sheet_{upload.file_id}")
+    return sheet_name is not None, sheet_name, sheet_sizes
+
+# Function to stream an uploaded file through ingest_chunks into the session queue.
+# Streamlit reruns the script on every widget change, so each upload's progress
+# is kept in the session: rows already queued are never added again, an upload
+# that failed part way resumes after its last complete chunk, and the summary
+# stays on screen.
+def ingest_upload(upload, kind, queue_key, label, client, database, tenant_id):
+    chunk_size = int(st.secrets.get("CSV_CHUNK_SIZE", 5000))
+    # The workbook is opened once for both the sheet list and the rows
+    workbook = open_xlsx(upload) if upload.name.lower().endswith(".xlsx") else None
+    try:
+        chosen, sheet_name, sheet_sizes = choose_sheet(upload, queue_key, workbook)
+        if not chosen:
+            return
+
+        uploads = st.session_state.setdefault("ingested_uploads", {})
+        state = uploads.setdefault(
+            (upload.file_id, sheet_name), {"processed_rows": 0, "added": 0, "errors": [], "mapping": None, "done": False}
+        )
+        if not state["done"]:
+            if workbook is not None:
+                chunks = read_xlsx_chunks(workbook, sheet_name, chunk_size)
+            else:
+                chunks = read_csv_chunks(upload, chunk_size)
+            # Chunks queued by an earlier attempt are skipped
+            chunks = (df for df in chunks if len(df) and df.index[-1] >= state["processed_rows"])
+            progress = st.progress(0.0, text=f"Reading {upload.name}...")
+            queue = st.session_state.setdefault(queue_key, [])
+
+            def read_fraction(rows_read):
+                if sheet_name is not None:
+                    return min(rows_read / sheet_sizes[sheet_name], 1.0) if sheet_sizes[sheet_name] else 0.0
+                # The CSV reader consumes the upload sequentially, so its position tracks progress
+                return min(upload.tell() / upload.size, 1.0) if upload.size else 1.0
+
+            # Moves the bar through the current chunk while its free-text rows are extracted,
+            # starting from the rows already read
+            fraction = 0.0
+            def extraction_progress(chunk_rows, done, total):
+                end = read_fraction(state["processed_rows"] + chunk_rows)
+                progress.progress(
+                    fraction + (end - fraction) * done / total,
+                    text=f"Processed {state['processed_rows']} rows, extracting fields from free text: {done}/{total}"
+                )
+
+            for result in ingest_chunks(chunks, kind, client, database, tenant_id, state["mapping"], extraction_progress, **llm_extraction_settings()):
+                queue.extend(result["validated"])
+                state["processed_rows"] += result["rows"]
+                state["added"] += len(result["validated"])
+                state["errors"].extend((result["file_rows"][index], message) for index, message in result["errors"])
+                state["mapping"] = result["mapping"]
+                fraction = read_fraction(state["processed_rows"])
+                progress.progress(
+                    fraction, text=f"Processed {state['processed_rows']} rows: {state['added']} {label.lower()}s added, {len(state['errors'])} failed"
+                )
+            progress.empty()
+            state["done"] = True
+
+        st.success(f"{state['added']} of {state['processed_rows']} {label.lower()}s from {upload.name} added.")
+        if state["errors"]:
+            st.error(f"{len(state['errors'])} rows could not be added.")
+            st.dataframe(
+                pd.DataFrame([{"Row": file_row, "Error": message} for file_row, message in state["errors"]]),
+                hide_index=True
+            )
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+# Columns shown in the queue tables; the full record is available in the detail view
+ORDER_QUEUE_COLUMNS = ["Order ID", "Warehouse Name/Code", "Customer Name/Code", "Product SKU", "Quantity", "Carrier"]
+CONSIGNMENT_QUEUE_COLUMNS = ["Consignment Number", "Warehouse Name/Code", "Customer Name/Code", "Product SKU", "Quantity", "Standard/Dropship"]
+
+# Function to show one page of the queue as a table plus a single-record detail view,
+# so a rerun renders the same amount no matter how many records are queued
+def display_queue(queue, label, columns, key):
+    page_size = max(1, int(st.secrets.get("QUEUE_PAGE_SIZE", 50)))
+    pages = (len(queue) - 1) // page_size + 1
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page") if pages > 1 else 1
+    start = (page - 1) * page_size
+    records = queue[start:start + page_size]
+
+    table = pd.DataFrame([{column: record.get(column, "") for column in columns} for record in records], columns=columns)
+    table.insert(0, "#", range(start + 1, start + len(records) + 1))
+    st.dataframe(table.astype(str), hide_index=True)
+
+    selected = st.selectbox(
+        f"Show full details of {label.lower()}", range(start + 1, start + len(records) + 1),
+        index=None, placeholder=f"Choose a {label.lower()} number", key=f"{key}_detail"
+    )
+    if selected is not None:
+        st.json(queue[selected - 1])
+
+# Job store and background workers shared by every session. Uploads processed
+# as jobs survive browser refreshes and server restarts: the workers checkpoint
+# after every chunk and batch, and resume interrupted jobs from there.
+@st.cache_resource
+def get_job_store(path):
+    return jobs.JobStore(path)
+
+@st.cache_resource
+def start_job_runner(path, workers, lease, url, email, password, _client, _database):
+    return jobs.JobRunner(
+        get_job_store(path),
+        lambda store, job, owner: run_job(store, job, owner, _client, _database, url, email, password),
+        workers=workers,
+        lease=lease
+    ).start()
+
+def job_store():
+    return get_job_store(st.secrets.get("JOBS_DB_PATH", jobs.DEFAULT_PATH))
+
+def read_job_chunks(job, chunk_size):
+    if job["file_path"].lower().endswith(".xlsx"):
+        return read_xlsx_chunks(job["file_path"], job["sheet"], chunk_size)
+    return read_csv_chunks(job["file_path"], chunk_size)
+
+# Runs the current stage of a job on a worker thread. Validation skips the chunks
+# that were checkpointed before; submission only sends rows not yet saved.
+def run_job(store, job, owner, client, database, url, email, password):
+    current_tenant.set(job["tenant_name"])
+    options = job["options"]
+
+    if job["stage"] == "validate":
+        processed = job["processed_rows"]
+        chunks = (df for df in read_job_chunks(job, options["chunk_size"]) if len(df) and df.index[-1] >= processed)
+        for result in ingest_chunks(
+            chunks, job["kind"], client, database, job["tenant_id"], options.get("mapping"), **options["extraction"]
+        ):
+            rows = [(index, "valid", "", record) for index, record in zip(result["indexes"], result["validated"])]
+            rows += [(index, "invalid", message, None) for index, message in result["errors"]]
+            processed += result["rows"]
+            options["mapping"] = result["mapping"]
+            store.checkpoint_rows(job["id"], owner, rows, processed, options)
+
+        if not store.get(job["id"])["submit"]:
+            store.update(job["id"], owner, status="waiting")
+            return
+        store.update(job["id"], owner, stage="submit")
+
+    submit_job(store, job, owner, client, database, url, email, password)
+    store.update(job["id"], owner, status="done")
+
+def submit_job(store, job, owner, client, database, url, email, password):
+    settings = SUBMIT_KINDS[job["kind"]]
+    pending = store.pending_rows(job["id"])
+    records = [record for _, record in pending]
+    row_of = {id(record): row for row, record in pending}
+
+    group_key = job["options"].get("group_key", settings["group_key"]) if job["options"]["group"] else []
+    groups = group_rows(records, group_key, settings["identity_field"])
+    prefetched = prefetch_product_data(records, database, job["tenant_id"], job["kind"])
+
+    # Checkpoint every order or consignment of a batch as soon as the API answers
+    def checkpoint(batch, results):
+        for group, (success, message) in zip(batch, results):
+            store.set_row_status(job["id"], owner, [row_of[id(record)] for record in group], "saved" if success else "failed", message)
+
+    # Groups are sent one round of parallel batches at a time, checking for
+    # cancellation in between, so rows of a cancelled job that weren't sent stay valid
+    submission = job["options"]["submission"]
+    round_size = max(1, submission.get("batch_size", 10)) * max(1, submission.get("max_workers", 8))
+    for start in range(0, len(groups), round_size):
+        store.check_owner(job["id"], owner)
+        round_groups = groups[start:start + round_size]
+        results = submit_groups(
+            round_groups, job["kind"], client, database, url, email, password, job["tenant_id"], job["tenant_name"], prefetched,
+            on_batch=checkpoint, **submission
+        )
+        for group, result in zip(round_groups, results):
+            if not result["success"]:
+                store.set_row_status(job["id"], owner, [row_of[id(record)] for record in group], "failed", result["message"])
+
+# Function to hand an upload to the background workers instead of processing it in the rerun
+def enqueue_upload(upload, kind, key, tenant_id, tenant_name, submit, group):
+    workbook = open_xlsx(upload) if upload.name.lower().endswith(".xlsx") else None
+    try:
+        chosen, sheet_name, _ = choose_sheet(upload, key, workbook)
+    finally:
+        if workbook is not None:
+            workbook.close()
+    if not chosen:
+        return
+
+    enqueued = st.session_state.setdefault("enqueued_uploads", set())
+    if (upload.file_id, sheet_name) in enqueued:
+        return
+    enqueued.add((upload.file_id, sheet_name))
+
+    settings = SUBMIT_KINDS[kind]
+    options = {
+        "chunk_size": int(st.secrets.get("JOB_CHUNK_SIZE", 500)),
+        "extraction": llm_extraction_settings(),
+        "submission": submission_settings(),
+        "group": group,
+    }
+    if group:
+        options["group_key"] = list(st.secrets.get(f"{kind.upper()}_GROUP_KEY", settings["group_key"]))
+    job_store().create_job(kind, tenant_id, tenant_name, upload.name, upload.getvalue(), sheet_name, submit, options)
+    st.success(f"{upload.name} was queued for background processing.")
+
+# Polls the status of this tenant's background jobs without rerunning the page
+@st.fragment(run_every=2)
+def display_jobs(kind, tenant_id, label):
+    store = job_store()
+    tenant_jobs = [job for job in store.list_jobs(tenant_id) if job["kind"] == kind]
+    if not tenant_jobs:
+        return
+
+    st.markdown(f"#### Background {label.lower()} uploads")
+    for job in tenant_jobs:
+        counts = store.counts(job["id"])
+        summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "no rows yet"
+        status = f"{job['status']} ({job['stage']})" if job["status"] in ("queued", "running") else job["status"]
+        name = f"{job['filename']} ({job['sheet']})" if job["sheet"] else job["filename"]
+        st.write(f"**{name}**: {status}, {job['processed_rows']} rows read, {summary}")
+        if job["error"]:
+            st.error(job["error"])
+
+        columns = st.columns(3)
+        if job["status"] == "waiting" and columns[0].button("Submit", key=f"job_submit_{job['id']}"):
+            store.request_submit(job["id"])
+        if job["status"] in ("queued", "running", "waiting") and columns[1].button("Cancel", key=f"job_cancel_{job['id']}"):
+            store.cancel(job["id"])
+        if counts:
+            columns[2].download_button(
+                "Results", "".join(json.dumps(row) + "\n" for row in store.results(job["id"])),
+                f"{job['id']}.jsonl", "application/json", key=f"job_results_{job['id']}"
+            )
+
 def create_order(client, database, url, email, password, tenant_id, tenant_name):
     st.write("Sure, I can help you with that. Please input the following details or upload a CSV file.")
 
@@ -857,11 +2245,26 @@ def create_order(client, database, url, email, password, tenant_id, tenant_name)
     # Expander for text input details
     with st.expander("Enter Order Details Here:"):
         order_input = st.text_area("Enter order details here:")
+        one_per_line = st.checkbox("One order per line", key="order_lines")
         if st.button("Add Order"):
-            if order_input.strip():
-                missing_fields_response = check_mandatory_fields(order_input, client)
-                if "All mandatory fields are present" in missing_fields_response:
-                    order_data = json_from_user_input_order(order_input, client)
+            if order_input.strip() and one_per_line:
+                rows = extract_lines(order_input, client, ORDER_MANDATORY_FIELDS, ORDER_OPTIONAL_FIELDS, ORDER_EXTRACTION_INSTRUCTIONS)
+                references = resolve_references([row for _, row, missing in rows if not missing], database, tenant_id)
+                for index, order, missing_fields in rows:
+                    if not missing_fields:
+                        validate, validated_order = validate_order_fields(order, client, database, tenant_id, references)
+                        if validate == "Yes":
+                            if 'orders' not in st.session_state:
+                                st.session_state.orders = []
+                            st.session_state.orders.append(validated_order)
+                            st.success(f"Order from line {index+1} added.")
+                        else:
+                            st.error(f"Validation failed for line {index+1}: {validate}")
+                    else:
+                        st.error(f"Missing mandatory fields for line {index+1}: {', '.join(missing_fields)}")
+            elif order_input.strip():
+                order_data, missing_fields = extract_order_fields(order_input, client)
+                if not missing_fields:
                     validate, validated_order = validate_order_fields(order_data, client, database, tenant_id)
                     if validate == "Yes":
                         if 'orders' not in st.session_state:
@@ -871,66 +2274,56 @@ def create_order(client, database, url, email, password, tenant_id, tenant_name)
                     else:
                         st.error(f"Validation failed: {validate}")
                 else:
-                    st.error(f"Missing mandatory fields: {missing_fields_response}")
+                    st.error(f"Missing mandatory fields: {', '.join(missing_fields)}")
 
     # Display list of orders
     st.markdown("### Orders to be Submitted")
     if 'orders' in st.session_state and st.session_state.orders:
         with st.expander(f"View {len(st.session_state.orders)} Orders to be Submitted"):
-            for i, order in enumerate(st.session_state.orders, 1):
-                st.write(f"**Order {i}:**")
-                st.json(order)
+            display_queue(st.session_state.orders, "Order", ORDER_QUEUE_COLUMNS, "order_queue")
+
+        group_orders = st.checkbox(
+            "Combine rows with the same customer, warehouse, Order ID and shipping address into one order",
+            value=True, key="group_orders"
+        )
 
         # Final Submit Button
         if st.button("Submit All Orders"):
-            token = login(url, email, password, tenant_id, tenant_name)
             progress_bar = st.progress(0)
-            total_orders = len(st.session_state.orders)
-            for i, order in enumerate(st.session_state.orders, 1):
-                order_payload = create_order_data(order, client, database)
-                response = save_order(url, token, order_payload, tenant_id, tenant_name)
-                if 'data' in response and response['data']:
-                    if any(success_message in response['data'].get('saveOrder', {}).get('message', '') for success_message in ("Order saved successfully", "Order successfully saved")):
-                        st.toast(f"Order {i} created successfully", icon="✅")
-                    else:
-                        st.toast(f"Order {i} creation failed: {response['data'].get('saveOrder', {}).get('message', 'Unknown error')}", icon="❌")
-                elif 'errors' in response:
-                    st.toast(f"Order {i} errors: {response['errors']}", icon="❌")
-                else:
-                    st.toast(f"An unknown error occurred with Order {i}", icon="❌")
-                progress_bar.progress(i / total_orders)
-            st.session_state.orders = []  # Clear orders after submission
+
+            groups = group_rows(
+                st.session_state.orders,
+                st.secrets.get("ORDER_GROUP_KEY", ORDER_GROUP_KEY) if group_orders else [],
+                "Order ID"
+            )
+
+            # Fetch every product up front so building the payloads needs no database reads
+            prefetched = prefetch_product_data(st.session_state.orders, database, tenant_id, "order")
+
+            results = submit_groups(
+                groups, "order", client, database, url, email, password, tenant_id, tenant_name, prefetched,
+                on_progress=lambda done, total: progress_bar.progress(done / total, text=f"Submitted {done} of {total} orders ({len(st.session_state.orders)} rows)"),
+                **submission_settings()
+            )
+            # Keep failed orders queued so they can be fixed or resubmitted
+            st.session_state.orders = display_submission_results(groups, results, "Order")
     else:
         st.write("No orders added yet.")
 
     # Button for uploading CSV within an expander for better organization
-    with st.expander("Or Upload a CSV File with Order Details:"):
-        csv_file = st.file_uploader("", type=['csv'])
+    with st.expander("Or Upload a CSV or Excel File with Order Details:"):
+        csv_file = st.file_uploader("", type=['csv', 'xlsx'])
+        background = st.checkbox("Process in the background (continues if this page is closed)", key="order_background")
+        auto_submit = background and st.checkbox("Submit the valid orders when validation finishes", key="order_auto_submit")
         if csv_file:
             try:
-                df = pd.read_csv(csv_file)
-
-                for index, row in df.iterrows():
-                    # Convert row to dictionary and prepare order details string
-                    row_dict = row.to_dict()
-                    order_details = ", ".join([f"{k}: {v}" for k, v in row_dict.items() if pd.notna(v)])
-
-                    # Check for missing mandatory fields
-                    missing_fields_response = check_mandatory_fields(order_details, client)
-                    if "All mandatory fields are present" in missing_fields_response:
-                        order = json_from_user_input_order(order_details, client)
-                        validate, validated_order = validate_order_fields(order, client, database, tenant_id)
-                        if validate == "Yes":
-                            if 'orders' not in st.session_state:
-                                st.session_state.orders = []
-                            st.session_state.orders.append(validated_order)
-                            st.success(f"Order from row {index+1} added.")
-                        else:
-                            st.error(f"Validation failed for row {index+1}: {validate}")
-                    else:
-                        st.error(f"Missing mandatory fields for row {index+1}: {missing_fields_response}")
+                if background:
+                    enqueue_upload(csv_file, "order", "orders", tenant_id, tenant_name, auto_submit, st.session_state.get("group_orders", True))
+                else:
+                    ingest_upload(csv_file, "order", "orders", "Order", client, database, tenant_id)
             except Exception as e:
-                st.error("Cannot read CSV: " + str(e))
+                st.error("Cannot read file: " + str(e))
+        display_jobs("order", tenant_id, "Order")
 
 def create_consignment(client, database, url, email, password, tenant_id, tenant_name):
     st.write("Sure, I can help you with that. Please input the following consignment details or upload a CSV file.")
@@ -972,11 +2365,26 @@ def create_consignment(client, database, url, email, password, tenant_id, tenant
     # Expander for text input details
     with st.expander("Enter Consignment Details Here:"):
         consignment_input = st.text_area("Enter consignment details here:")
+        one_per_line = st.checkbox("One consignment per line", key="consignment_lines")
         if st.button("Add Consignment"):
-            if consignment_input.strip():
-                missing_fields_response = check_mandatory_fields(consignment_input, client)
-                if "All mandatory fields are present" in missing_fields_response:
-                    consignment_data = json_from_user_input_consignment(consignment_input, client)
+            if consignment_input.strip() and one_per_line:
+                rows = extract_lines(consignment_input, client, CONSIGNMENT_MANDATORY_FIELDS, CONSIGNMENT_OPTIONAL_FIELDS, CONSIGNMENT_EXTRACTION_INSTRUCTIONS)
+                references = resolve_references([row for _, row, missing in rows if not missing], database, tenant_id)
+                for index, consignment, missing_fields in rows:
+                    if not missing_fields:
+                        validate, validated_consignment = validate_consignment_fields(consignment, client, database, tenant_id, references)
+                        if validate == "Yes":
+                            if 'consignments' not in st.session_state:
+                                st.session_state.consignments = []
+                            st.session_state.consignments.append(validated_consignment)
+                            st.success(f"Consignment from line {index+1} added.")
+                        else:
+                            st.error(f"Validation failed for line {index+1}: {validate}")
+                    else:
+                        st.error(f"Missing mandatory fields for line {index+1}: {', '.join(missing_fields)}")
+            elif consignment_input.strip():
+                consignment_data, missing_fields = extract_consignment_fields(consignment_input, client)
+                if not missing_fields:
                     validate, validated_consignment = validate_consignment_fields(consignment_data, client, database, tenant_id)
                     if validate == "Yes":
                         if 'consignments' not in st.session_state:
@@ -986,70 +2394,59 @@ def create_consignment(client, database, url, email, password, tenant_id, tenant
                     else:
                         st.error(f"Validation failed: {validate}")
                 else:
-                    st.error(f"Missing mandatory fields: {missing_fields_response}")
+                    st.error(f"Missing mandatory fields: {', '.join(missing_fields)}")
 
     # Display list of consignments
     st.markdown("### Consignments to be Submitted")
     if 'consignments' in st.session_state and st.session_state.consignments:
         with st.expander(f"View {len(st.session_state.consignments)} Consignments to be Submitted"):
-            for i, consignment in enumerate(st.session_state.consignments, 1):
-                st.write(f"**Consignment {i}:**")
-                st.json(consignment)
+            display_queue(st.session_state.consignments, "Consignment", CONSIGNMENT_QUEUE_COLUMNS, "consignment_queue")
+
+        group_consignments = st.checkbox(
+            "Combine rows with the same customer, warehouse, Consignment Number and shipping address into one consignment",
+            value=True, key="group_consignments"
+        )
 
         # Final Submit Button
         if st.button("Submit All Consignments"):
-            token = login(url, email, password, tenant_id, tenant_name)
             progress_bar = st.progress(0)
-            total_consignments = len(st.session_state.consignments)
-            for i, consignment in enumerate(st.session_state.consignments, 1):
-                consignment_payload = create_consignment_data(consignment, client, database)
-                response = save_consignment(url, token, consignment_payload, tenant_id, tenant_name)
-                if 'data' in response and response['data']:
-                    if any(success_message in response['data'].get('saveConsignment', {}).get('message', '') for success_message in ("Consignment added successfully", "Consignment successfully added")):
-                        st.toast(f"Consignment {i} created successfully", icon="✅")
-                    else:
-                        st.toast(f"Consignment {i} creation failed: {response['data'].get('saveConsignment', {}).get('message', 'Unknown error')}", icon="❌")
-                elif 'errors' in response:
-                    st.toast(f"Consignment {i} errors: {response['errors']}", icon="❌")
-                else:
-                    st.toast(f"An unknown error occurred with Consignment {i}", icon="❌")
-                progress_bar.progress(i / total_consignments)
-            st.session_state.consignments = []  # Clear consignments after submission
+
+            groups = group_rows(
+                st.session_state.consignments,
+                st.secrets.get("CONSIGNMENT_GROUP_KEY", CONSIGNMENT_GROUP_KEY) if group_consignments else [],
+                "Consignment Number"
+            )
+
+            # Fetch every product up front so building the payloads needs no database reads
+            prefetched = prefetch_product_data(st.session_state.consignments, database, tenant_id, "consignment")
+
+            results = submit_groups(
+                groups, "consignment", client, database, url, email, password, tenant_id, tenant_name, prefetched,
+                on_progress=lambda done, total: progress_bar.progress(done / total, text=f"Submitted {done} of {total} consignments ({len(st.session_state.consignments)} rows)"),
+                **submission_settings()
+            )
+            # Keep failed consignments queued so they can be fixed or resubmitted
+            st.session_state.consignments = display_submission_results(groups, results, "Consignment")
     else:
         st.write("No consignments added yet.")
 
     # Button for uploading CSV within an expander for better organization
-    with st.expander("Or Upload a CSV File with Consignment Details:"):
-        csv_file = st.file_uploader("", type=['csv'])
+    with st.expander("Or Upload a CSV or Excel File with Consignment Details:"):
+        csv_file = st.file_uploader("", type=['csv', 'xlsx'])
+        background = st.checkbox("Process in the background (continues if this page is closed)", key="consignment_background")
+        auto_submit = background and st.checkbox("Submit the valid consignments when validation finishes", key="consignment_auto_submit")
         if csv_file:
             try:
-                df = pd.read_csv(csv_file)
-
-                for index, row in df.iterrows():
-                    # Convert row to dictionary and prepare consignment details string
-                    row_dict = row.to_dict()
-                    consignment_details = ", ".join([f"{k}: {v}" for k, v in row_dict.items() if pd.notna(v)])
-
-                    # Check for missing mandatory fields
-                    missing_fields_response = check_mandatory_fields(consignment_details, client)
-                    if "All mandatory fields are present" in missing_fields_response:
-                        consignment = json_from_user_input_consignment(consignment_details, client)
-                        validate, validated_consignment = validate_consignment_fields(consignment, client, database, tenant_id)
-                        if validate == "Yes":
-                            if 'consignments' not in st.session_state:
-                                st.session_state.consignments = []
-                            st.session_state.consignments.append(validated_consignment)
-                            st.success(f"Consignment from row {index+1} added.")
-                        else:
-                            st.error(f"Validation failed for row {index+1}: {validate}")
-                    else:
-                        st.error(f"Missing mandatory fields for row {index+1}: {missing_fields_response}")
+                if background:
+                    enqueue_upload(csv_file, "consignment", "consignments", tenant_id, tenant_name, auto_submit, st.session_state.get("group_consignments", True))
+                else:
+                    ingest_upload(csv_file, "consignment", "consignments", "Consignment", client, database, tenant_id)
             except Exception as e:
-                st.error("Cannot read CSV: " + str(e))
+                st.error("Cannot read file: " + str(e))
+        display_jobs("consignment", tenant_id, "Consignment")
 
 
-def process_user_input(user_input, client, database, url, email, password, tenant_id, tenant_name):
-
+def classify_intent_with_llm(user_input, client):
     prompt = f"""
     You will be provided with the user's text delimited by triple quotes.
     If the user wants to create an order, write "Create order".
@@ -1064,12 +2461,38 @@ def process_user_input(user_input, client, database, url, email, password, tenan
 
     \"\"\"{user_input}\"\"\"
     """
-    response = get_completion(prompt, client)
+    return get_completion(prompt, client)
 
-    if response == "Create order":
+# Common phrasings are routed locally; the LLM is only asked when the local router
+# isn't confident, and its reply is mapped back onto the known intents
+def classify_intent(user_input, client):
+    intent, confidence, source = intent_router.router.classify(
+        user_input, st.secrets.get("INTENT_CONFIDENCE_THRESHOLD", intent_router.router.threshold)
+    )
+    record_fast_path("intent", intent is not None)
+    if intent is None:
+        intent = intent_router.normalize_intent(classify_intent_with_llm(user_input, client))
+    return intent
+
+# Streamlit reruns main() on every widget interaction while the text input holds
+# a value, so the routed intent is kept per session and keyed on the input text.
+# The classifier only runs once per distinct input.
+def route_intent(user_input, client):
+    routes = st.session_state.setdefault("intent_routes", {})
+    key = " ".join(user_input.split())
+    if key in routes:
+        st.session_state.intent_calls_saved = st.session_state.get("intent_calls_saved", 0) + 1
+        return routes[key]
+    routes[key] = classify_intent(user_input, client)
+    return routes[key]
+
+def process_user_input(user_input, client, database, url, email, password, tenant_id, tenant_name):
+    response = route_intent(user_input, client)
+
+    if response == intent_router.CREATE_ORDER:
         create_order(client, database, url, email, password, tenant_id, tenant_name)
 
-    elif response == "Create consignment":
+    elif response == intent_router.CREATE_CONSIGNMENT:
         create_consignment(client, database, url, email, password, tenant_id, tenant_name)
 
     else:
@@ -1082,12 +2505,51 @@ def process_user_input(user_input, client, database, url, email, password, tenan
             st.write("Thank you! If you need further assistance, just ask.")
 
 
+def display_fast_path_stats():
+    stats = fast_path_stats()
+    with st.sidebar.expander("Local parsing stats"):
+        for kind, label in (("date", "Dates"), ("quantity", "Quantities"), ("intent", "Chat intents")):
+            counts = stats[kind]
+            st.write(f"{label}: {counts['fast']} parsed locally, {counts['llm']} sent to the LLM ({counts['fast_rate']:.0%} fast path)")
+
+
+def display_llm_cache_stats():
+    stats = llm_cache.get_cache().stats()
+    with st.sidebar.expander("LLM response cache"):
+        st.write(f"{stats['entries']} cached responses, {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        st.write(f"{stats['bypassed']} calls not cached (temperature > 0)")
+        st.write(f"{len(st.session_state.get('intent_routes', {}))} inputs classified, {st.session_state.get('intent_calls_saved', 0)} classification calls saved this session")
+
+def display_reference_cache_stats(tenant_id):
+    stats = reference_cache.stats()
+    with st.sidebar.expander("Reference data cache"):
+        st.write(f"{stats['entries']} / {stats['max_entries']} entries, {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        for kind, counts in sorted(stats["kinds"].items()):
+            st.write(f"{kind}: {counts['hits']} hits, {counts['negative_hits']} negative hits, {counts['misses']} misses, {counts['evictions']} evictions")
+        if tenant_id and st.button("Refresh reference data"):
+            removed = reference_cache.invalidate(tenant_id)
+            st.write(f"Cleared {removed} cached entries for this tenant.")
+
+
+def display_metrics():
+    rows = metrics.snapshot()
+    with st.sidebar.expander("Metrics"):
+        if not rows:
+            st.write("No calls recorded yet.")
+            return
+        table = pd.DataFrame(rows)[["stage", "tenant", "count", "errors", "mean_ms", "p50_ms", "p95_ms", "prompt_tokens", "completion_tokens"]]
+        st.dataframe(table.round(1), hide_index=True)
+        st.download_button("Export JSON lines", metrics.to_json_lines(), "metrics.jsonl", "application/json")
+        st.download_button("Export Prometheus text", metrics.to_prometheus(), "metrics.prom", "text/plain")
+
+
 # Main app logic
 def main():
 
-    client = OpenAI(
-        # This is the default and can be omitted
-        api_key=st.secrets["OPENAI_API_KEY"],
+    client = get_openai_client(
+        st.secrets["OPENAI_API_KEY"],
+        timeout=st.secrets.get("OPENAI_TIMEOUT", 60),
+        max_retries=st.secrets.get("OPENAI_MAX_RETRIES", 2),
     )
 
     mongo_url = st.secrets["UAT"]
@@ -1095,14 +2557,52 @@ def main():
     password = st.secrets["password"]
     url = st.secrets["url"]
 
-    database = database_connection(mongo_url)
+    graphql_client.configure(
+        pool_size=st.secrets.get("GRAPHQL_POOL_SIZE", 20),
+        connect_timeout=st.secrets.get("GRAPHQL_CONNECT_TIMEOUT", 5),
+        read_timeout=st.secrets.get("GRAPHQL_READ_TIMEOUT", 60),
+        gzip_min_bytes=st.secrets.get("GRAPHQL_GZIP_MIN_BYTES", 16384),
+    )
+
+    llm_cache.configure(
+        path=st.secrets.get("LLM_CACHE_PATH", llm_cache.DEFAULT_PATH),
+        max_entries=st.secrets.get("LLM_CACHE_MAX_ENTRIES", 100000),
+        ttl=st.secrets.get("LLM_CACHE_TTL", 7 * 24 * 3600),
+        cache_nondeterministic=st.secrets.get("LLM_CACHE_NONDETERMINISTIC", False),
+    )
+
+    reference_cache.configure(
+        ttl=st.secrets.get("REFERENCE_CACHE_TTL", 300),
+        negative_ttl=st.secrets.get("REFERENCE_CACHE_NEGATIVE_TTL", 60),
+        max_entries=st.secrets.get("REFERENCE_CACHE_MAX_ENTRIES", 50000)
+    )
+
+    database = database_connection(
+        mongo_url,
+        max_pool_size=st.secrets.get("MONGO_MAX_POOL_SIZE", 50),
+        connect_timeout_ms=st.secrets.get("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        server_selection_timeout_ms=st.secrets.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        socket_timeout_ms=st.secrets.get("MONGO_SOCKET_TIMEOUT_MS", 30000),
+    )
+    start_job_runner(
+        st.secrets.get("JOBS_DB_PATH", jobs.DEFAULT_PATH), int(st.secrets.get("JOB_WORKERS", 2)),
+        int(st.secrets.get("JOB_LEASE_SECONDS", 300)), url, email, password, client, database
+    )
+
     tenant_id, tenant_name = display_greeting(database)
+    # Metrics recorded from here on are attributed to the tenant
+    current_tenant.set(tenant_name or "unknown")
 
     if tenant_id and tenant_name:
         user_input = st.text_input("Your response:")
         if user_input:
             process_user_input(user_input, client, database, url, email, password, tenant_id, tenant_name)
 
+    display_fast_path_stats()
+    display_reference_cache_stats(tenant_id)
+    display_llm_cache_stats()
+    display_metrics()
+
 
 if __name__ == "__main__":
     main()
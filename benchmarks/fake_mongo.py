@@ -0,0 +1,191 @@
+import copy
+import threading
+import time
+
+from bson import ObjectId
+
+# In-process stand-in for the parts of pymongo the app uses: find, find_one,
+# aggregate ($match, $limit, $project, $addFields, $lookup) and inserts. Every
+# call sleeps for `latency` seconds to model a network round trip and is counted
+# per collection and operation.
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = FakeCollection(self, name)
+            return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def record(self, collection, operation):
+        with self.lock:
+            key = f"{collection}.{operation}"
+            self.calls[key] = self.calls.get(key, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+
+class FakeCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.documents = []
+
+    def insert_one(self, document):
+        document = dict(document)
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+        return type("InsertOneResult", (), {"inserted_id": document["_id"]})()
+
+    def insert_many(self, documents):
+        return [self.insert_one(document).inserted_id for document in documents]
+
+    def find(self, filter=None, projection=None):
+        self.database.record(self.name, "find")
+        return iter([project(document, projection) for document in self.documents if matches(document, filter or {})])
+
+    def find_one(self, filter=None, projection=None):
+        self.database.record(self.name, "find_one")
+        for document in self.documents:
+            if matches(document, filter or {}):
+                return project(document, projection)
+        return None
+
+    def aggregate(self, pipeline):
+        self.database.record(self.name, "aggregate")
+        return iter(run_pipeline(self.database, list(self.documents), pipeline, {}))
+
+
+def get_field(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def evaluate(expression, document, variables):
+    if isinstance(expression, str) and expression.startswith("$$"):
+        return variables.get(expression[2:])
+    if isinstance(expression, str) and expression.startswith("$"):
+        return get_field(document, expression[1:])
+    if isinstance(expression, dict) and len(expression) == 1:
+        operator, argument = next(iter(expression.items()))
+        if operator == "$toString":
+            value = evaluate(argument, document, variables)
+            return None if value is None else str(value)
+        if operator == "$eq":
+            left, right = (evaluate(item, document, variables) for item in argument)
+            return left == right
+        if operator == "$and":
+            return all(evaluate(item, document, variables) for item in argument)
+        if operator == "$or":
+            return any(evaluate(item, document, variables) for item in argument)
+        if operator == "$in":
+            value, options = (evaluate(item, document, variables) for item in argument)
+            return value in (options or [])
+    return expression
+
+
+def value_matches(value, condition):
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, argument in condition.items():
+            if operator == "$in":
+                candidates = value if isinstance(value, list) else [value]
+                if not any(candidate in argument for candidate in candidates):
+                    return False
+            elif operator == "$ne":
+                if value == argument:
+                    return False
+            elif operator == "$exists":
+                if (value is not None) != bool(argument):
+                    return False
+            else:
+                raise NotImplementedError(operator)
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(document, filter, variables=None):
+    for key, condition in filter.items():
+        if key == "$or":
+            if not any(matches(document, clause, variables) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, clause, variables) for clause in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, document, variables or {}):
+                return False
+        elif not value_matches(get_field(document, key), condition):
+            return False
+    return True
+
+
+def project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    result = {}
+    if projection.get("_id", 1):
+        result["_id"] = document.get("_id")
+    for key, include in projection.items():
+        if key != "_id" and include and key in document:
+            result[key] = copy.deepcopy(document[key])
+    return result
+
+
+def run_pipeline(database, documents, pipeline, variables):
+    for stage in pipeline:
+        operator, argument = next(iter(stage.items()))
+        if operator == "$match":
+            documents = [document for document in documents if matches(document, argument, variables)]
+        elif operator == "$limit":
+            documents = documents[:argument]
+        elif operator in ("$project", "$addFields"):
+            reshaped = []
+            for document in documents:
+                if operator == "$project":
+                    result = project(document, {key: 1 for key, value in argument.items() if value in (0, 1, True, False) and value})
+                    if argument.get("_id") == 0:
+                        result.pop("_id", None)
+                else:
+                    result = dict(document)
+                for key, value in argument.items():
+                    if value not in (0, 1, True, False):
+                        result[key] = evaluate(value, document, variables)
+                reshaped.append(result)
+            documents = reshaped
+        elif operator == "$lookup":
+            foreign = database[argument["from"]].documents
+            joined = []
+            for document in documents:
+                candidates = list(foreign)
+                if "localField" in argument:
+                    local_value = get_field(document, argument["localField"])
+                    candidates = [item for item in candidates if value_matches(get_field(item, argument["foreignField"]), local_value)]
+                if "pipeline" in argument:
+                    lookup_variables = {name: evaluate(expression, document, variables) for name, expression in argument.get("let", {}).items()}
+                    candidates = run_pipeline(database, candidates, argument["pipeline"], lookup_variables)
+                joined.append(dict(document, **{argument["as"]: candidates}))
+            documents = joined
+        else:
+            raise NotImplementedError(operator)
+    return documents
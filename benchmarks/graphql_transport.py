@@ -0,0 +1,84 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import graphql_client
+from benchmarks.stubs import GraphQLStubServer
+
+# Compares the pooled GraphQL transport with the previous bare requests.post
+# path against a local GraphQL stub.
+#
+#   python -m benchmarks.graphql_transport --calls 500 --workers 8 --latency 0.005
+
+QUERY = """
+mutation saveOrder($orderLineItems: [OrderLineItemInput], $customer: ID, $warehouse: ID) {
+    saveOrder(orderInput: {orderLineItems: $orderLineItems, customer: $customer, warehouse: $warehouse}) {
+        message
+    }
+}
+"""
+
+
+def sample_order(line_items):
+    return {
+        "warehouse": "65f1c0ffee0000000000beef",
+        "customer": "65f1c0ffee0000000000cafe",
+        "orderLineItems": [
+            {"productId": f"P{i}", "sku": f"SKU-{i}", "quantity": 1, "name": f"Product {i}", "attributes": {"color": "blue"}}
+            for i in range(line_items)
+        ],
+    }
+
+
+def legacy_post(url, token, variables, tenant_id, tenant_name):
+    # The request path used before graphql_client: a new connection per call
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {token}',
+        'tenant': f'{{"id":"{tenant_id}","name":"{tenant_name}","subdomain":"uat","code":"uat", "active": true}}'
+    }
+    return requests.post(url, json={'query': QUERY, 'variables': variables}, headers=headers).json()
+
+
+def pooled_post(url, token, variables, tenant_id, tenant_name):
+    return graphql_client.execute(url, QUERY, variables, tenant_id, tenant_name, token)
+
+
+def run(call, server, calls, workers, variables):
+    token = graphql_client.execute(server.url, "mutation login { login(username: \"u\", password: \"p\") { token } }", {}, "t", "bench")["data"]["login"]["token"]
+    requests_before, bytes_before = server.requests, server.bytes_received
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: call(server.url, token, variables, "t", "bench"), range(calls)))
+    elapsed = time.perf_counter() - started
+    return {
+        "calls_per_sec": calls / elapsed,
+        "elapsed_s": elapsed,
+        "bytes_per_call": (server.bytes_received - bytes_before) / max(server.requests - requests_before, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stub waits before answering")
+    parser.add_argument("--line-items", type=int, default=200, help="Line items per order, to exercise compression")
+    parser.add_argument("--gzip-min-bytes", type=int, default=16384)
+    args = parser.parse_args()
+
+    graphql_client.configure(pool_size=args.workers, gzip_min_bytes=args.gzip_min_bytes)
+    server = GraphQLStubServer(latency=args.latency).start()
+    variables = sample_order(args.line_items)
+    try:
+        for name, call in (("requests.post", legacy_post), ("graphql_client", pooled_post)):
+            result = run(call, server, args.calls, args.workers, variables)
+            print(f"{name:16} {result['calls_per_sec']:8.1f} calls/s  {result['elapsed_s']:6.2f} s  {result['bytes_per_call']:8.0f} bytes/call")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import os
+import statistics
+import time
+
+import intent_router
+
+# Accuracy and latency of the local intent router over labeled phrasings that are
+# not in its training examples. Phrases the router isn't confident about are
+# deferred to the LLM; with --llm they are sent to it (OPENAI_API_KEY from the
+# environment) so the overall accuracy of the combined routing is reported too.
+#
+#   python -m benchmarks.intent_router
+#   python -m benchmarks.intent_router --threshold 0.5 --llm
+
+LABELED_PHRASES = [
+    ("Create an order", intent_router.CREATE_ORDER),
+    ("I would like to create a new order please", intent_router.CREATE_ORDER),
+    ("please place an order for customer ACME", intent_router.CREATE_ORDER),
+    ("Can I make a new order?", intent_router.CREATE_ORDER),
+    ("need to submit some orders", intent_router.CREATE_ORDER),
+    ("help me create orders from a csv", intent_router.CREATE_ORDER),
+    ("create order for 5 units of SKU-123 from warehouse 554", intent_router.CREATE_ORDER),
+    ("I want to create an outbound order", intent_router.CREATE_ORDER),
+    ("new sales order", intent_router.CREATE_ORDER),
+    ("creat an ordr", intent_router.CREATE_ORDER),
+    ("i wanna order", intent_router.CREATE_ORDER),
+    ("let me add orders", intent_router.CREATE_ORDER),
+    ("Order creation", intent_router.CREATE_ORDER),
+    ("place order", intent_router.CREATE_ORDER),
+    ("I need an order created", intent_router.CREATE_ORDER),
+    ("Create a consignment", intent_router.CREATE_CONSIGNMENT),
+    ("I would like to create a new consignment", intent_router.CREATE_CONSIGNMENT),
+    ("please add an inbound consignment for warehouse 12", intent_router.CREATE_CONSIGNMENT),
+    ("make an ASN", intent_router.CREATE_CONSIGNMENT),
+    ("need to submit consignments", intent_router.CREATE_CONSIGNMENT),
+    ("create consignmnet", intent_router.CREATE_CONSIGNMENT),
+    ("help me create consignments from a spreadsheet", intent_router.CREATE_CONSIGNMENT),
+    ("new inbound receipt", intent_router.CREATE_CONSIGNMENT),
+    ("Consignment creation", intent_router.CREATE_CONSIGNMENT),
+    ("I need a consignment created", intent_router.CREATE_CONSIGNMENT),
+    ("create a dropship consignment", intent_router.CREATE_CONSIGNMENT),
+    ("Create a product listing for my store", intent_router.COMING_SOON),
+    ("I want to make a shipment plan", intent_router.COMING_SOON),
+    ("add a new product", intent_router.COMING_SOON),
+    ("create listings", intent_router.COMING_SOON),
+    ("set up a shipping plan for next week", intent_router.COMING_SOON),
+    ("Product listing creation", intent_router.COMING_SOON),
+    ("can you cancel order 123", intent_router.REFUSAL),
+    ("where is my order", intent_router.REFUSAL),
+    ("track consignment ABC", intent_router.REFUSAL),
+    ("what's the capital of France", intent_router.REFUSAL),
+    ("good morning", intent_router.REFUSAL),
+    ("delete all orders", intent_router.REFUSAL),
+    ("change the address on my order", intent_router.REFUSAL),
+    ("How do I reset my password?", intent_router.REFUSAL),
+    ("show my consignments", intent_router.REFUSAL),
+    ("what is the weather in Paris", intent_router.REFUSAL),
+]
+
+
+def classify_with_llm(text, client):
+    import app
+    return intent_router.normalize_intent(app.classify_intent_with_llm(text, client))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=intent_router.router.threshold)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--llm", action="store_true")
+    args = parser.parse_args()
+
+    client = None
+    if args.llm:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+    answered = correct_local = correct_overall = deferred = 0
+    timings = []
+    mistakes = []
+    for text, label in LABELED_PHRASES:
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            intent, confidence, source = intent_router.router.classify(text, args.threshold)
+            timings.append((time.perf_counter() - started) * 1e6)
+
+        if intent is None:
+            deferred += 1
+            if client is not None:
+                intent = classify_with_llm(text, client)
+                correct_overall += intent == label
+            continue
+        answered += 1
+        correct_local += intent == label
+        correct_overall += intent == label
+        if intent != label:
+            mistakes.append((text, label, intent, source, round(confidence, 2)))
+
+    timings.sort()
+    total = len(LABELED_PHRASES)
+    print(f"phrases: {total}, answered locally: {answered} ({answered / total:.0%}), deferred to LLM: {deferred}")
+    print(f"local accuracy: {correct_local}/{answered} ({correct_local / answered if answered else 0:.0%})")
+    if client is not None:
+        print(f"overall accuracy with LLM fallback: {correct_overall}/{total} ({correct_overall / total:.0%})")
+    print(
+        f"local latency: mean {statistics.mean(timings):.0f}us, p50 {timings[len(timings) // 2]:.0f}us, "
+        f"p95 {timings[int(len(timings) * 0.95) - 1]:.0f}us"
+    )
+    for text, label, intent, source, confidence in mistakes:
+        print(f"  wrong: {text!r} expected {label!r}, got {intent!r} ({source}, {confidence})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import io
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from openai import OpenAI
+
+import app
+import graphql_client
+import llm_cache
+from benchmarks.fake_mongo import FakeDatabase
+from benchmarks.stubs import GraphQLStubServer, OpenAIStubServer
+from reference_cache import reference_cache
+
+# End-to-end throughput of the upload pipeline: a synthetic CSV is ingested with
+# ingest_chunks (header mapping, LLM completion of free-text rows, bulk reference
+# lookups, validate_*_fields), then grouped, prefetched, built with create_*_data
+# and saved in batches through the GraphQL client, as the submit buttons do.
+# OpenAI, MongoDB and the platform API are local stand-ins with configurable
+# latency; the LLM response cache lives in a temporary directory per run.
+#
+#   python -m benchmarks.pipeline
+#   python -m benchmarks.pipeline --kind consignment --rows 10,1000 --llm-latency 0.5
+
+TENANT_ID = "bench-tenant"
+TENANT_NAME = "bench"
+
+
+def seed_database(latency, warehouses=5, customers=20, skus_per_customer=50):
+    database = FakeDatabase(latency=latency)
+    database.tenants.insert_one({"_id": TENANT_ID, "name": TENANT_NAME})
+    warehouse_ids = [
+        str(database.warehouses.insert_one({"tenant": TENANT_ID, "name": f"Warehouse {w}", "code": f"WH{w}"}).inserted_id)
+        for w in range(warehouses)
+    ]
+    for c in range(customers):
+        customer_id = database.customers.insert_one(
+            {"tenant": TENANT_ID, "name": f"Customer {c}", "code": f"CUST{c}", "warehouses": warehouse_ids}
+        ).inserted_id
+        for s in range(skus_per_customer):
+            variant_id = database.productvariants.insert_one({
+                "tenant": TENANT_ID, "customer": str(customer_id), "sku": f"SKU{c}-{s}", "name": f"Product {c}-{s}",
+                "productId": f"P{c}-{s}", "baseUom": "Each", "uomConfiguration": [{"baseUom": "Each", "targetUom": "Case"}],
+            }).inserted_id
+            database.skubinmappings.insert_one({"product": variant_id, "lotId": f"LOT{s}", "formFactor": "Each"})
+    return database, customers, skus_per_customer
+
+
+# Builds a CSV where llm_fraction of the rows have a date or quantity only the LLM
+# understands and free_text_fraction have their SKU only in a notes column
+def synthetic_csv(kind, rows, customers, skus_per_customer, llm_fraction, free_text_fraction, seed=1):
+    rng = random.Random(seed)
+    identity = "Order ID" if kind == "order" else "Consignment Number"
+    header = ["Warehouse", "Customer", "SKU", "Quantity", "Date", identity, "Notes"]
+    if kind == "consignment":
+        header.append("Standard/Dropship")
+
+    lines = [",".join(header)]
+    group = 0
+    for row in range(rows):
+        # Consecutive rows share an identity so orders have one to three lines
+        if row == 0 or rng.random() < 0.5:
+            group += 1
+            customer, warehouse = rng.randrange(customers), f"WH{rng.randrange(5)}"
+        sku = f"SKU{customer}-{rng.randrange(skus_per_customer)}"
+        date, quantity, notes = "2024-03-15", str(rng.randint(1, 20)), ""
+        draw = rng.random()
+        if draw < llm_fraction / 2:
+            date = "the day after the 3rd of last month"
+        elif draw < llm_fraction:
+            quantity = "a dozen"
+        elif draw < llm_fraction + free_text_fraction:
+            sku, notes = "", f"Product SKU: {sku}"
+        values = [warehouse, f"CUST{customer}", sku, quantity, date, f"{kind[:3].upper()}{group}", notes]
+        if kind == "consignment":
+            values.append("Standard")
+        lines.append(",".join(values))
+    return io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+class StageTimer:
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.timings[stage].append((time.perf_counter() - started) * 1000)
+        return timed
+
+    def wrap_async(self, stage, function):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.timings[stage].append((time.perf_counter() - started) * 1000)
+        return timed
+
+
+def percentile(values, quantile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * quantile))] if values else 0.0
+
+
+def run(kind, rows, args, client, openai_stub, graphql_stub):
+    database, customers, skus_per_customer = seed_database(args.mongo_latency)
+    reference_cache.invalidate()
+    graphql_client.invalidate_token((graphql_stub.url, "bench", TENANT_ID))
+    for stub in (openai_stub, graphql_stub):
+        stub.requests, stub.operations = 0, {}
+
+    timer = StageTimer()
+    originals = {
+        "validate": app.INGEST_KINDS[kind]["validate"],
+        "create_order_data": app.create_order_data,
+        "create_consignment_data": app.create_consignment_data,
+        "create_completion": app.create_completion,
+        "create_completion_async": app.create_completion_async,
+    }
+    app.INGEST_KINDS[kind]["validate"] = timer.wrap("validate", originals["validate"])
+    app.create_order_data = timer.wrap("create_data", originals["create_order_data"])
+    app.create_consignment_data = timer.wrap("create_data", originals["create_consignment_data"])
+    app.create_completion = timer.wrap("llm", originals["create_completion"])
+    app.create_completion_async = timer.wrap_async("llm", originals["create_completion_async"])
+
+    settings = app.SUBMIT_KINDS[kind]
+    originals["save_batch"] = settings["save_batch"]
+    settings["save_batch"] = timer.wrap("save_batch", originals["save_batch"])
+
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            llm_cache.configure(path=f"{cache_dir}/llm.sqlite3")
+            upload = synthetic_csv(kind, rows, customers, skus_per_customer, args.llm_fraction, args.free_text_fraction)
+            started = time.perf_counter()
+
+            validated, errors = [], 0
+            stage_started = time.perf_counter()
+            for result in app.ingest_chunks(
+                app.read_csv_chunks(upload, args.chunk_size), kind, client, database, TENANT_ID,
+                concurrency=args.llm_concurrency, max_pack_rows=args.pack_rows
+            ):
+                validated.extend(result["validated"])
+                errors += len(result["errors"])
+            ingest_ms = (time.perf_counter() - stage_started) * 1000
+
+            stage_started = time.perf_counter()
+            groups = app.group_rows(validated, settings["group_key"], settings["identity_field"])
+            prefetched = app.prefetch_product_data(validated, database, TENANT_ID, kind)
+            prefetch_ms = (time.perf_counter() - stage_started) * 1000
+
+            stage_started = time.perf_counter()
+            results = app.submit_groups(
+                groups, kind, client, database, graphql_stub.url, "bench", "bench", TENANT_ID, TENANT_NAME, prefetched,
+                batch_size=args.batch_size, max_workers=args.workers, max_retries=0
+            )
+            submit_ms = (time.perf_counter() - stage_started) * 1000
+            elapsed = time.perf_counter() - started
+    finally:
+        app.INGEST_KINDS[kind]["validate"] = originals["validate"]
+        app.create_order_data = originals["create_order_data"]
+        app.create_consignment_data = originals["create_consignment_data"]
+        app.create_completion = originals["create_completion"]
+        app.create_completion_async = originals["create_completion_async"]
+        settings["save_batch"] = originals["save_batch"]
+
+    saved = sum(result["success"] for result in results)
+    print(f"\n{kind}s: {rows} rows -> {len(validated)} valid, {errors} rejected, {len(groups)} {kind}s, {saved} saved")
+    print(f"  {rows / elapsed:,.0f} rows/s ({elapsed:.2f}s; ingest {ingest_ms:.0f}ms, group+prefetch {prefetch_ms:.0f}ms, build+save {submit_ms:.0f}ms)")
+    print(f"  {'stage':<12}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage in ("llm", "validate", "create_data", "save_batch"):
+        timings = timer.timings.get(stage, [])
+        print(f"  {stage:<12}{len(timings):>8}{percentile(timings, 0.5):>10.2f}{percentile(timings, 0.95):>10.2f}")
+    print(
+        f"  calls per row: openai {openai_stub.requests / rows:.3f}, mongo {database.total_calls() / rows:.3f}, "
+        f"graphql {graphql_stub.requests / rows:.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kind", choices=["order", "consignment", "both"], default="both")
+    parser.add_argument("--rows", default="10,1000,10000", help="comma-separated row counts")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--mongo-latency", type=float, default=0.002)
+    parser.add_argument("--graphql-latency", type=float, default=0.02)
+    parser.add_argument("--llm-fraction", type=float, default=0.02, help="rows whose date or quantity needs the LLM")
+    parser.add_argument("--free-text-fraction", type=float, default=0.02, help="rows whose SKU is only in a notes column")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--pack-rows", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    openai_stub = OpenAIStubServer(latency=args.llm_latency).start()
+    graphql_stub = GraphQLStubServer(latency=args.graphql_latency).start()
+    client = OpenAI(api_key="bench", base_url=openai_stub.url, max_retries=0)
+
+    kinds = ["order", "consignment"] if args.kind == "both" else [args.kind]
+    try:
+        for kind in kinds:
+            for rows in (int(value) for value in args.rows.split(",")):
+                run(kind, rows, args, client, openai_stub, graphql_stub)
+    finally:
+        openai_stub.shutdown()
+        graphql_stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import gzip
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the external services, used by the benchmarks.
+
+
+# GraphQL stub that answers login, saveOrder and saveConsignment mutations.
+# latency is added to every request to mimic the platform API.
+class GraphQLStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.record(len(body))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.server.authorized(self.headers):
+            status, result = 200, self.server.respond(payload)
+        else:
+            status, result = 401, {"errors": [{"message": "Unauthorized", "extensions": {"code": "UNAUTHENTICATED"}}]}
+
+        response = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class GraphQLStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, port=0):
+        handler = type("Handler", (GraphQLStubHandler,), {"latency": latency})
+        super().__init__(("127.0.0.1", port), handler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.operations = {}
+        self.valid_tokens = set()
+        self.token_counter = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/graphql"
+
+    def record(self, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += size
+
+    def count(self, operation, amount=1):
+        with self.lock:
+            self.operations[operation] = self.operations.get(operation, 0) + amount
+
+    def authorized(self, headers):
+        authorization = headers.get("Authorization", "")
+        with self.lock:
+            return not authorization or authorization[len("Bearer "):] in self.valid_tokens
+
+    def respond(self, payload):
+        # Batched requests are a list of operations
+        if isinstance(payload, list):
+            return [self.respond(item) for item in payload]
+
+        query = payload.get("query", "")
+        if "login(" in query:
+            self.count("login")
+            with self.lock:
+                self.token_counter += 1
+                token = f"token-{self.token_counter}"
+                if (payload.get("variables") or {}).get("logoutAll"):
+                    self.valid_tokens.clear()
+                self.valid_tokens.add(token)
+            return {"data": {"login": {"token": token}}}
+
+        # Aliased mutations look like "o0: saveOrder(" in a single document
+        data = {}
+        for mutation, message in (("saveOrder", "Order saved successfully"), ("saveConsignment", "Consignment added successfully")):
+            aliases = re.findall(r"(\w+)\s*:\s*" + mutation + r"\s*\(", query)
+            if aliases:
+                self.count(mutation, len(aliases))
+                for alias in aliases:
+                    data[alias] = {"message": message}
+            elif re.search(r"\b" + mutation + r"\s*\(\s*\w+Input", query):
+                self.count(mutation)
+                data[mutation] = {"message": message}
+        return {"data": data}
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+# OpenAI chat completions stub. Structured-output requests get an object built
+# from the request's JSON schema, with string fields filled from "<field>: value"
+# pairs in the user's text, so extraction returns what the input spells out.
+# Plain prompts get the answers the app's date, quantity and intent prompts expect.
+class OpenAIStubHandler(GraphQLStubHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.record(len(body))
+        payload = json.loads(body)
+        if self.latency:
+            time.sleep(self.latency)
+
+        prompt = payload["messages"][-1]["content"]
+        response_format = payload.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            json_schema = response_format["json_schema"]
+            self.server.count(json_schema["name"])
+            content = json.dumps(structured_answer(json_schema["name"], json_schema["schema"], prompt))
+        else:
+            self.server.count("text")
+            content = text_answer(prompt)
+
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        result = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+        response = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def fields_from_text(properties, text):
+    fields = {}
+    for field in properties:
+        match = re.search(re.escape(field) + r":\s*([^,\"]*)", text)
+        fields[field] = match.group(1).strip() if match else ""
+    return fields
+
+
+def blank_value(schema):
+    if schema.get("type") == "object":
+        return {name: blank_value(value) for name, value in schema.get("properties", {}).items()}
+    return {"string": "", "integer": 0, "number": 0, "boolean": False, "array": []}.get(schema.get("type"), None)
+
+
+def structured_answer(name, schema, prompt):
+    if name == "field_extraction":
+        text = re.search(r"The user's input is: \"(.*)\"", prompt).group(1)
+        properties = schema["properties"]["fields"]["properties"]
+        return {"fields": fields_from_text(properties, text), "missing_mandatory_fields": []}
+    if name == "packed_field_extraction":
+        properties = schema["properties"]["rows"]["items"]["properties"]["fields"]["properties"]
+        rows = []
+        for row, text in re.findall(r"Row (\d+): (\".*\")", prompt):
+            rows.append({"row": int(row), "fields": fields_from_text(properties, json.loads(text)), "missing_mandatory_fields": []})
+        return {"rows": rows}
+    return blank_value(schema)
+
+
+def text_answer(prompt):
+    if "valid date" in prompt:
+        return str(int((time.time() - 86400) * 1000))
+    if "valid positive number" in prompt:
+        return "12"
+    return "Create order"
+
+
+class OpenAIStubServer(GraphQLStubServer):
+    def __init__(self, latency=0.0, port=0):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", port), type("Handler", (OpenAIStubHandler,), {"latency": latency}))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.operations = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
@@ -0,0 +1,98 @@
+import argparse
+import statistics
+import time
+
+from pymongo import MongoClient
+
+import app
+from benchmarks.fake_mongo import FakeDatabase
+from reference_cache import reference_cache
+
+# Compares the sequential customer/warehouse/access/SKU lookups with the single
+# aggregation in resolve_order_references. Runs against a real database when
+# --mongo-url is given, otherwise against the in-process stand-in with a
+# simulated round-trip latency.
+#
+#   python -m benchmarks.validation_lookup --latency 0.002
+#   python -m benchmarks.validation_lookup --mongo-url "$UAT" --tenant-id ... --customer ... --warehouse ... --sku ...
+
+
+def seed_fake_database(latency):
+    database = FakeDatabase(latency=latency)
+    warehouse_id = database.warehouses.insert_one({"tenant": "bench", "name": "Main", "code": "WH1"}).inserted_id
+    customer_id = database.customers.insert_one(
+        {"tenant": "bench", "name": "Bench Customer", "code": "CUST1", "warehouses": [str(warehouse_id)]}
+    ).inserted_id
+    database.productvariants.insert_one({"tenant": "bench", "customer": str(customer_id), "sku": "SKU1"})
+    return database
+
+
+def sequential(record, database, tenant_id):
+    customer_id = app.validate_customer(record["Customer Name/Code"], database, tenant_id)
+    if customer_id == "Customer name/code not valid":
+        return customer_id
+    warehouse_id = app.validate_warehouse(record["Warehouse Name/Code"], database, tenant_id)
+    if warehouse_id == "Warehouse name/code not valid":
+        return warehouse_id
+    access_check = app.validate_customer_warehouse_access(customer_id, warehouse_id, database, tenant_id)
+    if access_check != True:
+        return access_check
+    return app.validate_product_sku(customer_id, record["Product SKU"], database, tenant_id)
+
+
+def aggregated(record, database, tenant_id):
+    references = app.resolve_order_references(record, database, tenant_id)
+    customer_id = app.validate_customer(record["Customer Name/Code"], database, tenant_id, references)
+    if customer_id == "Customer name/code not valid":
+        return customer_id
+    warehouse_id = app.validate_warehouse(record["Warehouse Name/Code"], database, tenant_id, references)
+    if warehouse_id == "Warehouse name/code not valid":
+        return warehouse_id
+    access_check = app.validate_customer_warehouse_access(customer_id, warehouse_id, database, tenant_id, references)
+    if access_check != True:
+        return access_check
+    return app.validate_product_sku(customer_id, record["Product SKU"], database, tenant_id, references)
+
+
+def measure(resolve, record, database, tenant_id, iterations):
+    timings = []
+    results = set()
+    for _ in range(iterations):
+        # Every iteration starts cold so both paths hit the database
+        reference_cache.invalidate()
+        started = time.perf_counter()
+        results.add(resolve(record, database, tenant_id))
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-url")
+    parser.add_argument("--tenant-id", default="bench")
+    parser.add_argument("--customer", default="CUST1")
+    parser.add_argument("--warehouse", default="WH1")
+    parser.add_argument("--sku", default="SKU1")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.002, help="Simulated round trip of the stand-in, in seconds")
+    args = parser.parse_args()
+
+    if args.mongo_url:
+        database = MongoClient(args.mongo_url)["platform-uat"]
+    else:
+        database = seed_fake_database(args.latency)
+
+    record = {"Customer Name/Code": args.customer, "Warehouse Name/Code": args.warehouse, "Product SKU": args.sku}
+    for name, resolve in (("sequential", sequential), ("aggregation", aggregated)):
+        result = measure(resolve, record, database, args.tenant_id, args.iterations)
+        print(f"{name:12} mean {result['mean_ms']:7.2f} ms  p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  result {sorted(result['results'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import atexit
+import base64
+import gzip
+import json
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared transport for the platform GraphQL API. All threads and sessions reuse
+# one keep-alive connection pool; each thread gets its own requests.Session
+# mounted on that pool because Session objects aren't guaranteed thread-safe.
+
+settings = {
+    "pool_size": 20,
+    "connect_timeout": 5,
+    "read_timeout": 60,
+    # Request bodies at least this large are gzip-compressed; None disables compression
+    "gzip_min_bytes": 16384,
+}
+
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings["pool_size"], max_retries=0)
+_local = threading.local()
+_lock = threading.Lock()
+_UNSET = object()
+
+
+def configure(pool_size=None, connect_timeout=None, read_timeout=None, gzip_min_bytes=_UNSET):
+    global _adapter
+    with _lock:
+        if connect_timeout is not None:
+            settings["connect_timeout"] = connect_timeout
+        if read_timeout is not None:
+            settings["read_timeout"] = read_timeout
+        if gzip_min_bytes is not _UNSET:
+            settings["gzip_min_bytes"] = gzip_min_bytes
+        if pool_size is not None and pool_size != settings["pool_size"]:
+            settings["pool_size"] = pool_size
+            _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None or getattr(_local, "adapter", None) is not _adapter:
+        session = requests.Session()
+        session.mount("https://", _adapter)
+        session.mount("http://", _adapter)
+        _local.session = session
+        _local.adapter = _adapter
+    return session
+
+
+# The tenant header is the same for every call of a tenant, so it's built once
+@lru_cache(maxsize=1024)
+def tenant_header(tenant_id, tenant_name):
+    return json.dumps(
+        {"id": tenant_id, "name": tenant_name, "subdomain": "uat", "code": "uat", "active": True},
+        separators=(",", ":")
+    )
+
+
+def encode_body(payload):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if settings["gzip_min_bytes"] is not None and len(body) >= settings["gzip_min_bytes"]:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+# Posts a GraphQL document and returns the HTTP response
+def post(url, payload, tenant_id, tenant_name, token=None):
+    body, headers = encode_body(payload)
+    headers["tenant"] = tenant_header(tenant_id, tenant_name)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return _session().post(
+        url,
+        data=body,
+        headers=headers,
+        timeout=(settings["connect_timeout"], settings["read_timeout"])
+    )
+
+
+UNAUTHORIZED_RESPONSE = {"errors": [{"message": "Unauthorized", "extensions": {"code": "UNAUTHENTICATED"}}]}
+
+
+def execute(url, query, variables, tenant_id, tenant_name, token=None):
+    response = post(url, {"query": query, "variables": variables}, tenant_id, tenant_name, token)
+    # 401 bodies aren't always JSON, so report them in the GraphQL error format
+    if response.status_code == 401:
+        return UNAUTHORIZED_RESPONSE
+    return response.json()
+
+
+# True when the API rejected the request for its credentials without saving
+# anything: a 401, or an authentication error with no mutation result
+def is_unauthorized(response):
+    response = response or {}
+    if any(value is not None for value in (response.get("data") or {}).values()):
+        return False
+    for error in response.get("errors") or []:
+        if not isinstance(error, dict):
+            continue
+        code = str((error.get("extensions") or {}).get("code", "")).upper()
+        message = str(error.get("message", "")).lower()
+        if code in ("UNAUTHENTICATED", "UNAUTHORIZED") or any(
+            text in message for text in ("unauthorized", "unauthenticated", "jwt expired", "invalid token", "not authenticated")
+        ):
+            return True
+    return False
+
+
+# Auth tokens are cached per (url, username, tenant) and shared by every session.
+# Logins for the same key are serialized so concurrent sessions don't each log in.
+token_settings = {
+    # Tokens are refreshed this many seconds before they expire
+    "refresh_margin": 120,
+    # Lifetime assumed for tokens that don't carry a JWT exp claim
+    "default_ttl": 3600,
+}
+
+_tokens = {}
+_token_locks = {}
+
+
+def token_expiry(token):
+    # Reads the exp claim of a JWT without verifying it
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+# Returns a cached token for key, calling login() when there is none, it is about
+# to expire, or it is the stale_token a caller just got rejected with
+def get_token(key, login, stale_token=None):
+    with _lock:
+        key_lock = _token_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        entry = _tokens.get(key)
+        if entry and entry[0] != stale_token and entry[1] - token_settings["refresh_margin"] > time.time():
+            return entry[0]
+
+        token = login()
+        if token:
+            _tokens[key] = (token, token_expiry(token) or time.time() + token_settings["default_ttl"])
+        else:
+            _tokens.pop(key, None)
+        return token
+
+
+def invalidate_token(key):
+    _tokens.pop(key, None)
+
+
+# Runs call(token, items), which returns one response per item, and if the API
+# rejects the token, logs in once more and sends only the rejected items again
+# so items the first call already saved aren't saved twice.
+def with_batch_token_refresh(call, items, get_auth_token):
+    token = get_auth_token()
+    responses = list(call(token, items))
+    rejected = [index for index, response in enumerate(responses) if is_unauthorized(response)]
+    if rejected:
+        token = get_auth_token(stale_token=token)
+        for index, response in zip(rejected, call(token, [items[index] for index in rejected])):
+            responses[index] = response
+    return responses
+
+
+def close():
+    _adapter.close()
+
+
+atexit.register(close)
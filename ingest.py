@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from openai import OpenAI
+
+import app
+import graphql_client
+import llm_cache
+from metrics import metrics, current_tenant
+from reference_cache import reference_cache
+
+# Headless bulk import of an order or consignment file (CSV or XLSX) for one
+# tenant, using the same ingestion, validation, payload and save functions as
+# the Streamlit app. Settings come from environment variables named like the
+# app's secrets: OPENAI_API_KEY, UAT, EMAIL, PASSWORD and URL are required, and
+# the optional tuning keys from the README (LLM_CONCURRENCY, SUBMIT_BATCH_SIZE,
+# ...) are read the same way.
+#
+#   python ingest.py --tenant acme --kind order orders.xlsx --sheet Orders --results results.jsonl
+#   python ingest.py --tenant acme --kind consignment inbound.csv --dry-run
+#
+# The results file has one JSON object per input row:
+#   {"row": 12, "status": "saved" | "failed" | "invalid" | "valid", "message": "...", "group": "..."}
+# "row" is the row number a spreadsheet shows for that row, counting the header
+# and blank rows. "valid" is only used by --dry-run. The exit status is 1 if any
+# row was invalid or failed to save.
+
+def env(name, default=None, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        if default is None:
+            sys.exit(f"Missing required environment variable {name}")
+        return default
+    if cast is bool:
+        return value.lower() in ("1", "true", "yes")
+    return cast(value)
+
+
+# Group key overrides are a JSON list or comma-separated field names
+def field_list(value):
+    if value.strip().startswith("["):
+        return json.loads(value)
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
+def configure():
+    graphql_client.configure(
+        pool_size=env("GRAPHQL_POOL_SIZE", 20, int),
+        connect_timeout=env("GRAPHQL_CONNECT_TIMEOUT", 5, float),
+        read_timeout=env("GRAPHQL_READ_TIMEOUT", 60, float),
+        gzip_min_bytes=env("GRAPHQL_GZIP_MIN_BYTES", 16384, int),
+    )
+    llm_cache.configure(
+        path=env("LLM_CACHE_PATH", llm_cache.DEFAULT_PATH),
+        max_entries=env("LLM_CACHE_MAX_ENTRIES", 100000, int),
+        ttl=env("LLM_CACHE_TTL", 7 * 24 * 3600, int),
+        cache_nondeterministic=env("LLM_CACHE_NONDETERMINISTIC", False, bool),
+    )
+    reference_cache.configure(
+        ttl=env("REFERENCE_CACHE_TTL", 300, int),
+        negative_ttl=env("REFERENCE_CACHE_NEGATIVE_TTL", 60, int),
+        max_entries=env("REFERENCE_CACHE_MAX_ENTRIES", 50000, int),
+    )
+
+    client = OpenAI(
+        api_key=env("OPENAI_API_KEY"),
+        timeout=env("OPENAI_TIMEOUT", 60, float),
+        max_retries=env("OPENAI_MAX_RETRIES", 2, int),
+    )
+    database = app.database_connection(
+        env("UAT"),
+        max_pool_size=env("MONGO_MAX_POOL_SIZE", 50, int),
+        connect_timeout_ms=env("MONGO_CONNECT_TIMEOUT_MS", 5000, int),
+        server_selection_timeout_ms=env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000, int),
+        socket_timeout_ms=env("MONGO_SOCKET_TIMEOUT_MS", 30000, int),
+    )
+    return client, database
+
+
+def read_chunks(path, sheet, chunk_size):
+    if path.lower().endswith(".xlsx"):
+        return app.read_xlsx_chunks(path, sheet, chunk_size)
+    if path.lower().endswith(".xls"):
+        sys.exit("Legacy .xls files aren't supported; save the workbook as .xlsx")
+    return app.read_csv_chunks(path, chunk_size)
+
+
+def ingest_file(args, client, database, tenant_id, tenant_name, results_file):
+    settings = app.SUBMIT_KINDS[args.kind]
+    summary = {"rows": 0, "invalid": 0, "valid": 0, "saved": 0, "failed": 0}
+
+    file_rows = {}
+
+    def write(index, status, message, group=""):
+        summary[status] += 1
+        if results_file:
+            results_file.write(json.dumps({"row": file_rows[index], "status": status, "message": message, "group": group}) + "\n")
+
+    # Validation streams chunk by chunk; the valid rows are kept (in file order)
+    # because rows of one order or consignment can be anywhere in the file
+    validated, indexes = [], []
+    for result in app.ingest_chunks(
+        read_chunks(args.file, args.sheet, args.chunk_size), args.kind, client, database, tenant_id,
+        concurrency=env("LLM_CONCURRENCY", 8, int),
+        max_pack_rows=env("LLM_PACK_ROWS", 10, int),
+        token_budget=env("LLM_PACK_TOKEN_BUDGET", 6000, int),
+    ):
+        summary["rows"] += result["rows"]
+        file_rows.update(result["file_rows"])
+        for index, message in result["errors"]:
+            write(index, "invalid", message)
+        validated.extend(result["validated"])
+        indexes.extend(result["indexes"])
+        print(f"Validated {summary['rows']} rows ({len(validated)} valid, {summary['invalid']} invalid)", file=sys.stderr)
+
+    row_of = {id(record): index for record, index in zip(validated, indexes)}
+    group_key = env(f"{args.kind.upper()}_GROUP_KEY", settings["group_key"], field_list)
+    groups = app.group_rows(validated, group_key if not args.no_group else [], settings["identity_field"])
+    prefetched = app.prefetch_product_data(validated, database, tenant_id, args.kind)
+    if args.dry_run:
+        # Payloads are still built so missing product data shows up without submitting
+        for group in groups:
+            try:
+                settings["build"](group, client, database, tenant_id, prefetched)
+                status, message = "valid", "Not submitted (dry run)"
+            except Exception as e:
+                status, message = "failed", f"{type(e).__name__}: {e}"
+            for record in group:
+                write(row_of[id(record)], status, message, group[0].get(settings["identity_field"], ""))
+        return summary
+
+    url, email, password = env("URL"), env("EMAIL"), env("PASSWORD")
+
+    results = app.submit_groups(
+        groups, args.kind, client, database, url, email, password, tenant_id, tenant_name, prefetched,
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        max_retries=env("SUBMIT_MAX_RETRIES", 3, int),
+        backoff=env("SUBMIT_RETRY_BACKOFF", 0.5, float),
+        on_progress=lambda done, total: print(f"Submitted {done} of {total}", file=sys.stderr),
+    )
+    for group, result in zip(groups, results):
+        for record in group:
+            write(
+                row_of[id(record)], "saved" if result["success"] else "failed", result["message"],
+                group[0].get(settings["identity_field"], "")
+            )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and submit an order or consignment file for a tenant.")
+    parser.add_argument("file", help="CSV or XLSX file")
+    parser.add_argument("--tenant", required=True, help="tenant name")
+    parser.add_argument("--kind", choices=sorted(app.SUBMIT_KINDS), required=True)
+    parser.add_argument("--sheet", help="worksheet to read from an XLSX file (default: the first)")
+    parser.add_argument("--workers", type=int, default=env("SUBMIT_WORKERS", 8, int), help="parallel submission requests")
+    parser.add_argument("--batch-size", type=int, default=env("SUBMIT_BATCH_SIZE", 10, int), help="orders or consignments per API request")
+    parser.add_argument("--chunk-size", type=int, default=env("CSV_CHUNK_SIZE", 5000, int), help="rows validated at a time")
+    parser.add_argument("--no-group", action="store_true", help="submit every row as its own order or consignment")
+    parser.add_argument("--dry-run", action="store_true", help="validate and build the payloads without submitting them")
+    parser.add_argument("--results", help="write one JSON line per input row to this file")
+    args = parser.parse_args()
+
+    client, database = configure()
+    tenant_id = app.check_tenant_name(args.tenant, database)
+    if tenant_id == "Tenant name not valid":
+        sys.exit(f"Tenant name not valid: {args.tenant}")
+    current_tenant.set(args.tenant)
+
+    started = time.perf_counter()
+    results_file = open(args.results, "w") if args.results else None
+    try:
+        summary = ingest_file(args, client, database, tenant_id, args.tenant, results_file)
+    finally:
+        if results_file:
+            results_file.close()
+
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    summary["metrics"] = [
+        {key: row[key] for key in ("stage", "count", "errors", "mean_ms", "p95_ms")} for row in metrics.snapshot()
+    ]
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["invalid"] or summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
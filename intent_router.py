@@ -0,0 +1,151 @@
+import math
+import re
+from collections import Counter
+
+# Local classifier for the chat intent. Keyword rules answer the common phrasings
+# and a TF-IDF scorer over word and character n-grams handles the rest; when
+# neither is confident, classify returns None so the caller can ask the LLM.
+
+CREATE_ORDER = "Create order"
+CREATE_CONSIGNMENT = "Create consignment"
+COMING_SOON = "This feature is coming soon"
+REFUSAL = "I'm sorry, I can't help with that"
+
+INTENTS = [CREATE_ORDER, CREATE_CONSIGNMENT, COMING_SOON, REFUSAL]
+
+CREATE_WORDS = r"(create|created|creating|make|place|placing|add|new|submit|enter|book|raise|generate|set\s+up|put\s+in|start|open|log|draft)"
+OTHER_ACTION_WORDS = r"(cancel|delete|remove|track|tracking|status|where|update|edit|modify|change|return|refund|check|view|show|find|search)"
+CONSIGNMENT_WORDS = r"(consignments?|asns?|inbound|receipts?|receiving|inventory\s+receipt)"
+ORDER_WORDS = r"(orders?|outbound|shipments?\s+order|sales\s+orders?)"
+COMING_SOON_WORDS = r"(product\s+listings?|listings?|list\s+(a|my)\s+products?|shipment\s+plans?|shipping\s+plans?|new\s+products?)"
+
+# Phrasings the scorer is fitted on
+EXAMPLES = {
+    CREATE_ORDER: [
+        "create order", "create an order", "I want to create an order", "I'd like to place an order",
+        "place a new order", "make an order", "new order please", "can you help me create an order",
+        "I need to place an order", "add an order", "submit an order", "create outbound order",
+        "create a sales order", "book an order for a customer", "order", "orders", "make order",
+        "i want to order something", "let's create some orders", "create multiple orders",
+        "upload orders", "enter order details", "raise an order", "start a new order",
+    ],
+    CREATE_CONSIGNMENT: [
+        "create consignment", "create a consignment", "I want to create a consignment",
+        "I'd like to add a consignment", "new consignment", "make a consignment",
+        "can you help me create a consignment", "create an inbound consignment", "create asn",
+        "create an ASN", "add inbound shipment", "submit a consignment", "consignment",
+        "consignments", "book a consignment", "raise a consignment", "create receipt",
+        "create inbound receiving", "start a new consignment", "upload consignments",
+    ],
+    COMING_SOON: [
+        "create a product listing", "create product listing", "I want to list a product",
+        "create a shipment plan", "make a shipment plan", "create a new product",
+        "add a product", "new shipping plan", "create listing", "set up a shipment plan",
+        "list my products", "create a shipping plan", "add new products",
+    ],
+    REFUSAL: [
+        "what's the weather today", "hello", "hi there", "tell me a joke", "who are you",
+        "cancel my order", "track my order", "where is my shipment", "delete a consignment",
+        "update an order", "what is the status of my order", "show me all orders",
+        "thanks", "how are you", "help", "what can you do", "refund my order",
+        "write me a poem", "what time is it",
+    ],
+}
+
+
+def normalize_text(text):
+    return " ".join(re.findall(r"[a-z0-9']+", str(text).lower()))
+
+
+def features(text):
+    words = normalize_text(text).split()
+    grams = list(words)
+    grams += [f"{first} {second}" for first, second in zip(words, words[1:])]
+    # Character trigrams make the scorer tolerant of typos ("consignmnet")
+    for word in words:
+        padded = f" {word} "
+        grams += [f"#{padded[index:index + 3]}" for index in range(len(padded) - 2)]
+    return Counter(grams)
+
+
+def _normalize(vector):
+    length = math.sqrt(sum(value * value for value in vector.values()))
+    return {key: value / length for key, value in vector.items()} if length else {}
+
+
+class IntentRouter:
+    def __init__(self, examples=EXAMPLES, threshold=0.4, margin=0.15):
+        self.threshold = threshold
+        self.margin = margin
+
+        documents = [(intent, features(text)) for intent, texts in examples.items() for text in texts]
+        document_frequency = Counter(gram for _, counts in documents for gram in counts)
+        self.idf = {gram: math.log((1 + len(documents)) / (1 + count)) + 1 for gram, count in document_frequency.items()}
+
+        # One centroid per intent over the normalized TF-IDF vectors of its examples
+        centroids = {intent: Counter() for intent in examples}
+        for intent, counts in documents:
+            centroids[intent].update(self.vectorize(counts))
+        self.centroids = {intent: _normalize(centroid) for intent, centroid in centroids.items()}
+
+    def vectorize(self, counts):
+        return _normalize({gram: count * self.idf[gram] for gram, count in counts.items() if gram in self.idf})
+
+    def scores(self, text):
+        vector = self.vectorize(features(text))
+        return {
+            intent: sum(weight * centroid.get(gram, 0.0) for gram, weight in vector.items())
+            for intent, centroid in self.centroids.items()
+        }
+
+    # Keyword rules: (intent, confidence) or None when they don't settle it
+    def match_rules(self, text):
+        text = normalize_text(text)
+        creating = re.search(rf"\b{CREATE_WORDS}\b", text)
+        other_action = re.search(rf"\b{OTHER_ACTION_WORDS}\b", text)
+        consignment = re.search(rf"\b{CONSIGNMENT_WORDS}\b", text)
+        order = re.search(rf"\b{ORDER_WORDS}\b", text)
+        coming_soon = re.search(rf"\b{COMING_SOON_WORDS}\b", text)
+
+        if other_action and not creating and (order or consignment or coming_soon):
+            return REFUSAL, 0.9
+        if not creating or other_action:
+            return None
+        if consignment and not order and not coming_soon:
+            return CREATE_CONSIGNMENT, 1.0
+        if order and not consignment and not coming_soon:
+            return CREATE_ORDER, 1.0
+        if coming_soon and not order and not consignment:
+            return COMING_SOON, 1.0
+        return None
+
+    # Returns (intent, confidence, source); intent is None when the caller should ask the LLM
+    def classify(self, text, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        ruled = self.match_rules(text)
+        if ruled:
+            return ruled[0], ruled[1], "rules"
+
+        ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        (intent, best), (_, second) = ranked[0], ranked[1]
+        if best >= threshold and best - second >= self.margin:
+            return intent, best, "scorer"
+        return None, best, "scorer"
+
+
+# Maps a free-form LLM reply onto one of INTENTS, so "Create order." or
+# "The user wants to create an order" don't fall through to the refusal branch
+def normalize_intent(reply):
+    text = normalize_text(reply)
+    if "coming soon" in text:
+        return COMING_SOON
+    if re.search(r"\b(sorry|can't|cannot|can not|unable)\b", text):
+        return REFUSAL
+    if re.search(rf"\b{CONSIGNMENT_WORDS}\b", text):
+        return CREATE_CONSIGNMENT
+    if re.search(rf"\b{ORDER_WORDS}\b", text):
+        return CREATE_ORDER
+    return REFUSAL
+
+
+router = IntentRouter()
@@ -0,0 +1,267 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+# pysqlite3-binary ships a newer SQLite than some hosts (Streamlit Cloud) provide
+try:
+    import pysqlite3 as sqlite3
+except ImportError:
+    import sqlite3
+
+# Durable queue for upload jobs. A job stores the uploaded file on disk and its
+# progress in SQLite: how many rows have been validated, and one result row per
+# input row (the validated record, or why it was rejected, and later whether it
+# was saved). Workers checkpoint after every chunk they validate and every batch
+# they submit, so a job interrupted by a restart resumes where it stopped.
+#
+# A job runs in two stages, "validate" then "submit". Its status is "queued"
+# until a worker claims it, "running" while a worker holds its lease, "waiting"
+# when validation is done and submission hasn't been requested, and finally
+# "done", "failed" or "cancelled". Running jobs whose lease has expired (their
+# worker died) are claimed again. Every write a worker makes is conditional on
+# it still holding the lease of a running job; a write that finds the job
+# cancelled or claimed by another worker raises JobCancelled instead.
+
+DEFAULT_PATH = os.path.join(".cache", "jobs.sqlite3")
+
+
+# Raised to a worker whose job was cancelled or taken over by another worker
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    def __init__(self, path=DEFAULT_PATH, files_dir=None):
+        self.path = path
+        self.files_dir = files_dir or os.path.join(os.path.dirname(path) or ".", "job_files")
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT,
+                tenant_id TEXT,
+                tenant_name TEXT,
+                filename TEXT,
+                file_path TEXT,
+                sheet TEXT,
+                options TEXT,
+                stage TEXT,
+                status TEXT,
+                submit INTEGER,
+                processed_rows INTEGER DEFAULT 0,
+                error TEXT,
+                lease_owner TEXT,
+                lease_expires REAL,
+                created_at REAL,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_rows (
+                job_id TEXT,
+                row INTEGER,
+                status TEXT,
+                message TEXT,
+                record TEXT,
+                PRIMARY KEY (job_id, row)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_tenant ON jobs (tenant_id, created_at);
+            CREATE INDEX IF NOT EXISTS job_rows_status ON job_rows (job_id, status);"""
+        )
+        self._connection.commit()
+
+    def _execute(self, query, parameters=()):
+        with self._lock:
+            cursor = self._connection.execute(query, parameters)
+            self._connection.commit()
+            return cursor
+
+    def _fetch(self, query, parameters=()):
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(query, parameters).fetchall()]
+
+    def create_job(self, kind, tenant_id, tenant_name, filename, data, sheet=None, submit=False, options=None):
+        job_id = uuid.uuid4().hex
+        file_path = os.path.join(self.files_dir, job_id + os.path.splitext(filename)[1].lower())
+        with open(file_path, "wb") as file:
+            file.write(data)
+        now = time.time()
+        self._execute(
+            """INSERT INTO jobs (id, kind, tenant_id, tenant_name, filename, file_path, sheet, options, stage, status,
+               submit, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'validate', 'queued', ?, ?, ?)""",
+            (job_id, kind, tenant_id, tenant_name, filename, file_path, sheet, json.dumps(options or {}), int(submit), now, now)
+        )
+        return job_id
+
+    def get(self, job_id):
+        rows = self._fetch("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._decode(rows[0]) if rows else None
+
+    def list_jobs(self, tenant_id, limit=20):
+        rows = self._fetch("SELECT * FROM jobs WHERE tenant_id = ? ORDER BY created_at DESC LIMIT ?", (tenant_id, limit))
+        return [self._decode(row) for row in rows]
+
+    def _decode(self, job):
+        job["options"] = json.loads(job["options"] or "{}")
+        job["submit"] = bool(job["submit"])
+        return job
+
+    # Takes the oldest queued job, or a running one whose worker stopped renewing its lease
+    def claim(self, owner, lease=300):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                """SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)
+                   ORDER BY created_at LIMIT 1""",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Conditional, so a worker in another process that claimed it first wins
+            claimed = self._connection.execute(
+                """UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, updated_at = ?
+                   WHERE id = ? AND (status = 'queued' OR (status = 'running' AND lease_expires < ?))""",
+                (owner, now + lease, now, row["id"], now)
+            ).rowcount
+            self._connection.commit()
+        return self.get(row["id"]) if claimed else None
+
+    # Runs guard_query on the job and then writes, in one transaction, as a write of
+    # the worker holding the job's lease; rolls back and raises JobCancelled if the
+    # job isn't in one of statuses under owner
+    def _owned_write(self, job_id, owner, guard_query, guard_parameters, writes=(), statuses=("running",)):
+        with self._lock:
+            updated = self._connection.execute(
+                guard_query + f" WHERE id = ? AND lease_owner = ? AND status IN ({', '.join('?' for _ in statuses)})",
+                (*guard_parameters, job_id, owner, *statuses)
+            ).rowcount
+            if not updated:
+                self._connection.rollback()
+                raise JobCancelled(job_id)
+            for query, parameters in writes:
+                self._connection.executemany(query, parameters)
+            self._connection.commit()
+
+    # Renews the lease; raises JobCancelled if the job was cancelled or taken over
+    def heartbeat(self, job_id, owner, lease=300):
+        now = time.time()
+        self._owned_write(job_id, owner, "UPDATE jobs SET lease_expires = ?, updated_at = ?", (now + lease, now))
+
+    # Raises JobCancelled if the job was cancelled or taken over, without renewing the lease
+    def check_owner(self, job_id, owner):
+        job = self.get(job_id)
+        if job is None or job["status"] != "running" or job["lease_owner"] != owner:
+            raise JobCancelled(job_id)
+
+    def update(self, job_id, owner, **fields):
+        fields["updated_at"] = time.time()
+        if "options" in fields:
+            fields["options"] = json.dumps(fields["options"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._owned_write(job_id, owner, f"UPDATE jobs SET {assignments}", tuple(fields.values()))
+
+    # Stores the results of one validated chunk and advances the checkpoint in one transaction
+    def checkpoint_rows(self, job_id, owner, rows, processed_rows, options=None):
+        query, parameters = "UPDATE jobs SET processed_rows = ?, updated_at = ?", [processed_rows, time.time()]
+        if options is not None:
+            query += ", options = ?"
+            parameters.append(json.dumps(options))
+        self._owned_write(job_id, owner, query, parameters, [(
+            "INSERT OR REPLACE INTO job_rows (job_id, row, status, message, record) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, row, status, message, json.dumps(record) if record is not None else None) for row, status, message, record in rows]
+        )])
+
+    # Records submission results. Also allowed after a cancel, so rows of batches
+    # that were already sent don't stay marked as unsent.
+    def set_row_status(self, job_id, owner, rows, status, message):
+        self._owned_write(job_id, owner, "UPDATE jobs SET updated_at = ?", (time.time(),), [(
+            "UPDATE job_rows SET status = ?, message = ? WHERE job_id = ? AND row = ?",
+            [(status, message, job_id, row) for row in rows]
+        )], statuses=("running", "cancelled"))
+
+    # Valid rows that haven't been submitted yet, as (row, record) in file order
+    def pending_rows(self, job_id):
+        rows = self._fetch("SELECT row, record FROM job_rows WHERE job_id = ? AND status = 'valid' ORDER BY row", (job_id,))
+        return [(row["row"], json.loads(row["record"])) for row in rows]
+
+    def counts(self, job_id):
+        rows = self._fetch("SELECT status, COUNT(*) AS count FROM job_rows WHERE job_id = ? GROUP BY status", (job_id,))
+        return {row["status"]: row["count"] for row in rows}
+
+    def results(self, job_id):
+        return self._fetch("SELECT row, status, message FROM job_rows WHERE job_id = ? ORDER BY row", (job_id,))
+
+    # Queues the submit stage of a job that finished validating
+    def request_submit(self, job_id):
+        self._execute(
+            "UPDATE jobs SET stage = 'submit', status = 'queued', updated_at = ? WHERE id = ? AND status = 'waiting'",
+            (time.time(), job_id)
+        )
+
+    def cancel(self, job_id):
+        self._execute(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN ('queued', 'running', 'waiting')",
+            (time.time(), job_id)
+        )
+
+
+# Background threads that claim jobs and pass them to handler(store, job, owner).
+# The handler runs the job's current stage and calls store.check_owner between
+# chunks or batches; an exception other than JobCancelled fails the job. While
+# the handler runs, a second thread renews the lease every lease / 3 seconds, so
+# a chunk or batch slower than the lease doesn't let another worker claim the job.
+class JobRunner:
+    def __init__(self, store, handler, workers=2, poll_interval=1.0, lease=300):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _renew(self, job_id, owner, finished):
+        while not finished.wait(self.lease / 3):
+            try:
+                self.store.heartbeat(job_id, owner, self.lease)
+            except JobCancelled:
+                return
+
+    def _work(self):
+        owner = f"{os.getpid()}-{threading.current_thread().name}-{uuid.uuid4().hex[:8]}"
+        while not self._stop.is_set():
+            job = self.store.claim(owner, self.lease)
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            finished = threading.Event()
+            renewer = threading.Thread(target=self._renew, args=(job["id"], owner, finished), daemon=True)
+            renewer.start()
+            try:
+                self.handler(self.store, job, owner)
+            except JobCancelled:
+                pass
+            except Exception as e:
+                try:
+                    self.store.update(job["id"], owner, status="failed", error=f"{type(e).__name__}: {e}")
+                except JobCancelled:
+                    pass
+            finally:
+                finished.set()
+                renewer.join()
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# pysqlite3-binary ships a newer SQLite than some hosts (Streamlit Cloud) provide
+try:
+    import pysqlite3 as sqlite3
+except ImportError:
+    import sqlite3
+
+# Persistent cache of LLM responses, shared by every session and kept across
+# restarts. Entries are keyed on model + request parameters + the prompt with
+# whitespace normalized, expire after a TTL and are evicted least recently used
+# first once max_entries is exceeded. Calls with temperature > 0 are not cached
+# unless cache_nondeterministic is set, since their answers are meant to vary.
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def cache_key(model, params, prompt):
+    payload = json.dumps({"model": model, "params": params, "prompt": normalize_prompt(prompt)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path, max_entries=100000, ttl=7 * 24 * 3600, cache_nondeterministic=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_nondeterministic = cache_nondeterministic
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0}
+        self._writes = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                last_used REAL
+            )"""
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._connection.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self._stats["hits"] += 1
+            return row[0]
+
+    def set(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._writes += 1
+            # Pruning scans the table, so it only runs every 100 writes
+            if self._writes % 100 == 1:
+                self._evict(now)
+            self._connection.commit()
+
+    def _evict(self, now):
+        self._connection.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        count = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    # Returns the cached response for the request or calls call() and caches its result
+    def cached(self, model, params, prompt, call):
+        if params.get("temperature", 0) > 0 and not self.cache_nondeterministic:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return call()
+
+        key = cache_key(model, params, prompt)
+        response = self.get(key)
+        if response is None:
+            response = call()
+            if response is not None:
+                self.set(key, model, response)
+        return response
+
+    # Same as cached for a coroutine function
+    async def cached_async(self, model, params, prompt, call):
+        if params.get("temperature", 0) > 0 and not self.cache_nondeterministic:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return await call()
+
+        # SQLite reads and writes block, so they run in a worker thread to keep
+        # the event loop free for the other in-flight requests
+        key = cache_key(model, params, prompt)
+        response = await asyncio.to_thread(self.get, key)
+        if response is None:
+            response = await call()
+            if response is not None:
+                await asyncio.to_thread(self.set, key, model, response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["entries"] = entries
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+DEFAULT_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+
+
+# Sets up the shared cache; calling it again with the same settings is a no-op
+def configure(path=DEFAULT_PATH, max_entries=100000, ttl=7 * 24 * 3600, cache_nondeterministic=False):
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = LLMCache(path, max_entries, ttl, cache_nondeterministic)
+        else:
+            _cache.max_entries = max_entries
+            _cache.ttl = ttl
+            _cache.cache_nondeterministic = cache_nondeterministic
+        return _cache
+
+
+def get_cache():
+    if _cache is None:
+        return configure()
+    return _cache
@@ -0,0 +1,173 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# In-process latency histograms, call/error counts and token usage per stage and
+# tenant. Stages are named "<service>.<operation>" (openai.chat, mongo.customers.find,
+# graphql.saveOrder). The tenant comes from the current_tenant context variable,
+# so it follows the code into asyncio tasks and into worker threads that run in a
+# copied context.
+
+current_tenant = contextvars.ContextVar("current_tenant", default="unknown")
+
+# Upper bounds of the latency buckets in milliseconds; the last bucket is +Inf
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+def _new_series():
+    return {
+        "count": 0,
+        "errors": 0,
+        "sum_ms": 0.0,
+        "buckets": [0] * (len(BUCKETS_MS) + 1),
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+    }
+
+
+def _bucket(duration_ms):
+    for index, bound in enumerate(BUCKETS_MS):
+        if duration_ms <= bound:
+            return index
+    return len(BUCKETS_MS)
+
+
+def _quantile(buckets, count, quantile):
+    # Upper bound of the bucket holding the quantile, like Prometheus' histogram_quantile
+    if not count:
+        return 0.0
+    rank = quantile * count
+    seen = 0
+    for index, bucket_count in enumerate(buckets):
+        seen += bucket_count
+        if seen >= rank:
+            return float(BUCKETS_MS[index]) if index < len(BUCKETS_MS) else float("inf")
+    return float("inf")
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _get(self, stage, tenant):
+        key = (stage, tenant if tenant is not None else current_tenant.get())
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _new_series()
+        return series
+
+    def observe(self, stage, duration_ms, error=False, tenant=None):
+        with self._lock:
+            series = self._get(stage, tenant)
+            series["count"] += 1
+            series["errors"] += bool(error)
+            series["sum_ms"] += duration_ms
+            series["buckets"][_bucket(duration_ms)] += 1
+
+    def add_tokens(self, stage, prompt_tokens=0, completion_tokens=0, tenant=None):
+        with self._lock:
+            series = self._get(stage, tenant)
+            series["prompt_tokens"] += prompt_tokens or 0
+            series["completion_tokens"] += completion_tokens or 0
+
+    # Times the block; set span["error"] inside it to count a failed response
+    @contextmanager
+    def timed(self, stage):
+        span = {"error": False}
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception:
+            span["error"] = True
+            raise
+        finally:
+            self.observe(stage, (time.perf_counter() - started) * 1000, span["error"])
+
+    # One summary dict per (stage, tenant) with approximate p50/p95 from the buckets
+    def snapshot(self):
+        with self._lock:
+            series = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._series.items()}
+        rows = []
+        for (stage, tenant), value in sorted(series.items()):
+            rows.append({
+                "stage": stage,
+                "tenant": tenant,
+                "count": value["count"],
+                "errors": value["errors"],
+                "mean_ms": value["sum_ms"] / value["count"] if value["count"] else 0.0,
+                "p50_ms": _quantile(value["buckets"], value["count"], 0.5),
+                "p95_ms": _quantile(value["buckets"], value["count"], 0.95),
+                "sum_ms": value["sum_ms"],
+                "buckets": value["buckets"],
+                "prompt_tokens": value["prompt_tokens"],
+                "completion_tokens": value["completion_tokens"],
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def to_json_lines(self):
+        timestamp = time.time()
+        return "".join(json.dumps(dict(row, timestamp=timestamp)) + "\n" for row in self.snapshot())
+
+    def to_prometheus(self):
+        lines = [
+            "# TYPE order_app_stage_duration_ms histogram",
+            "# TYPE order_app_stage_errors_total counter",
+            "# TYPE order_app_llm_tokens_total counter",
+        ]
+        histogram, errors, tokens = [], [], []
+        for row in self.snapshot():
+            labels = f'stage="{_escape(row["stage"])}",tenant="{_escape(row["tenant"])}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS_MS + ["+Inf"], row["buckets"]):
+                cumulative += bucket_count
+                histogram.append(f'order_app_stage_duration_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+            histogram.append(f"order_app_stage_duration_ms_sum{{{labels}}} {row['sum_ms']}")
+            histogram.append(f"order_app_stage_duration_ms_count{{{labels}}} {row['count']}")
+            errors.append(f"order_app_stage_errors_total{{{labels}}} {row['errors']}")
+            if row["prompt_tokens"] or row["completion_tokens"]:
+                tokens.append(f'order_app_llm_tokens_total{{{labels},kind="prompt"}} {row["prompt_tokens"]}')
+                tokens.append(f'order_app_llm_tokens_total{{{labels},kind="completion"}} {row["completion_tokens"]}')
+        return "\n".join(lines[:1] + histogram + lines[1:2] + errors + lines[2:] + tokens) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Records every MongoDB command as mongo.<collection>.<command>. pymongo calls the
+# listener on the thread that ran the command, so current_tenant is the caller's.
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self, registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        stage = f"mongo.{collection}.{event.command_name}" if isinstance(collection, str) else f"mongo.{event.command_name}"
+        with self._lock:
+            self._stages[(event.connection_id, event.request_id)] = (stage, current_tenant.get())
+
+    def _finish(self, event, error):
+        with self._lock:
+            stage, tenant = self._stages.pop((event.connection_id, event.request_id), (f"mongo.{event.command_name}", None))
+        self.registry.observe(stage, event.duration_micros / 1000, error, tenant)
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+metrics = Metrics()
+mongo_listener = MongoCommandListener(metrics)
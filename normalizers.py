@@ -0,0 +1,291 @@
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+# Local parsers for order dates and quantities. They return None when the input
+# can't be parsed with confidence so the caller can fall back to the LLM.
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3,
+    "apr": 4, "april": 4, "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7,
+    "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9, "oct": 10, "october": 10,
+    "nov": 11, "november": 11, "dec": 12, "december": 12
+}
+
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tue": 1, "tues": 1, "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "thur": 3, "thurs": 3, "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5, "sunday": 6, "sun": 6
+}
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19
+}
+
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90
+}
+
+SCALES = {"thousand": 1000, "million": 1000000}
+
+# Counters for how often the local parsers answered without an LLM call
+_stats_lock = threading.Lock()
+_stats = {
+    "date": {"fast": 0, "llm": 0},
+    "quantity": {"fast": 0, "llm": 0},
+    "intent": {"fast": 0, "llm": 0}
+}
+
+
+def record_fast_path(kind, fast):
+    with _stats_lock:
+        _stats[kind]["fast" if fast else "llm"] += 1
+
+
+def fast_path_stats():
+    with _stats_lock:
+        stats = {}
+        for kind, counts in _stats.items():
+            total = counts["fast"] + counts["llm"]
+            stats[kind] = {
+                "fast": counts["fast"],
+                "llm": counts["llm"],
+                "fast_rate": counts["fast"] / total if total else 0.0
+            }
+        return stats
+
+
+def _to_epoch_ms(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _midnight(dt):
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _build_date(year, month, day):
+    if year < 100:
+        year += 2000
+    try:
+        return datetime(year, month, day, tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _parse_time(text):
+    # Accepts "10:30", "10:30:15", "10:30 pm", "10 am"
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?(?::(\d{2}))?\s*(am|pm)?", text.strip())
+    if not match or (match.group(2) is None and match.group(4) is None):
+        return None
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    second = int(match.group(3) or 0)
+    meridiem = match.group(4)
+    if meridiem:
+        if hour < 1 or hour > 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return hour, minute, second
+
+
+def _parse_relative_date(text, now):
+    today = _midnight(now)
+    if text == "now":
+        return now
+    if text == "today":
+        return today
+    if text == "yesterday":
+        return today - timedelta(days=1)
+    if text in ("day before yesterday", "the day before yesterday"):
+        return today - timedelta(days=2)
+
+    match = re.fullmatch(r"(\d+|an?|one|two|three|four|five|six|seven) (day|week)s? ago", text)
+    if match:
+        amount = match.group(1)
+        amount = 1 if amount in ("a", "an") else UNITS.get(amount, None) or int(amount)
+        days = amount * (7 if match.group(2) == "week" else 1)
+        return today - timedelta(days=days)
+
+    match = re.fullmatch(r"last (\w+)", text)
+    if match and match.group(1) in WEEKDAYS:
+        # "last Monday" is the most recent Monday strictly before today
+        delta = (today.weekday() - WEEKDAYS[match.group(1)]) % 7 or 7
+        return today - timedelta(days=delta)
+    return None
+
+
+def _parse_numeric_date(text):
+    # 2024-05-01, 2024/05/01, 20240501
+    match = re.fullmatch(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})", text)
+    if match:
+        return _build_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = re.fullmatch(r"(\d{4})(\d{2})(\d{2})", text)
+    if match:
+        return _build_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    # US (MM/DD/YYYY) or EU (DD/MM/YYYY); US wins when both readings are valid
+    match = re.fullmatch(r"(\d{1,2})[-/.](\d{1,2})[-/.](\d{2}|\d{4})", text)
+    if match:
+        first, second, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        if first > 12:
+            return _build_date(year, second, first)
+        return _build_date(year, first, second)
+    return None
+
+
+def _parse_named_month_date(text):
+    # May 1, 2024 / 1 May 2024 / 1st of May 2024 / Wed, May 1st 2024
+    tokens = re.sub(r"[,]", " ", text).split()
+    tokens = [token for token in tokens if token not in ("of", "the") and token not in WEEKDAYS]
+    month = None
+    numbers = []
+    for token in tokens:
+        token = token.rstrip(".")
+        if token in MONTHS and month is None:
+            month = MONTHS[token]
+            continue
+        number = re.fullmatch(r"(\d{1,4})(st|nd|rd|th)?", token)
+        if not number:
+            return None
+        numbers.append((number.group(1), number.group(2)))
+    if month is None or len(numbers) != 2:
+        return None
+
+    day = year = None
+    for digits, suffix in numbers:
+        if len(digits) == 4 and not suffix:
+            year = int(digits)
+        elif len(digits) <= 2 and day is None:
+            day = int(digits)
+    if day is None or year is None:
+        return None
+    return _build_date(year, month, day)
+
+
+# Returns epoch time in milliseconds (UTC) or None if the date is not recognised
+def normalize_date(value, now=None):
+    if value is None:
+        return None
+    if now is None:
+        now = datetime.now(timezone.utc)
+    text = str(value).strip().lower()
+    if not text:
+        return None
+
+    # Already an epoch timestamp in milliseconds
+    if re.fullmatch(r"\d{13}", text):
+        return int(text)
+
+    relative = _parse_relative_date(text, now)
+    if relative is not None:
+        return _to_epoch_ms(relative)
+
+    iso_text = text[:-1] + "+00:00" if text.endswith("z") else text
+    try:
+        return _to_epoch_ms(datetime.fromisoformat(iso_text.upper() if "t" in iso_text else iso_text))
+    except ValueError:
+        pass
+
+    date_part, time_part = text, None
+    match = re.fullmatch(r"(\S+)\s+(\d{1,2}(?::\d{2}){0,2}\s*(?:am|pm)?)", text)
+    if match:
+        date_part, time_part = match.group(1), match.group(2)
+
+    parsed = _parse_numeric_date(date_part)
+    if parsed is None and time_part is None:
+        parsed = _parse_named_month_date(text)
+    if parsed is None:
+        return None
+
+    if time_part is not None:
+        parsed_time = _parse_time(time_part)
+        if parsed_time is None:
+            return None
+        parsed = parsed.replace(hour=parsed_time[0], minute=parsed_time[1], second=parsed_time[2])
+    return _to_epoch_ms(parsed)
+
+
+def _words_to_int(text):
+    tokens = [token for token in re.split(r"[\s-]+", text.replace(",", " ")) if token and token != "and"]
+    if not tokens:
+        return None
+    total = 0
+    current = 0
+    last_scale = None
+    seen_number = False
+    for index, token in enumerate(tokens):
+        if token in ("a", "an") and index == 0:
+            current = 1
+            continue
+        # Run-on numbers ("one two", "1 5") are rejected rather than added up
+        below_hundred = current % 100
+        if token in UNITS:
+            if below_hundred and (below_hundred < 20 or below_hundred % 10 or UNITS[token] >= 10):
+                return None
+            current += UNITS[token]
+        elif token in TENS:
+            if below_hundred:
+                return None
+            current += TENS[token]
+        elif token == "hundred":
+            if current >= 100:
+                return None
+            current = (current or 1) * 100
+        elif token in SCALES:
+            # Scales must get smaller ("one million two thousand", not "thousand thousand")
+            if last_scale is not None and SCALES[token] >= last_scale:
+                return None
+            last_scale = SCALES[token]
+            total += (current or 1) * SCALES[token]
+            current = 0
+        elif token.isdigit():
+            # Mixed forms like "2 hundred" or "3 thousand"; a digit can only start the number
+            if seen_number or current:
+                return None
+            current += int(token)
+        else:
+            return None
+        seen_number = True
+    if not seen_number:
+        return None
+    return total + current
+
+
+# Returns the quantity as an int, "Quantity not valid" for numbers that can't be a
+# quantity, or None if the input isn't recognised
+def normalize_quantity(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else "Quantity not valid"
+    if isinstance(value, float):
+        if value != value or not value.is_integer() or value <= 0:
+            return "Quantity not valid"
+        return int(value)
+
+    text = str(value).strip().lower()
+    if not text:
+        return None
+
+    match = re.fullmatch(r"([-+]?)(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?", text)
+    if match:
+        if match.group(3) and match.group(3).strip("0"):
+            return "Quantity not valid"
+        number = int(match.group(2).replace(",", ""))
+        if match.group(1) == "-" or number <= 0:
+            return "Quantity not valid"
+        return number
+
+    number = _words_to_int(text)
+    if number is None:
+        return None
+    return number if number > 0 else "Quantity not valid"
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Process-wide cache for reference data (customers, warehouses, product variants).
+# It lives in its own module so it survives Streamlit reruns and is shared by
+# every session. Entries are keyed by (tenant id, kind, key), expire after a TTL
+# and the least recently used entries are evicted once max_entries is reached.
+# Lookups that found nothing are cached too (as None) with a shorter TTL.
+
+MISS = object()
+
+
+class ReferenceCache:
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=50000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def configure(self, ttl=None, negative_ttl=None, max_entries=None):
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if negative_ttl is not None:
+                self.negative_ttl = negative_ttl
+            if max_entries is not None:
+                self.max_entries = max_entries
+                self._evict()
+
+    def _count(self, kind, counter, amount=1):
+        counts = self._stats.setdefault(kind, {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0})
+        counts[counter] += amount
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            (_, kind, _), _ = self._entries.popitem(last=False)
+            self._count(kind, "evictions")
+
+    # Returns the cached value (None for a cached "not found") or MISS
+    def get(self, tenant_id, kind, key):
+        cache_key = (tenant_id, kind, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[cache_key]
+                self._count(kind, "misses")
+                return MISS
+            self._entries.move_to_end(cache_key)
+            self._count(kind, "hits" if entry[0] is not None else "negative_hits")
+            return entry[0]
+
+    def set(self, tenant_id, kind, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[(tenant_id, kind, key)] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end((tenant_id, kind, key))
+            self._evict()
+
+    def get_or_load(self, tenant_id, kind, key, loader):
+        value = self.get(tenant_id, kind, key)
+        if value is MISS:
+            value = loader()
+            self.set(tenant_id, kind, key, value)
+        return value
+
+    # Drops entries for a tenant, optionally only one kind or one key
+    def invalidate(self, tenant_id=None, kind=None, key=None):
+        with self._lock:
+            if tenant_id is None and kind is None and key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            stale = [
+                cache_key for cache_key in self._entries
+                if (tenant_id is None or cache_key[0] == tenant_id)
+                and (kind is None or cache_key[1] == kind)
+                and (key is None or cache_key[2] == key)
+            ]
+            for cache_key in stale:
+                del self._entries[cache_key]
+            return len(stale)
+
+    def stats(self):
+        with self._lock:
+            kinds = {kind: dict(counts) for kind, counts in self._stats.items()}
+            hits = sum(counts["hits"] + counts["negative_hits"] for counts in kinds.values())
+            misses = sum(counts["misses"] for counts in kinds.values())
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "kinds": kinds
+            }
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,104 @@
+import contextvars
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from pymongo.errors import AutoReconnect, NetworkTimeout
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# Bounded-parallel submission of queued orders/consignments. Each item is passed
+# to a submit function on a worker thread; transient failures are retried with
+# exponential backoff and everything else is recorded as a failed result.
+
+
+# Raise from a submit function to have the item retried
+class TransientSubmissionError(Exception):
+    pass
+
+
+def is_transient_error(error):
+    if isinstance(error, (TransientSubmissionError, AutoReconnect, NetworkTimeout)):
+        return True
+    # Only failures to connect are retried: the request provably never reached the
+    # server, so retrying can't create duplicates. Anything later (a reset
+    # connection, a read timeout, a 502/504 gateway page that isn't JSON) may come
+    # after the save was committed, so it is reported as failed instead.
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+def _submit_with_retry(submit_item, item, max_retries, backoff, is_transient):
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            success, message = submit_item(item)
+            return {"success": success, "message": message, "attempts": attempts}
+        except Exception as e:
+            if attempts > max_retries or not is_transient(e):
+                return {"success": False, "message": f"{type(e).__name__}: {e}", "attempts": attempts}
+            # Exponential backoff with jitter so workers don't retry in lockstep
+            time.sleep(backoff * (2 ** (attempts - 1)) * (0.5 + random.random()))
+
+
+# Submits every item and returns one result dict per item, in the original order.
+# submit_item(item) returns (success, message). on_progress(done, total) is called
+# from the calling thread at most every progress_interval seconds and once at the end.
+def submit_all(items, submit_item, max_workers=8, max_retries=3, backoff=0.5,
+               is_transient=is_transient_error, on_progress=None, progress_interval=0.5):
+    total = len(items)
+    results = [None] * total
+    if not total:
+        return results
+
+    done = 0
+    last_progress = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+        # Each item runs in a copy of the caller's context so context variables
+        # (such as the metrics tenant) carry over to the worker threads
+        futures = {
+            executor.submit(contextvars.copy_context().run, _submit_with_retry, submit_item, item, max_retries, backoff, is_transient): index
+            for index, item in enumerate(items)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done += 1
+            if on_progress and (done == total or time.monotonic() - last_progress >= progress_interval):
+                on_progress(done, total)
+                last_progress = time.monotonic()
+
+    return results
+
+
+# Like submit_all, but items are sent in batches of batch_size. submit_batch(batch)
+# returns one (success, message) per item of the batch; a batch that raises is
+# retried as a whole and, once retries run out, every item in it is failed.
+def submit_in_batches(items, submit_batch, batch_size=10, on_progress=None, **options):
+    batch_size = max(1, batch_size)
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+    def batch_progress(done, total):
+        on_progress(min(done * batch_size, len(items)), len(items))
+
+    batch_results = submit_all(
+        batches,
+        lambda batch: (True, submit_batch(batch)),
+        on_progress=batch_progress if on_progress else None,
+        **options
+    )
+
+    results = []
+    for batch, result in zip(batches, batch_results):
+        if result["success"]:
+            results.extend(
+                {"success": success, "message": message, "attempts": result["attempts"]}
+                for success, message in result["message"]
+            )
+        else:
+            results.extend(dict(result) for _ in batch)
+    return results
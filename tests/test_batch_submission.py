@@ -0,0 +1,115 @@
+import re
+
+import pytest
+
+import app
+import graphql_client
+from graphql_client import UNAUTHORIZED_RESPONSE, is_unauthorized, with_batch_token_refresh
+
+SAVED = {"message": "Order saved successfully"}
+
+
+# Stands in for the GraphQL API: records each request as (token, [orderId, ...])
+# and answers it with respond(token, order ids), which returns a response per order
+# id: the saved message, an error dict, or a dict for the whole document
+class FakeAPI:
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+
+    def execute(self, url, query, variables, tenant_id, tenant_name, token=None):
+        aliases = re.findall(r"(\w+): saveOrder\(", query)
+        order_ids = [variables[f"{alias}_orderId"] for alias in aliases] if aliases else [variables["orderId"]]
+        self.requests.append((token, order_ids))
+        answer = self.respond(token, order_ids)
+        if "document" in answer:
+            return answer["document"]
+        if not aliases:
+            answer = answer[order_ids[0]]
+            return {"data": {"saveOrder": answer}} if answer is SAVED else {"data": {"saveOrder": None}, "errors": [answer]}
+        data = {"data": {}, "errors": []}
+        for alias, order_id in zip(aliases, order_ids):
+            if answer[order_id] is SAVED:
+                data["data"][alias] = SAVED
+            else:
+                data["data"][alias] = None
+                data["errors"].append(dict(answer[order_id], path=[alias]))
+        return data
+
+
+@pytest.fixture
+def api(monkeypatch):
+    def install(respond):
+        fake = FakeAPI(respond)
+        monkeypatch.setattr(graphql_client, "execute", fake.execute)
+        return fake
+    return install
+
+
+def submit(order_ids):
+    tokens = iter(["old", "new"])
+    responses = with_batch_token_refresh(
+        lambda token, items: app.save_orders_batch("http://api", token, items, "t1", "acme"),
+        [{"orderId": order_id} for order_id in order_ids],
+        lambda stale_token=None: next(tokens)
+    )
+    return [app.check_save_response(response, "saveOrder", app.ORDER_SUCCESS_MESSAGES)[0] for response in responses]
+
+
+def test_unauthorized_item_is_the_only_one_resent(api):
+    expired = {"message": "jwt expired", "extensions": {"code": "UNAUTHENTICATED"}}
+    fake = api(lambda token, ids: {order_id: expired if token == "old" and order_id == "O2" else SAVED for order_id in ids})
+    assert submit(["O1", "O2", "O3"]) == [True, True, True]
+    assert fake.requests == [("old", ["O1", "O2", "O3"]), ("new", ["O2"])]
+
+
+def test_rejected_request_resends_the_whole_batch(api):
+    fake = api(lambda token, ids: {"document": UNAUTHORIZED_RESPONSE} if token == "old" else {order_id: SAVED for order_id in ids})
+    assert submit(["O1", "O2"]) == [True, True]
+    assert fake.requests == [("old", ["O1", "O2"]), ("new", ["O1", "O2"])]
+
+
+def test_document_error_falls_back_to_single_requests(api):
+    invalid = {"document": {"errors": [{"message": 'Variable "$m1_orderDate" got invalid value'}]}}
+    bad_date = {"message": "Invalid date"}
+    fake = api(lambda token, ids: invalid if len(ids) > 1 else {ids[0]: bad_date if ids[0] == "O2" else SAVED})
+    assert submit(["O1", "O2", "O3"]) == [True, False, True]
+    assert fake.requests == [("old", ["O1", "O2", "O3"]), ("old", ["O1"]), ("old", ["O2"]), ("old", ["O3"])]
+
+
+def test_item_errors_are_not_retried(api):
+    fake = api(lambda token, ids: {order_id: {"message": "Invalid SKU"} if order_id == "O1" else SAVED for order_id in ids})
+    assert submit(["O1", "O2"]) == [False, True]
+    assert len(fake.requests) == 1
+
+
+def test_split_batch_response_keeps_input_order():
+    data = {
+        "data": {"m2": {"message": "third"}, "m0": {"message": "first"}, "m1": None},
+        "errors": [{"message": "Invalid SKU", "path": ["m1", "orderLineItems"]}],
+    }
+    responses, failed_document = app.split_batch_response(data, ["m0", "m1", "m2"], "saveOrder")
+    assert responses == [
+        {"data": {"saveOrder": {"message": "first"}}},
+        {"errors": [{"message": "Invalid SKU", "path": ["m1", "orderLineItems"]}]},
+        {"data": {"saveOrder": {"message": "third"}}},
+    ]
+    assert not failed_document
+
+
+def test_split_batch_response_copies_document_errors_to_every_item():
+    error = {"message": "Syntax error"}
+    responses, failed_document = app.split_batch_response({"errors": [error]}, ["m0", "m1"], "saveOrder")
+    assert responses == [{"errors": [error]}, {"errors": [error]}]
+    assert failed_document
+
+
+@pytest.mark.parametrize("response, expected", [
+    (UNAUTHORIZED_RESPONSE, True),
+    ({"errors": [{"message": "Unauthorized"}], "data": {"saveOrder": None}}, True),
+    ({"errors": [{"message": "Unauthorized"}], "data": {"saveOrder": {"message": "Order saved successfully"}}}, False),
+    ({"errors": [{"message": "Invalid SKU"}]}, False),
+    (None, False),
+])
+def test_is_unauthorized(response, expected):
+    assert is_unauthorized(response) == expected
@@ -0,0 +1,42 @@
+import pytest
+
+from app import normalize_consignment_structure
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1Z1, 1Z2", ["1Z1", "1Z2"]),
+    ("1Z1;1Z2\n 1Z3 ", ["1Z1", "1Z2", "1Z3"]),
+    ("9400 1000 0000 0000 0000 00", ["9400 1000 0000 0000 0000 00"]),
+    ("9400 1000 0000 0000 0000 00, 9400 1000 0000 0000 0000 01", ["9400 1000 0000 0000 0000 00", "9400 1000 0000 0000 0000 01"]),
+    (["1Z1", " ", 42], ["1Z1", "42"]),
+    ("", []),
+    (None, []),
+])
+def test_tracking_number_becomes_a_list(value, expected):
+    assert normalize_consignment_structure({"Tracking Number": value})["Tracking Number"] == expected
+
+
+def test_dropship_data_from_key_value_text():
+    consignment = normalize_consignment_structure({
+        "Dropship Data": "Is Case: yes, Label URL: https://x.com/a,b.pdf; shipping address = 12 Main St, Springfield\nPer Case Quantity: 12,"
+    })
+    assert consignment["Dropship Data"] == {
+        "Is Case": "yes",
+        "Label URL": "https://x.com/a,b.pdf",
+        "Shipping Address": "12 Main St, Springfield",
+        "Per Case Quantity": "12",
+    }
+    assert consignment["Label URL"] == "https://x.com/a,b.pdf"
+
+
+def test_dropship_data_from_json_keeps_top_level_values():
+    consignment = normalize_consignment_structure({
+        "Dropship Data": '{"Is Case": "no", "Label Source": "carrier"}',
+        "Label Source": "customer",
+    })
+    assert consignment["Dropship Data"] == {"Is Case": "no", "Label Source": "carrier"}
+    assert (consignment["Is Case"], consignment["Label Source"]) == ("no", "customer")
+
+
+def test_unparseable_dropship_data_is_dropped():
+    assert normalize_consignment_structure({"Dropship Data": "n/a"})["Dropship Data"] == {}
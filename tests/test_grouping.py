@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app import (
+    group_rows, group_conflict, create_grouped_order_data, ORDER_GROUP_KEY, ORDER_LEVEL_FIELDS,
+    CONSIGNMENT_GROUP_KEY, CONSIGNMENT_LEVEL_FIELDS
+)
+
+
+def epoch_ms(*parts):
+    return int(datetime(*parts, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def order(order_id, sku, **fields):
+    row = {"Customer ID": "C1", "Warehouse ID": "W1", "Order ID": order_id, "Product SKU": sku}
+    row.update(fields)
+    return row
+
+
+def test_rows_with_the_same_key_form_one_group_in_added_order():
+    rows = [order("O1", "A"), order("O2", "B"), order("O1", "C"), order("O1", "D", **{"Warehouse ID": "W2"})]
+    groups = group_rows(rows, ORDER_GROUP_KEY, "Order ID")
+    assert [[row["Product SKU"] for row in group] for group in groups] == [["A", "C"], ["B"], ["D"]]
+
+
+def test_rows_without_the_identity_field_are_never_grouped():
+    rows = [order("", "A"), order(None, "B"), order("", "C")]
+    assert [len(group) for group in group_rows(rows, ORDER_GROUP_KEY, "Order ID")] == [1, 1, 1]
+
+
+def test_consignments_group_on_consignment_number():
+    rows = [
+        {"Customer ID": "C1", "Warehouse ID": "W1", "Consignment Number": "CN1", "Order ID": "O1"},
+        {"Customer ID": "C1", "Warehouse ID": "W1", "Consignment Number": "CN1", "Order ID": "O2"},
+        {"Customer ID": "C1", "Warehouse ID": "W1", "Consignment Number": "", "Order ID": "O1"},
+    ]
+    assert [len(group) for group in group_rows(rows, CONSIGNMENT_GROUP_KEY, "Consignment Number")] == [2, 1]
+
+
+# An empty key is what --no-group and an unticked "group rows" box pass
+def test_empty_key_keeps_every_row_separate():
+    rows = [order("O1", "A"), order("O1", "B")]
+    assert group_rows(rows, [], "Order ID") == [[rows[0]], [rows[1]]]
+
+
+def test_blank_values_are_not_a_conflict():
+    group = [order("O1", "A", Carrier="UPS"), order("O1", "B", Carrier=""), order("O1", "C")]
+    assert group_conflict(group, ORDER_LEVEL_FIELDS, "Order ID") is None
+
+
+def test_dates_are_compared_by_day():
+    same_day = [
+        order("O1", "A", **{"Order Date": epoch_ms(2024, 5, 1, 9)}),
+        order("O1", "B", **{"Order Date": epoch_ms(2024, 5, 1, 17, 30)}),
+    ]
+    assert group_conflict(same_day, ORDER_LEVEL_FIELDS, "Order ID") is None
+    next_day = same_day + [order("O1", "C", **{"Order Date": epoch_ms(2024, 5, 2)})]
+    assert group_conflict(next_day, ORDER_LEVEL_FIELDS, "Order ID") == "Rows with Order ID O1 disagree on Order Date"
+
+
+def test_conflicting_fields_are_all_named():
+    group = [
+        {"Consignment Number": "CN1", "Carrier": "UPS", "Tracking Number": ["1Z1"], "Dropship Data": {"Is Case": "yes"}},
+        {"Consignment Number": "CN1", "Carrier": "DHL", "Tracking Number": ["1Z1"], "Dropship Data": {"Is Case": "no"}},
+    ]
+    assert group_conflict(group, CONSIGNMENT_LEVEL_FIELDS, "Consignment Number") == \
+        "Rows with Consignment Number CN1 disagree on Carrier, Dropship Data"
+
+
+def test_conflicting_group_is_not_built():
+    group = [order("O1", "A", Carrier="UPS"), order("O1", "B", Carrier="DHL")]
+    with pytest.raises(ValueError, match="disagree on Carrier"):
+        create_grouped_order_data(group, None, None, "t1")
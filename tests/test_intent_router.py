@@ -0,0 +1,51 @@
+import pytest
+
+from intent_router import (
+    IntentRouter, router, normalize_intent, CREATE_ORDER, CREATE_CONSIGNMENT, COMING_SOON, REFUSAL
+)
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("create order", CREATE_ORDER),
+    ("I want to make a new consignment", CREATE_CONSIGNMENT),
+    ("create a product listing", COMING_SOON),
+    ("cancel my order", REFUSAL),
+])
+def test_rules_answer_regardless_of_threshold(text, intent):
+    assert router.classify(text, threshold=2.0)[::2] == (intent, "rules")
+
+
+def test_scorer_answers_at_or_above_threshold():
+    _, best, source = router.classify("consignmnet pls", threshold=1.0)
+    assert source == "scorer"
+    assert router.classify("consignmnet pls", threshold=best) == (CREATE_CONSIGNMENT, best, "scorer")
+    assert router.classify("consignmnet pls", threshold=best + 0.01) == (None, best, "scorer")
+
+
+def test_default_threshold_is_used():
+    strict = IntentRouter(threshold=0.99)
+    assert strict.classify("ordr")[0] is None
+    assert IntentRouter(threshold=0.1).classify("ordr")[0] == CREATE_ORDER
+
+
+def test_scorer_defers_when_margin_is_too_small():
+    scores = sorted(router.scores("ordr").values(), reverse=True)
+    gap = scores[0] - scores[1]
+    assert IntentRouter(threshold=0.0, margin=gap - 0.01).classify("ordr")[0] == CREATE_ORDER
+    assert IntentRouter(threshold=0.0, margin=gap + 0.01).classify("ordr")[0] is None
+
+
+@pytest.mark.parametrize("text", ["hello", "track my shipment", "asdf qwer"])
+def test_unclear_messages_go_to_the_llm(text):
+    assert router.classify(text)[0] is None
+
+
+@pytest.mark.parametrize("reply, intent", [
+    ("Create order.", CREATE_ORDER),
+    ("The user wants to create a consignment", CREATE_CONSIGNMENT),
+    ("This feature is coming soon!", COMING_SOON),
+    ("I'm sorry, I can't help with orders", REFUSAL),
+    ("no idea", REFUSAL),
+])
+def test_normalize_intent(reply, intent):
+    assert normalize_intent(reply) == intent
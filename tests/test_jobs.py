@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobStore, JobRunner, JobCancelled
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def create(store, **options):
+    return store.create_job("order", "t1", "acme", "orders.csv", b"a,b\n1,2\n", **options)
+
+
+def test_claim_takes_oldest_queued_job_once(store, clock):
+    first = create(store)
+    clock[0] += 1
+    second = create(store)
+    job = store.claim("worker-a")
+    assert (job["id"], job["status"], job["lease_owner"]) == (first, "running", "worker-a")
+    assert store.claim("worker-b")["id"] == second
+    assert store.claim("worker-c") is None
+
+
+def test_expired_lease_is_claimed_by_another_worker(store, clock):
+    job_id = create(store)
+    store.claim("worker-a", lease=60)
+    clock[0] += 59
+    assert store.claim("worker-b", lease=60) is None
+    store.heartbeat(job_id, "worker-a", lease=60)
+    clock[0] += 59
+    assert store.claim("worker-b", lease=60) is None
+    clock[0] += 2
+    assert store.claim("worker-b", lease=60)["lease_owner"] == "worker-b"
+
+    # The first worker's writes are rejected once it lost the lease
+    with pytest.raises(JobCancelled):
+        store.checkpoint_rows(job_id, "worker-a", [(0, "valid", None, {"a": 1})], 1)
+    with pytest.raises(JobCancelled):
+        store.heartbeat(job_id, "worker-a")
+    assert store.counts(job_id) == {}
+
+
+def test_cancel_stops_the_owner(store, clock):
+    job_id = create(store)
+    store.claim("worker-a")
+    store.checkpoint_rows(job_id, "worker-a", [(0, "valid", None, {"a": 1}), (1, "valid", None, {"a": 2})], 2)
+    store.cancel(job_id)
+    with pytest.raises(JobCancelled):
+        store.check_owner(job_id, "worker-a")
+    with pytest.raises(JobCancelled):
+        store.update(job_id, "worker-a", status="done")
+    # Rows of a batch that was already sent can still be recorded
+    store.set_row_status(job_id, "worker-a", [0], "saved", None)
+    with pytest.raises(JobCancelled):
+        store.set_row_status(job_id, "worker-b", [1], "saved", None)
+    assert store.get(job_id)["status"] == "cancelled"
+    assert store.counts(job_id) == {"saved": 1, "valid": 1}
+    assert store.claim("worker-b") is None
+
+
+def test_job_resumes_from_checkpoint(store, clock):
+    job_id = create(store)
+    store.claim("worker-a", lease=60)
+    store.checkpoint_rows(job_id, "worker-a", [(0, "valid", None, {"a": 1}), (1, "invalid", "Customer not valid", None)], 2)
+    clock[0] += 61
+
+    job = store.claim("worker-b", lease=60)
+    assert (job["processed_rows"], job["stage"]) == (2, "validate")
+    store.checkpoint_rows(job_id, "worker-b", [(2, "valid", None, {"a": 3})], 3)
+    store.update(job_id, "worker-b", status="waiting")
+    assert store.pending_rows(job_id) == [(0, {"a": 1}), (2, {"a": 3})]
+
+    store.request_submit(job_id)
+    job = store.claim("worker-c")
+    assert (job["stage"], job["status"], job["processed_rows"]) == ("submit", "running", 3)
+    store.set_row_status(job_id, "worker-c", [0, 2], "saved", None)
+    store.update(job_id, "worker-c", status="done")
+    assert store.counts(job_id) == {"saved": 2, "invalid": 1}
+
+
+def test_runner_fails_job_on_handler_error(store):
+    job_id = create(store)
+    handled = threading.Event()
+
+    def handler(store, job, owner):
+        handled.set()
+        raise ValueError("bad file")
+
+    runner = JobRunner(store, handler, workers=1, poll_interval=0.01).start()
+    try:
+        assert handled.wait(5)
+    finally:
+        runner.stop(5)
+    job = store.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "ValueError: bad file")
+
+
+def test_runner_renews_lease_of_slow_handler(store):
+    job_id = create(store)
+    started, release = threading.Event(), threading.Event()
+
+    def handler(store, job, owner):
+        started.set()
+        release.wait(5)
+        store.update(job["id"], owner, status="done")
+
+    runner = JobRunner(store, handler, workers=1, poll_interval=0.01, lease=0.3).start()
+    try:
+        assert started.wait(5)
+        time.sleep(0.6)
+        assert store.claim("worker-b", lease=0.3) is None
+        release.set()
+    finally:
+        runner.stop(5)
+    assert store.get(job_id)["status"] == "done"
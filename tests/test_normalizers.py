@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from normalizers import normalize_date, normalize_quantity
+
+# Wednesday 15 May 2024, 13:45 UTC
+NOW = datetime(2024, 5, 15, 13, 45, tzinfo=timezone.utc)
+
+
+def epoch_ms(*parts):
+    return int(datetime(*parts, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-05-01", epoch_ms(2024, 5, 1)),
+    ("20240501", epoch_ms(2024, 5, 1)),
+    ("1714521600000", 1714521600000),
+    ("2024-05-01T10:30:00Z", epoch_ms(2024, 5, 1, 10, 30)),
+    ("May 1st, 2024", epoch_ms(2024, 5, 1)),
+    ("1st of May 2024", epoch_ms(2024, 5, 1)),
+    ("Wed, May 1 2024", epoch_ms(2024, 5, 1)),
+    ("  TODAY ", epoch_ms(2024, 5, 15)),
+    ("yesterday", epoch_ms(2024, 5, 14)),
+    ("2 weeks ago", epoch_ms(2024, 5, 1)),
+    ("last monday", epoch_ms(2024, 5, 13)),
+    # The weekday of today itself means a week back
+    ("last wednesday", epoch_ms(2024, 5, 8)),
+])
+def test_normalize_date(value, expected):
+    assert normalize_date(value, NOW) == expected
+
+
+def test_normalize_date_prefers_us_order_when_ambiguous():
+    assert normalize_date("05/01/2024", NOW) == epoch_ms(2024, 5, 1)
+    assert normalize_date("13/05/2024", NOW) == epoch_ms(2024, 5, 13)
+    assert normalize_date("01/05/24", NOW) == epoch_ms(2024, 1, 5)
+
+
+def test_normalize_date_with_time():
+    assert normalize_date("05/01/2024 10:30 pm", NOW) == epoch_ms(2024, 5, 1, 22, 30)
+    assert normalize_date("05/01/2024 12 am", NOW) == epoch_ms(2024, 5, 1)
+
+
+@pytest.mark.parametrize("value", [None, "", "   ", "31/02/2024", "2024-13-01", "05/01/2024 13 pm", "next friday", "soon"])
+def test_normalize_date_unrecognised(value):
+    assert normalize_date(value, NOW) is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    (3, 3),
+    (3.0, 3),
+    ("12", 12),
+    (" 1,000 ", 1000),
+    ("12.00", 12),
+    ("+4", 4),
+    ("twenty-one", 21),
+    ("two hundred and five", 205),
+    ("a hundred", 100),
+    ("3 thousand", 3000),
+    ("one million two hundred thousand", 1200000),
+])
+def test_normalize_quantity(value, expected):
+    assert normalize_quantity(value) == expected
+
+
+@pytest.mark.parametrize("value", [0, -2, 2.5, float("nan"), "0", "-3", "12.5", "zero"])
+def test_normalize_quantity_not_valid(value):
+    assert normalize_quantity(value) == "Quantity not valid"
+
+
+@pytest.mark.parametrize("value", [None, True, "", "a dozen", "lots", "1,5", "one two", "ten one", "hundred hundred",
+                                   "100 5", "1000 5", "thousand thousand", "one thousand two thousand"])
+def test_normalize_quantity_unrecognised(value):
+    assert normalize_quantity(value) is None
@@ -0,0 +1,68 @@
+import pytest
+
+import reference_cache as reference_cache_module
+from reference_cache import ReferenceCache, MISS
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(reference_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = ReferenceCache(ttl=300, negative_ttl=60)
+    cache.set("t1", "customer", "C1", {"_id": 1})
+    clock[0] += 299
+    assert cache.get("t1", "customer", "C1") == {"_id": 1}
+    clock[0] += 2
+    assert cache.get("t1", "customer", "C1") is MISS
+    assert cache.stats()["entries"] == 0
+
+
+def test_not_found_uses_negative_ttl(clock):
+    cache = ReferenceCache(ttl=300, negative_ttl=60)
+    cache.set("t1", "customer", "NOPE", None)
+    clock[0] += 59
+    assert cache.get("t1", "customer", "NOPE") is None
+    clock[0] += 2
+    assert cache.get("t1", "customer", "NOPE") is MISS
+    assert cache.stats()["kinds"]["customer"] == {"hits": 0, "negative_hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_get_or_load_reloads_after_expiry(clock):
+    cache = ReferenceCache(ttl=10, negative_ttl=5)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return None if len(loads) == 1 else {"_id": len(loads)}
+
+    assert cache.get_or_load("t1", "warehouse", "W1", loader) is None
+    clock[0] += 4
+    assert cache.get_or_load("t1", "warehouse", "W1", loader) is None
+    clock[0] += 2
+    assert cache.get_or_load("t1", "warehouse", "W1", loader) == {"_id": 2}
+    clock[0] += 9
+    assert cache.get_or_load("t1", "warehouse", "W1", loader) == {"_id": 2}
+    assert len(loads) == 2
+
+
+def test_entries_are_per_tenant(clock):
+    cache = ReferenceCache()
+    cache.set("t1", "customer", "C1", {"_id": 1})
+    assert cache.get("t2", "customer", "C1") is MISS
+    assert cache.invalidate(tenant_id="t1") == 1
+    assert cache.get("t1", "customer", "C1") is MISS
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = ReferenceCache(max_entries=2)
+    cache.set("t1", "customer", "C1", 1)
+    cache.set("t1", "customer", "C2", 2)
+    cache.get("t1", "customer", "C1")
+    cache.set("t1", "customer", "C3", 3)
+    assert cache.get("t1", "customer", "C2") is MISS
+    assert cache.get("t1", "customer", "C1") == 1
+    assert cache.stats()["kinds"]["customer"]["evictions"] == 1